@@ -0,0 +1,200 @@
+import ujson
+
+
+class Config:
+    """
+    the settings from /config.json with their defaults
+
+    Updates replace this module, so new settings come with their defaults. Local overrides go into app/config.py,
+    which boot.py keeps.
+    """
+    data = {}
+    required_values = ['CLIENT_UID', 'WEBSOCKET_HOSTNAME', 'WEBSOCKET_PASSWORD', 'WIFI_NETWORK', 'WIFI_PASSWORD']
+
+    def __init__(self):
+        with open('/config.json') as config_file:
+            self.data = ujson.load(config_file)
+        missing_values = [value for value in self.required_values if value not in self.data]
+        if len(missing_values):
+            raise Exception('missing values: %s' % ', '.join(missing_values))
+
+    @property
+    def CLIENT_UID(self):
+        return self.data.get('CLIENT_UID')
+
+    @property
+    def WEBSOCKET_HOSTNAME(self):
+        return self.data.get('WEBSOCKET_HOSTNAME')
+
+    @property
+    def WEBSOCKET_PORT(self):
+        return self.data.get('WEBSOCKET_PORT') or 443
+
+    @property
+    def WEBSOCKET_PATH(self):
+        return self.data.get('WEBSOCKET_PATH') or '/connect/%s' % self.CLIENT_UID
+
+    @property
+    def WEBSOCKET_TLS(self):
+        return self.data['WEBSOCKET_TLS'] if self.data.get('WEBSOCKET_TLS') is not None else True
+
+    @property
+    def WEBSOCKET_MAX_MESSAGE_SIZE(self):
+        return self.data.get('WEBSOCKET_MAX_MESSAGE_SIZE') or 8192
+
+    @property
+    def WEBSOCKET_REQUEST_TIMEOUT(self):
+        return self.data.get('WEBSOCKET_REQUEST_TIMEOUT') or 5000
+
+    @property
+    def WEBSOCKET_REQUEST_RETRIES(self):
+        return self.data.get('WEBSOCKET_REQUEST_RETRIES') or 3
+
+    @property
+    def WEBSOCKET_SEND_QUEUE_SIZE(self):
+        return self.data.get('WEBSOCKET_SEND_QUEUE_SIZE') or 32
+
+    @property
+    def WEBSOCKET_BINARY(self):
+        return self.data['WEBSOCKET_BINARY'] if self.data.get('WEBSOCKET_BINARY') is not None else False
+
+    @property
+    def WEBSOCKET_DEFLATE(self):
+        return self.data['WEBSOCKET_DEFLATE'] if self.data.get('WEBSOCKET_DEFLATE') is not None else False
+
+    @property
+    def WEBSOCKET_DEFLATE_WINDOW_BITS(self):
+        return self.data.get('WEBSOCKET_DEFLATE_WINDOW_BITS') or 10
+
+    @property
+    def WEBSOCKET_CONNECT_TIMEOUT(self):
+        return self.data.get('WEBSOCKET_CONNECT_TIMEOUT') or 10
+
+    @property
+    def WEBSOCKET_HANDSHAKE_TIMEOUT(self):
+        return self.data.get('WEBSOCKET_HANDSHAKE_TIMEOUT') or 10
+
+    @property
+    def WEBSOCKET_RECONNECT_MIN_DELAY(self):
+        return self.data.get('WEBSOCKET_RECONNECT_MIN_DELAY') or 1000
+
+    @property
+    def WEBSOCKET_RECONNECT_MAX_DELAY(self):
+        return self.data.get('WEBSOCKET_RECONNECT_MAX_DELAY') or 60000
+
+    @property
+    def WEBSOCKET_DNS_TTL(self):
+        return self.data.get('WEBSOCKET_DNS_TTL') or 3600
+
+    @property
+    def WEBSOCKET_PIN_CERTIFICATE(self):
+        return self.data['WEBSOCKET_PIN_CERTIFICATE'] if self.data.get('WEBSOCKET_PIN_CERTIFICATE') is not None else False
+
+    @property
+    def WEBSOCKET_CERTIFICATE_FINGERPRINT(self):
+        return self.data.get('WEBSOCKET_CERTIFICATE_FINGERPRINT')
+
+    @property
+    def WEBSOCKET_USER(self):
+        return self.data.get('WEBSOCKET_USER') or self.CLIENT_UID
+
+    @property
+    def WEBSOCKET_PASSWORD(self):
+        return self.data.get('WEBSOCKET_PASSWORD')
+
+    @property
+    def WEBSOCKET_PING_INTERVAL(self):
+        return self.data.get('WEBSOCKET_PING_INTERVAL') or 30
+
+    @property
+    def WEBSOCKET_PING_MAX_MISSED(self):
+        return self.data.get('WEBSOCKET_PING_MAX_MISSED') or 3
+
+    @property
+    def WIFI_NETWORK(self):
+        return self.data.get('WIFI_NETWORK')
+
+    @property
+    def WIFI_PASSWORD(self):
+        return self.data.get('WIFI_PASSWORD')
+
+    @property
+    def WIFI_CONNECT_TIMEOUT(self):
+        return self.data.get('WIFI_CONNECT_TIMEOUT') or 15
+
+    @property
+    def WIFI_CACHED_CONNECT_TIMEOUT(self):
+        return self.data.get('WIFI_CACHED_CONNECT_TIMEOUT') or 5
+
+    @property
+    def WIFI_STATIC_IP(self):
+        """
+        optional [ip, subnet, gateway, dns], dhcp is used if it is not set
+        """
+        return self.data.get('WIFI_STATIC_IP')
+
+    @property
+    def RESOURCE_UID(self):
+        return self.data.get('RESOURCE_UID') or self.CLIENT_UID
+
+    @property
+    def RESOURCES(self):
+        """
+        list of the locks with uid, open_pin, close_pin and optional pulse (ms) and door_pin, the default is one lock
+        configured by the single pin values
+        """
+        return self.data.get('RESOURCES') or [{
+            'uid': self.RESOURCE_UID,
+            'open_pin': self.LOCK_OPEN_PIN,
+            'close_pin': self.LOCK_CLOSE_PIN,
+            'door_pin': self.DOOR_STATUS_PIN
+        }]
+
+    @property
+    def LOCK_OPEN_PIN(self):
+        return self.data.get('LOCK_OPEN_PIN') or 26
+
+    @property
+    def LOCK_CLOSE_PIN(self):
+        return self.data.get('LOCK_CLOSE_PIN') or 27
+
+    @property
+    def DOOR_STATUS_PIN(self):
+        return self.data.get('DOOR_STATUS_PIN') or 33
+
+    @property
+    def DOOR_STATUS_DEBOUNCE(self):
+        return self.data.get('DOOR_STATUS_DEBOUNCE') or 500
+
+    @property
+    def POWER_STATUS_PIN(self):
+        return self.data.get('POWER_STATUS_PIN') or 34
+
+    @property
+    def POWER_STATUS_DEBOUNCE(self):
+        return self.data.get('POWER_STATUS_DEBOUNCE') or 500
+
+    @property
+    def JOURNAL_SLOTS(self):
+        return self.data.get('JOURNAL_SLOTS') or 32
+
+    @property
+    def JOURNAL_RECORD_SIZE(self):
+        return self.data.get('JOURNAL_RECORD_SIZE') or 256
+
+    @property
+    def REPLY_CACHE_SIZE(self):
+        return self.data.get('REPLY_CACHE_SIZE') or 16
+
+    @property
+    def ASYNCIO(self):
+        return self.data['ASYNCIO'] if self.data.get('ASYNCIO') is not None else False
+
+    @property
+    def TELEMETRY_INTERVAL(self):
+        return self.data['TELEMETRY_INTERVAL'] if self.data.get('TELEMETRY_INTERVAL') is not None else 300
+
+    @property
+    def DEBUG(self):
+        return self.data['DEBUG'] if self.data.get('DEBUG') is not None else False
+
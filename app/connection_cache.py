@@ -0,0 +1,66 @@
+import ujson
+import utime
+
+
+class ConnectionCache:
+    """
+    small json file in flash which keeps the resolved websocket address, the pinned certificate fingerprint and the
+    last wifi access point across resets
+    """
+    path = '/connection_cache.json'
+
+    def __init__(self):
+        self.data = {}
+        try:
+            with open(self.path) as cache_file:
+                self.data = ujson.load(cache_file)
+        except (OSError, ValueError):
+            pass
+
+    def save(self):
+        with open(self.path, 'w') as cache_file:
+            ujson.dump(self.data, cache_file)
+
+    def get_address(self, hostname, port, ttl):
+        entry = self.data.get('address')
+        if not entry or entry[0] != hostname or entry[1] != port:
+            return None
+        age = utime.time() - entry[4]
+        # the rtc may have been reset since the address was resolved
+        if age < 0 or age > ttl:
+            return None
+        return entry[2], entry[3]
+
+    def set_address(self, hostname, port, ip, ip_port):
+        self.data['address'] = [hostname, port, ip, ip_port, utime.time()]
+        self.save()
+
+    def invalidate_address(self):
+        if 'address' in self.data:
+            del self.data['address']
+            self.save()
+
+    def get_fingerprint(self, hostname):
+        entry = self.data.get('fingerprint')
+        if not entry or entry[0] != hostname:
+            return None
+        return entry[1]
+
+    def set_fingerprint(self, hostname, fingerprint):
+        self.data['fingerprint'] = [hostname, fingerprint]
+        self.save()
+
+    def get_access_point(self, ssid):
+        entry = self.data.get('access_point')
+        if not entry or entry[0] != ssid:
+            return None
+        return entry[1], entry[2]
+
+    def set_access_point(self, ssid, bssid, channel):
+        self.data['access_point'] = [ssid, bssid, channel]
+        self.save()
+
+    def invalidate_access_point(self):
+        if 'access_point' in self.data:
+            del self.data['access_point']
+            self.save()
@@ -1,31 +1,66 @@
 import uos
-from machine import Pin, Timer
-from app.extensions import config, wifi
+import utime
+from app.hal import Pin, Timer
+from app.extensions import config, wifi, startup
+from app.inputs import InputEngine
 from app.websocket import websocket_send
 
 
-class Device:
-    door_status = False
-    lock_status = 'closed'
-    door_status_detection = False
+class Resource:
+    """
+    state record of one lock
+    """
+    def __init__(self, uid, lock_open_pin, lock_close_pin, pulse):
+        self.uid = uid
+        self.lock_open_pin = lock_open_pin
+        self.lock_close_pin = lock_close_pin
+        self.pulse = pulse
+        self.lock_status = 'closed'
+        # ticks_ms when the running lock pulse ends
+        self.deadline = None
+
 
+class Device:
     def __init__(self):
-        self.door_status_timer = Timer(1)
-        self.door_status_pin = Pin(config.DOOR_STATUS_PIN, Pin.IN)
-        self.door_status_pin.irq(self.trigger_door_status)
-        self.lock_open_pin = Pin(config.LOCK_OPEN_PIN, Pin.OUT)
-        self.lock_close_pin = Pin(config.LOCK_CLOSE_PIN, Pin.OUT)
+        self.inputs = InputEngine(Timer(1))
+        # one timer for the lock pulses of all resources, it fires at the next deadline
         self.door_lock_timer = Timer(2)
+        self.resources = {}
+        self.default_resource = None
+        for resource_config in config.RESOURCES:
+            resource = Resource(
+                resource_config['uid'],
+                Pin(resource_config['open_pin'], Pin.OUT),
+                Pin(resource_config['close_pin'], Pin.OUT),
+                resource_config.get('pulse') or 250
+            )
+            self.resources[resource.uid] = resource
+            if self.default_resource is None:
+                self.default_resource = resource
+            if resource_config.get('door_pin') is not None:
+                self.inputs.add(
+                    resource.uid,
+                    Pin(resource_config['door_pin'], Pin.IN),
+                    config.DOOR_STATUS_DEBOUNCE,
+                    self.door_changed
+                )
+        self.inputs.add('power', Pin(config.POWER_STATUS_PIN, Pin.IN), config.POWER_STATUS_DEBOUNCE, self.power_changed)
 
-    def trigger_door_status(self, pin):
-        if not self.door_status_detection:
-            self.door_status_timer.init(mode=Timer.ONE_SHOT, period=500, callback=self.finalize_door_status)
+    def get_resource(self, resource_uid=None):
+        if resource_uid is None:
+            return self.default_resource
+        return self.resources.get(resource_uid)
+
+    def door_changed(self, resource_uid, value, changed_at):
+        # changed_at is the ticks_ms of the debounced edge, the server can order and time the edges of one boot by it
+        websocket_send('DoorStatus', 'request', {
+            'status': value == 1,
+            'resource_uid': resource_uid,
+            'changed_at': changed_at
+        })
 
-    def finalize_door_status(self, timer):
-        self.door_status = self.door_status_pin.value() == 1
-        self.door_status_timer.deinit()
-        self.door_status_detection = False
-        websocket_send('DoorStatus', 'request', {'status': self.door_status})
+    def power_changed(self, name, value, changed_at):
+        websocket_send('PowerStatus', 'request', {'status': value == 1, 'changed_at': changed_at})
 
     def boot(self):
         system = uos.uname()
@@ -39,39 +74,71 @@ class Device:
             'ip': wifi_ifconfig[0],
             'subnet': wifi_ifconfig[1],
             'gateway': wifi_ifconfig[2],
-            'dns': wifi_ifconfig[3]
+            'dns': wifi_ifconfig[3],
+            'resources': [resource_uid for resource_uid in self.resources],
+            'startup': startup.report()
         })
 
     def check_door_lock(self):
-        if self.door_status != self.door_status_pin.value():
-            self.door_status = not self.door_status
-            websocket_send('DoorStatus', 'request', {'status': self.door_status})
+        # samples the inputs in case an interrupt was missed, changes are reported by door_changed()
+        self.inputs.trigger()
 
-    def open_lock(self):
-        if self.lock_status in ['opening', 'closing']:
+    def open_lock(self, resource=None):
+        resource = resource or self.default_resource
+        if resource.lock_status in ['opening', 'closing']:
             return
-        self.lock_status = 'opening'
-        self.lock_open_pin.value(1)
-        self.door_lock_timer.init(mode=Timer.ONE_SHOT, period=250, callback=self.finalize_lock)
-        websocket_send('ResourceStatusChange', 'request', {'status': 'opening', 'resource_uid': config.RESOURCE_UID})
+        resource.lock_status = 'opening'
+        resource.lock_open_pin.value(1)
+        self.start_pulse(resource)
+        websocket_send('ResourceStatusChange', 'request', {'status': 'opening', 'resource_uid': resource.uid})
 
-    def close_lock(self):
-        if self.lock_status in ['opening', 'closing']:
+    def close_lock(self, resource=None):
+        resource = resource or self.default_resource
+        if resource.lock_status in ['opening', 'closing']:
             return
-        self.lock_status = 'closing'
-        self.lock_close_pin.value(1)
-        self.door_lock_timer.init(mode=Timer.ONE_SHOT, period=250, callback=self.finalize_lock)
-        websocket_send('ResourceStatusChange', 'request', {'status': 'closing', 'resource_uid': config.RESOURCE_UID})
+        resource.lock_status = 'closing'
+        resource.lock_close_pin.value(1)
+        self.start_pulse(resource)
+        websocket_send('ResourceStatusChange', 'request', {'status': 'closing', 'resource_uid': resource.uid})
+
+    def start_pulse(self, resource):
+        resource.deadline = utime.ticks_add(utime.ticks_ms(), resource.pulse)
+        self.schedule_lock_timer()
+
+    def schedule_lock_timer(self):
+        now = utime.ticks_ms()
+        next_deadline = None
+        for resource in self.resources.values():
+            if resource.deadline is None:
+                continue
+            if next_deadline is None or utime.ticks_diff(resource.deadline, next_deadline) < 0:
+                next_deadline = resource.deadline
+        if next_deadline is None:
+            self.door_lock_timer.deinit()
+            return
+        self.door_lock_timer.init(
+            mode=Timer.ONE_SHOT,
+            period=max(1, utime.ticks_diff(next_deadline, now)),
+            callback=self.finalize_locks
+        )
+
+    def finalize_locks(self, timer):
+        now = utime.ticks_ms()
+        for resource in self.resources.values():
+            if resource.deadline is not None and utime.ticks_diff(resource.deadline, now) <= 0:
+                self.finalize_lock(resource)
+        self.schedule_lock_timer()
 
-    def finalize_lock(self, pin):
-        self.lock_open_pin.value(0)
-        self.lock_close_pin.value(0)
-        if self.lock_status == 'opening':
-            self.lock_status = 'open'
-        elif self.lock_status == 'closing':
-            self.lock_status = 'closed'
+    def finalize_lock(self, resource):
+        resource.deadline = None
+        resource.lock_open_pin.value(0)
+        resource.lock_close_pin.value(0)
+        if resource.lock_status == 'opening':
+            resource.lock_status = 'open'
+        elif resource.lock_status == 'closing':
+            resource.lock_status = 'closed'
         websocket_send(
             'ResourceStatusChange',
             'request',
-            {'status': self.lock_status, 'resource_uid': config.RESOURCE_UID}
+            {'status': resource.lock_status, 'resource_uid': resource.uid}
         )
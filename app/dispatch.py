@@ -0,0 +1,32 @@
+class HandlerRegistry:
+    """
+    maps (message type, state) to the handler functions, which are registered with the register() decorator and
+    called as handler(uid, data)
+    """
+    def __init__(self):
+        # state -> message type -> handler, nested so a lookup doesn't allocate a key tuple
+        self.handlers = {}
+
+    def register(self, message_type, state='request'):
+        def decorator(handler):
+            if state not in self.handlers:
+                self.handlers[state] = {}
+            self.handlers[state][message_type] = handler
+            return handler
+        return decorator
+
+    def get(self, message_type, state):
+        handlers = self.handlers.get(state)
+        if handlers is None:
+            return None
+        return handlers.get(message_type)
+
+    def dispatch(self, message_type, state, uid, data):
+        """
+        calls the handler and returns False if there is none
+        """
+        handler = self.get(message_type, state)
+        if handler is None:
+            return False
+        handler(uid, data)
+        return True
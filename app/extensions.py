@@ -1,14 +1,67 @@
-from .config import Config
-config = Config()
+from app.startup import Startup
+startup = Startup()
 
-websocket_send_queue = []
+from app.config_defaults import Config
+try:
+    from app import config as local_config
+    # a config.py of an install before the defaults were split off carries the settings of its version only
+    if issubclass(local_config.Config, Config):
+        Config = local_config.Config
+except (ImportError, AttributeError):
+    pass
+config = startup.stage('config', Config)
+
+from app.send_queue import SendQueue
+websocket_send_queue = SendQueue(config.WEBSOCKET_SEND_QUEUE_SIZE)
 websocket_receive_queue = []
+websocket_send_event = None
+if config.ASYNCIO:
+    try:
+        import uasyncio as asyncio
+    except ImportError:
+        import asyncio
+    websocket_send_event = asyncio.Event()
 
-from app.networking import wifi_connect
-wifi = wifi_connect()
+from app.journal import Journal
+journal = Journal('/journal.bin', config.JOURNAL_SLOTS, config.JOURNAL_RECORD_SIZE)
 
-from app.websocket_client import WebsocketClient
-websocket = WebsocketClient()
+from app.pending_requests import PendingRequests
+pending_requests = PendingRequests(config.WEBSOCKET_REQUEST_TIMEOUT, config.WEBSOCKET_REQUEST_RETRIES)
+
+from app.reply_cache import ReplyCache
+reply_cache = ReplyCache(config.REPLY_CACHE_SIZE)
+
+from app.metrics import Metrics, Telemetry
+metrics = Metrics()
+telemetry = Telemetry(metrics, config.TELEMETRY_INTERVAL * 1000)
+
+# the wifi association runs in the background while the gpio and the remaining modules are initialized
+from app.connection_cache import ConnectionCache
+connection_cache = ConnectionCache()
+
+from app.networking import WifiManager
+wifi = startup.stage('wifi_start', WifiManager(connection_cache).start)
 
 from app.device import Device
-device = Device()
+device = startup.stage('device', Device)
+
+from app.websocket_client import WebsocketClient
+websocket = startup.stage('websocket_init', WebsocketClient)
+
+import gc
+if hasattr(gc, 'mem_free'):
+    metrics.gauge('mem_free', gc.mem_free)
+    metrics.gauge('mem_alloc', gc.mem_alloc)
+metrics.gauge('send_queue', websocket_send_queue.stats)
+metrics.gauge('journal', journal.stats)
+metrics.gauge('pending_requests', lambda: len(pending_requests))
+metrics.gauge('reply_cache', reply_cache.stats)
+metrics.gauge('reconnects', lambda: websocket.reconnects)
+metrics.gauge('wifi', wifi.stats)
+metrics.gauge('deflate', lambda: websocket.deflate.stats() if websocket.deflate else None)
+
+startup.stage('wifi', wifi.wait)
+
+startup.stage('websocket', websocket.start)
+startup.add('socket', sum(websocket.timings.get(phase, 0) for phase in ('resolve', 'connect', 'tls')) * 1000)
+startup.add('handshake', websocket.timings.get('handshake', 0) * 1000)
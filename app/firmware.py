@@ -0,0 +1,143 @@
+"""
+Firmware delivery over the websocket. The server pushes the files, which are written to /next.tmp. Only once all of
+them are verified, the directory is renamed to /next and installed by boot.py on the next reset, so a reset during
+the transfer never installs a partial firmware.
+
+The server starts a transfer with a FirmwareUpdate request with the version and the files as list of path, size and
+sha256 (hex). The reply tells it where to start, the chunk size and how many chunks may be unacknowledged. The chunks
+are sent as OP_BYTES frames, also if the connection uses json:
+
+    CHUNK_MARKER (u8) | file index (u8) | offset (u32) | data
+
+Every chunk is written to flash right away and acknowledged with a FirmwareProgress request with the file and offset
+to continue at. After a reconnect the server sends the FirmwareUpdate request again and resumes at the offset of the
+reply, as long as the device wasn't reset in between.
+"""
+import uos
+import uhashlib
+import ustruct as struct
+from ubinascii import hexlify
+
+# not used as type code by the binary message encoding
+CHUNK_MARKER = const(0xff)
+CHUNK_HEADER_SIZE = const(6)
+
+
+def remove_directory(path):
+    """
+    removes a flat directory with its files if it exists
+    """
+    try:
+        names = uos.listdir(path)
+    except OSError:
+        return
+    for name in names:
+        uos.remove('%s/%s' % (path, name))
+    uos.rmdir(path)
+
+
+class FirmwareReceiver:
+    version = None
+    files = None
+    # file index and offset of the next expected chunk
+    index = 0
+    offset = 0
+    file = None
+    hash = None
+
+    def __init__(self, directory='/next', chunk_size=1024, window=4):
+        self.directory = directory
+        self.staging = directory + '.tmp'
+        # a chunk frame has to fit into the input buffer of the websocket
+        self.chunk_size = chunk_size
+        self.window = window
+
+    def start(self, data):
+        """
+        starts the transfer of a FirmwareUpdate request, or resumes it if it's the running one, and returns the reply
+        """
+        if data['version'] != self.version:
+            self.abort()
+            for entry in data['files']:
+                # boot.py installs the files of a flat /next directory only
+                if '/' in entry['path'] or entry['path'] in ('', '.', '..'):
+                    return {'error': 'invalid path %s' % entry['path']}
+            uos.mkdir(self.staging)
+            self.version = data['version']
+            self.files = data['files']
+            self.index = 0
+            error = self.open_file()
+            if error is not None:
+                return {'error': error}
+        reply = self.progress()
+        reply['chunk_size'] = self.chunk_size
+        reply['window'] = self.window
+        return reply
+
+    def open_file(self):
+        self.offset = 0
+        self.hash = uhashlib.sha256()
+        self.file = open('%s/%s' % (self.staging, self.files[self.index]['path']), 'wb')
+        if not self.files[self.index]['size']:
+            return self.close_file()
+
+    def close_file(self):
+        """
+        verifies the completed file and opens the next one or installs the firmware, returns an error message if the
+        checksum doesn't match
+        """
+        self.file.close()
+        self.file = None
+        entry = self.files[self.index]
+        if hexlify(self.hash.digest()).decode() != entry['sha256']:
+            self.abort()
+            return 'checksum mismatch in %s' % entry['path']
+        self.index += 1
+        self.offset = 0
+        if self.index < len(self.files):
+            return self.open_file()
+        # a complete firmware which wasn't installed yet is replaced
+        remove_directory(self.directory)
+        uos.rename(self.staging, self.directory)
+
+    def write_chunk(self, chunk):
+        """
+        writes a chunk frame and returns the FirmwareProgress data to acknowledge it, or None without a transfer
+        """
+        if self.file is None:
+            return None
+        version = self.version
+        index, offset = struct.unpack_from('!BI', chunk, 1)
+        if index != self.index or offset != self.offset:
+            # duplicate, or sent before the server knew where to resume
+            return self.progress()
+        data = memoryview(chunk)[CHUNK_HEADER_SIZE:]
+        entry = self.files[index]
+        if offset + len(data) > entry['size']:
+            self.abort()
+            return {'version': version, 'error': 'chunk exceeds the size of %s' % entry['path']}
+        self.file.write(data)
+        self.hash.update(data)
+        self.offset += len(data)
+        if self.offset == entry['size']:
+            error = self.close_file()
+            if error is not None:
+                return {'version': version, 'error': error}
+        return self.progress()
+
+    def progress(self):
+        return {
+            'version': self.version,
+            'file': self.index,
+            'offset': self.offset,
+            'done': self.files is not None and self.index == len(self.files)
+        }
+
+    def abort(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        # also the remains of a transfer before the last reset
+        remove_directory(self.staging)
+        self.version = None
+        self.files = None
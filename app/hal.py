@@ -0,0 +1,12 @@
+"""
+hardware abstraction: the board modules on micropython, the simulated ones from sim.hardware on cpython
+
+The micropython standard modules (usocket, uselect, ussl, utime, ...) are not wrapped here, on cpython they are
+provided by sim/shims, see sim/simulate.py.
+"""
+try:
+    import network
+    from machine import Pin, Timer, reset
+except ImportError:
+    from sim import hardware as network
+    from sim.hardware import Pin, Timer, reset
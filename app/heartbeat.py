@@ -0,0 +1,85 @@
+import utime
+import ustruct as struct
+
+
+class Heartbeat:
+    """
+    client initiated pings: measures the round trip time and detects dead links, e.g. a dropped NAT mapping, after
+    max_missed unanswered pings
+    """
+    def __init__(self, interval, max_missed, sample_count=32):
+        self.interval = interval
+        self.max_missed = max_missed
+        self.sequence = 0
+        # (sequence, ticks_ms) of the pings which are not answered yet
+        self.outstanding = []
+        self.last_ping = utime.ticks_ms()
+        self.pings = 0
+        self.pongs = 0
+        self.dead_links = 0
+        self.rtt_average = None
+        # ring of the last round trip times for the percentiles
+        self.samples = [0] * sample_count
+        self.samples_used = 0
+        self.samples_position = 0
+
+    def reset(self):
+        self.outstanding = []
+        self.last_ping = utime.ticks_ms()
+
+    def tick(self, websocket):
+        """
+        sends a ping if it's due, returns False if the link is dead
+        """
+        now = utime.ticks_ms()
+        if utime.ticks_diff(now, self.last_ping) < self.interval:
+            return True
+        if len(self.outstanding) >= self.max_missed:
+            self.dead_links += 1
+            return False
+        self.sequence = (self.sequence + 1) & 0xffffffff
+        self.outstanding.append((self.sequence, now))
+        self.last_ping = now
+        self.pings += 1
+        websocket.ping(struct.pack('!I', self.sequence))
+        return True
+
+    def pong_received(self, data):
+        if len(data) != 4:
+            return
+        sequence, = struct.unpack('!I', data)
+        for i in range(len(self.outstanding)):
+            if self.outstanding[i][0] == sequence:
+                self.add_sample(utime.ticks_diff(utime.ticks_ms(), self.outstanding[i][1]))
+                # older pings may be lost, but the link is alive
+                del self.outstanding[:i + 1]
+                self.pongs += 1
+                return
+
+    def add_sample(self, rtt):
+        if self.rtt_average is None:
+            self.rtt_average = rtt
+        else:
+            # exponentially weighted moving average with alpha 1/8 like the tcp srtt
+            self.rtt_average += (rtt - self.rtt_average) / 8
+        self.samples[self.samples_position] = rtt
+        self.samples_position = (self.samples_position + 1) % len(self.samples)
+        self.samples_used = min(self.samples_used + 1, len(self.samples))
+
+    def percentile(self, percent):
+        if not self.samples_used:
+            return None
+        samples = sorted(self.samples[:self.samples_used])
+        return samples[(self.samples_used - 1) * percent // 100]
+
+    def stats(self):
+        return {
+            'rtt_average': self.rtt_average,
+            'rtt_p50': self.percentile(50),
+            'rtt_p90': self.percentile(90),
+            'rtt_p99': self.percentile(99),
+            'pings': self.pings,
+            'pongs': self.pongs,
+            'outstanding': len(self.outstanding),
+            'dead_links': self.dead_links
+        }
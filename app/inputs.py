@@ -0,0 +1,67 @@
+import utime
+
+
+class DebouncedInput:
+    def __init__(self, name, pin, window, callback, now):
+        self.name = name
+        self.pin = pin
+        self.window = window
+        self.callback = callback
+        self.state = pin.value()
+        # the last raw value and when it was first seen
+        self.candidate = self.state
+        self.changed_at = now
+
+
+class InputEngine:
+    """
+    debounces any number of input pins with one shared timer. A pin interrupt starts periodic sampling, an input
+    changes its state after its raw value was stable for its window, and the timer stops again when all inputs are
+    settled. Only real changes of the stable state call callback(name, value, changed_at) with the ticks_ms of the
+    edge.
+
+    pin and timer only need the value()/irq() and init()/deinit() methods of machine.Pin and machine.Timer, so they
+    can be replaced by fakes to replay bouncing signals.
+    """
+    def __init__(self, timer, period=10, clock=utime.ticks_ms):
+        self.timer = timer
+        self.period = period
+        self.clock = clock
+        self.inputs = []
+        self.running = False
+
+    def add(self, name, pin, window, callback):
+        debounced_input = DebouncedInput(name, pin, window, callback, self.clock())
+        self.inputs.append(debounced_input)
+        pin.irq(self.trigger)
+        return debounced_input
+
+    def trigger(self, pin=None):
+        if self.running:
+            return
+        self.running = True
+        self.timer.init(mode=self.timer.PERIODIC, period=self.period, callback=self.sample)
+
+    def sample(self, timer=None):
+        now = self.clock()
+        settled = True
+        for debounced_input in self.inputs:
+            value = debounced_input.pin.value()
+            if value != debounced_input.candidate:
+                debounced_input.candidate = value
+                debounced_input.changed_at = now
+            if value == debounced_input.state:
+                continue
+            if utime.ticks_diff(now, debounced_input.changed_at) < debounced_input.window:
+                settled = False
+                continue
+            debounced_input.state = value
+            debounced_input.callback(debounced_input.name, value, debounced_input.changed_at)
+        if settled:
+            self.timer.deinit()
+            self.running = False
+
+    def value(self, name):
+        for debounced_input in self.inputs:
+            if debounced_input.name == name:
+                return debounced_input.state
@@ -0,0 +1,196 @@
+import uos
+import ustruct as struct
+from ubinascii import crc32
+from app.message_codec import encode_binary, decode_binary
+
+# first slot of a message, its length is the one of the whole payload
+RECORD_MAGIC = const(0xa5)
+# further slots of a message which didn't fit into one
+CONTINUATION_MAGIC = const(0xa6)
+HEADER_MAGIC = const(0x5a)
+# magic, payload length, sequence number, crc32 of the payload part in the slot
+RECORD_HEADER = '!BHII'
+RECORD_HEADER_SIZE = const(11)
+# magic, sequence number of the oldest pending record, crc32 of the sequence number
+FILE_HEADER = '!BII'
+FILE_HEADER_SIZE = const(16)
+
+
+class Journal:
+    """
+    append-only ring of fixed size records in flash which keeps the outgoing messages while the websocket is down.
+
+    Every record is written exactly once into its slot (sequence number modulo slot count), so the slots wear
+    evenly and the file never grows. A message larger than a slot continues in the following slots, each slot has
+    its own header and crc. A record which was cut off by a power loss fails its crc and is skipped.
+    The only rewritten data is the small file header with the oldest pending sequence number, which is written once
+    per replayed batch. Replayed messages keep their uid, so the server can drop duplicates.
+    """
+    def __init__(self, path, slots, record_size):
+        self.path = path
+        self.slots = slots
+        self.record_size = record_size
+        # payload bytes per slot
+        self.capacity = record_size - RECORD_HEADER_SIZE
+        self.buf = bytearray(record_size)
+        self.head = 0
+        self.tail = 0
+        self.dropped = 0
+        self.file = self.open()
+        self.scan()
+
+    def __len__(self):
+        return self.head - self.tail
+
+    def open(self):
+        size = FILE_HEADER_SIZE + self.slots * self.record_size
+        try:
+            if uos.stat(self.path)[6] == size:
+                return open(self.path, 'r+b')
+        except OSError:
+            pass
+        # create the file with its final size, so later writes don't allocate flash blocks
+        with open(self.path, 'wb') as journal_file:
+            journal_file.write(bytes(FILE_HEADER_SIZE))
+            for _ in range(self.slots):
+                journal_file.write(self.buf)
+        return open(self.path, 'r+b')
+
+    def scan(self):
+        """
+        restores head and tail from the file after a reset
+        """
+        self.file.seek(0)
+        header = self.file.read(FILE_HEADER_SIZE)
+        magic, tail, checksum = struct.unpack_from(FILE_HEADER, header)
+        if magic == HEADER_MAGIC and checksum == crc32(header[1:5]):
+            self.tail = tail
+        head = self.tail
+        for slot in range(self.slots):
+            sequence = self.read_record(slot)
+            if sequence is not None and sequence >= head:
+                head = sequence + 1
+        self.head = head
+        self.tail = max(self.tail, self.head - self.slots)
+
+    def read_record(self, slot, sequence=None):
+        """
+        reads the record in slot into buf and returns its sequence number, or None if it's invalid
+        """
+        self.file.seek(FILE_HEADER_SIZE + slot * self.record_size)
+        self.file.readinto(self.buf)
+        magic, length, record_sequence, checksum = struct.unpack_from(RECORD_HEADER, self.buf)
+        if magic == RECORD_MAGIC:
+            length = min(length, self.capacity)
+        elif magic != CONTINUATION_MAGIC or length > self.capacity:
+            return None
+        if sequence is not None and record_sequence != sequence:
+            return None
+        if crc32(memoryview(self.buf)[RECORD_HEADER_SIZE:RECORD_HEADER_SIZE + length]) != checksum:
+            return None
+        return record_sequence
+
+    def append(self, message, flush=True):
+        payload = encode_binary(message)
+        length = len(payload)
+        count = max(1, (length + self.capacity - 1) // self.capacity)
+        if count > self.slots:
+            self.dropped += 1
+            return
+        payload = memoryview(payload)
+        for index in range(count):
+            part = payload[index * self.capacity:(index + 1) * self.capacity]
+            if index:
+                struct.pack_into(RECORD_HEADER, self.buf, 0, CONTINUATION_MAGIC, len(part), self.head, crc32(part))
+            else:
+                struct.pack_into(RECORD_HEADER, self.buf, 0, RECORD_MAGIC, length, self.head, crc32(part))
+            self.buf[RECORD_HEADER_SIZE:RECORD_HEADER_SIZE + len(part)] = part
+            self.file.seek(FILE_HEADER_SIZE + (self.head % self.slots) * self.record_size)
+            self.file.write(memoryview(self.buf)[:RECORD_HEADER_SIZE + len(part)])
+            self.head += 1
+            if len(self) > self.slots:
+                # the oldest slot was overwritten
+                self.tail = self.head - self.slots
+                self.dropped += 1
+        if flush:
+            self.file.flush()
+
+    def spill(self, send_queue):
+        """
+        moves the normal lane of the send queue into the journal, replies stay in the queue
+        """
+        if not len(send_queue.normal):
+            return
+        while len(send_queue.normal):
+            self.append(send_queue.normal.pop(), False)
+        self.file.flush()
+
+    def read(self, count):
+        """
+        returns up to count of the oldest pending messages as (sequence number of their last slot, message)
+        """
+        messages = []
+        sequence = self.tail
+        while sequence < self.head and len(messages) < count:
+            # continuation slots whose first slot was overwritten are skipped
+            if self.read_record(sequence % self.slots, sequence) is not None and self.buf[0] == RECORD_MAGIC:
+                length = struct.unpack_from('!H', self.buf, 1)[0]
+                slots = (length + self.capacity - 1) // self.capacity
+                payload = self.read_payload(sequence, length)
+                if payload is not None:
+                    messages.append((sequence + slots - 1, decode_binary(payload)))
+                sequence += max(1, slots)
+                continue
+            sequence += 1
+        return messages
+
+    def read_payload(self, sequence, length):
+        """
+        returns the payload of the message whose first slot was read into buf, or None if a slot is missing or torn
+        """
+        if length <= self.capacity:
+            return bytes(self.buf[RECORD_HEADER_SIZE:RECORD_HEADER_SIZE + length])
+        payload = bytearray(length)
+        payload[:self.capacity] = self.buf[RECORD_HEADER_SIZE:]
+        position = self.capacity
+        while position < length:
+            sequence += 1
+            if sequence >= self.head or self.read_record(sequence % self.slots, sequence) is None \
+                    or self.buf[0] != CONTINUATION_MAGIC:
+                return None
+            part = min(self.capacity, length - position)
+            if struct.unpack_from('!H', self.buf, 1)[0] != part:
+                return None
+            payload[position:position + part] = self.buf[RECORD_HEADER_SIZE:RECORD_HEADER_SIZE + part]
+            position += part
+        return payload
+
+    def commit(self, sequence):
+        """
+        marks all records up to sequence as sent
+        """
+        self.tail = sequence + 1
+        header = struct.pack(FILE_HEADER, HEADER_MAGIC, self.tail, 0)
+        struct.pack_into(FILE_HEADER, self.buf, 0, HEADER_MAGIC, self.tail, crc32(header[1:5]))
+        self.file.seek(0)
+        self.file.write(memoryview(self.buf)[:struct.calcsize(FILE_HEADER)])
+        self.file.flush()
+
+    def replay(self, websocket, count=4):
+        """
+        sends up to count pending messages in their original order
+        """
+        messages = self.read(count)
+        if not messages:
+            self.commit(self.head - 1)
+            return
+        for sequence, message in messages:
+            websocket.send_message(message, flush=False)
+        websocket.flush()
+        self.commit(messages[-1][0])
+
+    def stats(self):
+        return {
+            'pending': len(self),
+            'dropped': self.dropped
+        }
@@ -1,28 +1,48 @@
-from app.extensions import config, websocket, websocket_send_queue, device
-from app.websocket_handler import HandleWebsocketMessage
+import utime
+from app.extensions import config, startup, websocket, websocket_send_queue, device, pending_requests, journal, \
+    metrics, telemetry, wifi
+from app.websocket_handler import handle_websocket_messages
 from app.websocket_protocol import NoDataException, ConnectionClosed
-from app.websocket import websocket_send
+from app.websocket import websocket_send, websocket_queue, websocket_drain
 
 
 def main_loop():
+    if config.ASYNCIO:
+        from app.main_async import run
+        return run()
     if config.DEBUG:
         print('loading application ...')
-    device.boot()
+    startup.stage('boot_notification', device.boot)
+    if config.DEBUG:
+        print('startup: %s' % startup.report())
+    loop_time = metrics.histogram('main_loop_us')
+    exceptions = metrics.counter('exceptions')
+
+    # queued messages are kept in flash while the connection is down
+    spill = lambda: journal.spill(websocket_send_queue)
 
     while True:
+        if wifi.link_lost():
+            # the socket would only notice after its timeouts
+            websocket.drop()
         if not websocket.open:
-            websocket.reconnect()
+            wifi.reconnect(spill)
+            websocket.reconnect(spill)
+        started = utime.ticks_us()
         try:
-            if len(websocket_send_queue):
-                websocket.send(websocket_send_queue.pop() + "\r\n")
-            reply = websocket.poll()
-            if reply is not None:
-                HandleWebsocketMessage(reply)
+            websocket.heartbeat_tick()
+            pending_requests.check(websocket_queue)
+            if telemetry.due():
+                websocket_send('Telemetry', 'request', telemetry.report())
+            if len(journal):
+                # newer messages are queued behind the journaled ones to keep the order
+                journal.spill(websocket_send_queue)
+                journal.replay(websocket)
+            websocket_drain(websocket)
+            handle_websocket_messages(websocket.poll())
+            loop_time.since(started)
         except (NoDataException, ConnectionClosed):
             continue
         except Exception as e:
+            exceptions.inc()
             websocket_send('Exception', 'request', {'error': str(e)})
-
-
-
-
@@ -0,0 +1,161 @@
+import utime
+from app.extensions import config, startup, websocket, websocket_send_queue, websocket_send_event, device, \
+    pending_requests, journal, metrics, telemetry, wifi
+from app.websocket_handler import handle_websocket_messages
+from app.websocket_protocol import NoDataException, ConnectionClosed
+from app.websocket import websocket_send, websocket_queue, websocket_requeue, unflushed
+
+# the writer waits for the socket once the output buffer of the websocket is half full
+OUTPUT_FLUSH_SIZE = const(512)
+
+try:
+    import uasyncio as asyncio
+    from uasyncio import core
+
+    async def wait_readable(sock):
+        yield core._io_queue.queue_read(sock)
+
+    async def wait_writable(sock):
+        yield core._io_queue.queue_write(sock)
+except ImportError:
+    import asyncio
+
+    async def wait_readable(sock):
+        loop = asyncio.get_event_loop()
+        readable = loop.create_future()
+        loop.add_reader(sock, lambda: readable.done() or readable.set_result(None))
+        try:
+            await readable
+        finally:
+            loop.remove_reader(sock)
+
+    async def wait_writable(sock):
+        loop = asyncio.get_event_loop()
+        writable = loop.create_future()
+        loop.add_writer(sock, lambda: writable.done() or writable.set_result(None))
+        try:
+            await writable
+        finally:
+            loop.remove_writer(sock)
+
+
+async def flush():
+    """
+    writes the output buffer, waiting for the socket instead of blocking the other tasks while it's full
+    """
+    while not websocket.write_pending():
+        await wait_writable(websocket.sock)
+
+
+async def wifi_reconnect():
+    if wifi.isconnected():
+        return
+    wifi.start()
+    while True:
+        connected = wifi.poll()
+        if connected:
+            return
+        if connected is None:
+            await asyncio.sleep(0.05)
+            continue
+        journal.spill(websocket_send_queue)
+        await asyncio.sleep(wifi.retry() / 1000)
+        wifi.start()
+
+
+async def reconnect():
+    await wifi_reconnect()
+    # the first retry after losing an open connection happens immediately
+    while not websocket.try_connect():
+        # queued messages are kept in flash while the connection is down
+        journal.spill(websocket_send_queue)
+        await asyncio.sleep(websocket.next_delay() / 1000)
+    websocket.reconnected()
+
+
+async def reader():
+    loop_time = metrics.histogram('main_loop_us')
+    exceptions = metrics.counter('exceptions')
+    while True:
+        if not websocket.open:
+            await reconnect()
+        try:
+            await wait_readable(websocket.sock)
+            started = utime.ticks_us()
+            handle_websocket_messages(websocket.read_input())
+            loop_time.since(started)
+        except (NoDataException, ConnectionClosed):
+            continue
+        except Exception as e:
+            exceptions.inc()
+            websocket_send('Exception', 'request', {'error': str(e)})
+
+
+async def writer():
+    exceptions = metrics.counter('exceptions')
+    while True:
+        await websocket_send_event.wait()
+        websocket_send_event.clear()
+        # yield to the other tasks while a journal replay keeps the event set
+        await asyncio.sleep(0)
+        try:
+            if len(journal) and websocket.open:
+                # newer messages are queued behind the journaled ones to keep the order
+                journal.spill(websocket_send_queue)
+                journal.replay(websocket)
+                if len(journal):
+                    websocket_send_event.set()
+            while len(websocket_send_queue) and websocket.open:
+                message = websocket_send_queue.pop()
+                unflushed.append(message)
+                websocket.send_message(message, flush=False)
+                if websocket.output_pending > OUTPUT_FLUSH_SIZE:
+                    # a message which doesn't fit in anymore would make send_message() flush blocking
+                    await flush()
+            await flush()
+            del unflushed[:]
+        except ConnectionClosed:
+            websocket_requeue()
+            continue
+        except NoDataException:
+            continue
+        except Exception as e:
+            exceptions.inc()
+            websocket_send('Exception', 'request', {'error': str(e)})
+
+
+async def heartbeat():
+    while True:
+        await asyncio.sleep(1)
+        if wifi.link_lost():
+            # wakes up the reader, the socket would only notice after its timeouts
+            websocket.drop()
+        pending_requests.check(websocket_queue)
+        if telemetry.due():
+            websocket_send('Telemetry', 'request', telemetry.report())
+        try:
+            websocket.heartbeat_tick()
+        except OSError:
+            pass
+
+
+async def device_monitor():
+    while True:
+        device.check_door_lock()
+        await asyncio.sleep(1)
+
+
+async def main():
+    asyncio.create_task(writer())
+    asyncio.create_task(heartbeat())
+    asyncio.create_task(device_monitor())
+    await reader()
+
+
+def run():
+    if config.DEBUG:
+        print('loading application ...')
+    startup.stage('boot_notification', device.boot)
+    if config.DEBUG:
+        print('startup: %s' % startup.report())
+    asyncio.run(main())
@@ -0,0 +1,354 @@
+"""
+Encodings of the messages, which are tuples (message_type, state, uid, data).
+
+JSON is the default. The compact binary encoding is used if the server accepts the BINARY_PROTOCOL subprotocol in
+the websocket handshake. It's sent as OP_BYTES frames:
+
+    type code (u8) | state code (u8) | uid (16 raw bytes) | data (msgpack)
+
+Type code 0 is followed by the type as msgpack string, the state flag UID_STRING by the uid as msgpack string if
+the uid is not 32 hex characters. The msgpack subset covers nil, bool, int, float32, str, bin, array and map. Type
+code 0xff marks the firmware chunks of app.firmware.
+"""
+import uos
+import ujson as json
+import ustruct as struct
+from ubinascii import hexlify, unhexlify
+
+BINARY_PROTOCOL = 'open-booking.binary.v1'
+
+MESSAGE_TYPES = [
+    None,
+    'BootNotification',
+    'DoorStatus',
+    'ResourceStatusChange',
+    'RemoteChangeResourceStatus',
+    'ConnectionChange',
+    'Exception',
+    'LinkQuality',
+    'Reboot',
+    'FirmwareUpdate',
+    'PowerStatus',
+    'Telemetry',
+    'FirmwareProgress',
+]
+STATES = [None, 'request', 'reply']
+UID_STRING = const(0x80)
+# strings which are known to need no escaping in json
+PLAIN_STRINGS = set(MESSAGE_TYPES[1:] + STATES[1:])
+
+HEX_DIGITS = b'0123456789abcdef'
+# uids are a random prefix per boot followed by a counter, so a new uid needs no random bytes
+uid_buffer = bytearray(hexlify(uos.urandom(8)) + b'0' * 16)
+uid_counter = 0
+
+# micropython strings support the buffer protocol, so they can be copied into a bytearray without encoding them
+try:
+    bytearray(1)[0:1] = 'a'
+    STR_BUFFER = True
+except TypeError:
+    STR_BUFFER = False
+
+# msgpack codes with a fixed size value or length: (struct format, kind)
+FORMATS = {
+    0xc4: ('!B', 'b'),
+    0xc5: ('!H', 'b'),
+    0xca: ('!f', ''),
+    0xcb: ('!d', ''),
+    0xcc: ('!B', ''),
+    0xcd: ('!H', ''),
+    0xce: ('!I', ''),
+    0xcf: ('!Q', ''),
+    0xd0: ('!b', ''),
+    0xd1: ('!h', ''),
+    0xd2: ('!i', ''),
+    0xd3: ('!q', ''),
+    0xd9: ('!B', 's'),
+    0xda: ('!H', 's'),
+    0xdc: ('!H', 'a'),
+    0xde: ('!H', 'm'),
+}
+
+
+def new_uid():
+    """
+    returns a new uid of 32 hex characters, the string is the only allocation
+    """
+    global uid_counter
+    # stays a small int on 32 bit ports
+    uid_counter = (uid_counter + 1) & 0x3fffffff
+    counter = uid_counter
+    for position in range(31, 23, -1):
+        uid_buffer[position] = HEX_DIGITS[counter & 15]
+        counter >>= 4
+    return str(uid_buffer, 'ascii')
+
+
+def encode_json(message):
+    message_type, state, uid, data = message
+    return json.dumps({
+        'state': state,
+        'type': message_type,
+        'uid': uid,
+        'data': data
+    }) + '\r\n'
+
+
+def write_json(buf, position, message):
+    """
+    writes the json encoding of message (same as encode_json()) into the bytearray buf at position and returns the end
+    position. Raises IndexError if it doesn't fit.
+
+    Strings, ints, bools, None, lists and dicts are written without allocating on micropython, only floats and strings
+    which need escaping go through json.dumps().
+    """
+    message_type, state, uid, data = message
+    position = write_raw(buf, position, b'{"state": ')
+    position = write_value(buf, position, state)
+    position = write_raw(buf, position, b', "type": ')
+    position = write_value(buf, position, message_type)
+    position = write_raw(buf, position, b', "uid": ')
+    position = write_value(buf, position, uid)
+    position = write_raw(buf, position, b', "data": ')
+    position = write_value(buf, position, data)
+    return write_raw(buf, position, b'}\r\n')
+
+
+def write_raw(buf, position, chunk):
+    end = position + len(chunk)
+    if end > len(buf):
+        raise IndexError('buffer full')
+    buf[position:end] = chunk
+    return end
+
+
+def write_value(buf, position, value):
+    if value is None:
+        return write_raw(buf, position, b'null')
+    elif value is True:
+        return write_raw(buf, position, b'true')
+    elif value is False:
+        return write_raw(buf, position, b'false')
+    elif isinstance(value, str):
+        return write_str(buf, position, value)
+    elif isinstance(value, int):
+        return write_int(buf, position, value)
+    elif isinstance(value, dict):
+        buf[position] = 0x7b  # {
+        position += 1
+        first = True
+        # iterating the keys doesn't create an item tuple per entry
+        for key in value:
+            if not first:
+                position = write_raw(buf, position, b', ')
+            first = False
+            position = write_str(buf, position, key if isinstance(key, str) else str(key))
+            position = write_raw(buf, position, b': ')
+            position = write_value(buf, position, value[key])
+        return write_raw(buf, position, b'}')
+    elif isinstance(value, (list, tuple)):
+        buf[position] = 0x5b  # [
+        position += 1
+        first = True
+        for item in value:
+            if not first:
+                position = write_raw(buf, position, b', ')
+            first = False
+            position = write_value(buf, position, item)
+        return write_raw(buf, position, b']')
+    return write_raw(buf, position, json.dumps(value).encode())
+
+
+def write_str(buf, position, value):
+    if value not in PLAIN_STRINGS:
+        for char in value:
+            if char < ' ' or char > '~' or char == '"' or char == '\\':
+                return write_raw(buf, position, json.dumps(value).encode())
+    position = write_raw(buf, position, b'"')
+    position = write_raw(buf, position, value if STR_BUFFER else value.encode())
+    return write_raw(buf, position, b'"')
+
+
+def write_int(buf, position, value):
+    if value < 0:
+        position = write_raw(buf, position, b'-')
+        value = -value
+    start = position
+    while True:
+        buf[position] = 0x30 + value % 10
+        value //= 10
+        position += 1
+        if not value:
+            break
+    # the digits were written in reverse order
+    end = position - 1
+    while start < end:
+        buf[start], buf[end] = buf[end], buf[start]
+        start += 1
+        end -= 1
+    return position
+
+
+def decode_json(raw):
+    message = json.loads(raw)
+    return message['type'], message['state'], message['uid'], message['data']
+
+
+def encode_binary(message):
+    message_type, state, uid, data = message
+    buf = bytearray()
+    type_code = MESSAGE_TYPES.index(message_type) if message_type in MESSAGE_TYPES else 0
+    state_code = STATES.index(state)
+    raw_uid = None
+    if len(uid) == 32:
+        try:
+            raw_uid = unhexlify(uid)
+        except ValueError:
+            pass
+    buf.append(type_code)
+    buf.append(state_code if raw_uid is not None else state_code | UID_STRING)
+    if not type_code:
+        pack(buf, message_type)
+    if raw_uid is not None:
+        buf.extend(raw_uid)
+    else:
+        pack(buf, uid)
+    pack(buf, data)
+    return buf
+
+
+def decode_binary(raw):
+    raw = memoryview(raw)
+    type_code = raw[0]
+    state_code = raw[1]
+    position = 2
+    if type_code:
+        message_type = MESSAGE_TYPES[type_code]
+    else:
+        message_type, position = unpack(raw, position)
+    if state_code & UID_STRING:
+        uid, position = unpack(raw, position)
+    else:
+        uid = hexlify(raw[position:position + 16]).decode()
+        position += 16
+    data, position = unpack(raw, position)
+    return message_type, STATES[state_code & 0x7f], uid, data
+
+
+def pack(buf, value):
+    """
+    appends value to buf in msgpack format
+    """
+    if value is None:
+        buf.append(0xc0)
+    elif value is True:
+        buf.append(0xc3)
+    elif value is False:
+        buf.append(0xc2)
+    elif isinstance(value, int):
+        if 0 <= value < 0x80:
+            buf.append(value)
+        elif -32 <= value < 0:
+            buf.append(value & 0xff)
+        elif 0 <= value < 0x10000:
+            buf.extend(struct.pack('!BH', 0xcd, value))
+        elif 0 <= value < 0x100000000:
+            buf.extend(struct.pack('!BI', 0xce, value))
+        elif -0x80000000 <= value < 0:
+            buf.extend(struct.pack('!Bi', 0xd2, value))
+        else:
+            buf.extend(struct.pack('!Bq', 0xd3, value))
+    elif isinstance(value, float):
+        buf.extend(struct.pack('!Bf', 0xca, value))
+    elif isinstance(value, str):
+        encoded = value.encode('utf-8')
+        length = len(encoded)
+        if length < 32:
+            buf.append(0xa0 | length)
+        elif length < 0x100:
+            buf.extend(struct.pack('!BB', 0xd9, length))
+        else:
+            buf.extend(struct.pack('!BH', 0xda, length))
+        buf.extend(encoded)
+    elif isinstance(value, (bytes, bytearray)):
+        if len(value) < 0x100:
+            buf.extend(struct.pack('!BB', 0xc4, len(value)))
+        else:
+            buf.extend(struct.pack('!BH', 0xc5, len(value)))
+        buf.extend(value)
+    elif isinstance(value, (list, tuple)):
+        if len(value) < 16:
+            buf.append(0x90 | len(value))
+        else:
+            buf.extend(struct.pack('!BH', 0xdc, len(value)))
+        for item in value:
+            pack(buf, item)
+    elif isinstance(value, dict):
+        if len(value) < 16:
+            buf.append(0x80 | len(value))
+        else:
+            buf.extend(struct.pack('!BH', 0xde, len(value)))
+        for key, item in value.items():
+            pack(buf, key)
+            pack(buf, item)
+    else:
+        raise TypeError(value)
+
+
+def unpack(raw, position):
+    """
+    returns the msgpack value at position and the position after it
+    """
+    code = raw[position]
+    position += 1
+    if code < 0x80:
+        return code, position
+    if code >= 0xe0:
+        return code - 0x100, position
+    if code & 0xe0 == 0xa0:
+        return unpack_str(raw, position, code & 0x1f)
+    if code & 0xf0 == 0x90:
+        return unpack_array(raw, position, code & 0x0f)
+    if code & 0xf0 == 0x80:
+        return unpack_map(raw, position, code & 0x0f)
+    if code == 0xc0:
+        return None, position
+    if code == 0xc2:
+        return False, position
+    if code == 0xc3:
+        return True, position
+    if code in FORMATS:
+        value_format, kind = FORMATS[code]
+        value, = struct.unpack_from(value_format, raw, position)
+        position += struct.calcsize(value_format)
+        if kind == 's':
+            return unpack_str(raw, position, value)
+        if kind == 'b':
+            return bytes(raw[position:position + value]), position + value
+        if kind == 'a':
+            return unpack_array(raw, position, value)
+        if kind == 'm':
+            return unpack_map(raw, position, value)
+        return value, position
+    raise ValueError('unsupported msgpack code %s' % code)
+
+
+def unpack_str(raw, position, length):
+    return str(raw[position:position + length], 'utf-8'), position + length
+
+
+def unpack_array(raw, position, length):
+    value = []
+    for _ in range(length):
+        item, position = unpack(raw, position)
+        value.append(item)
+    return value, position
+
+
+def unpack_map(raw, position, length):
+    value = {}
+    for _ in range(length):
+        key, position = unpack(raw, position)
+        value[key], position = unpack(raw, position)
+    return value, position
+
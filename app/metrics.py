@@ -0,0 +1,153 @@
+import utime
+
+# upper bounds in us of the buckets of the timing histograms, the last bucket takes everything above
+TIMING_BOUNDS = (100, 300, 1000, 3000, 10000, 30000, 100000)
+
+
+class Counter:
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, count=1):
+        self.value += count
+
+    def report(self):
+        return self.value
+
+
+class LabeledCounter:
+    """
+    counters indexed by a small integer, e.g. the opcode. labels maps the index to the name in the report, indices
+    without a label are not reported.
+    """
+    def __init__(self, labels):
+        self.labels = labels
+        self.values = [0] * len(labels)
+
+    def inc(self, index, count=1):
+        self.values[index] += count
+
+    def report(self):
+        return {label: self.values[index] for index, label in enumerate(self.labels) if label is not None}
+
+
+class Gauge:
+    """
+    current value, either set() or sampled from func when it's reported
+    """
+    def __init__(self, func=None):
+        self.func = func
+        self.value = None
+
+    def set(self, value):
+        self.value = value
+
+    def report(self):
+        if self.func is not None:
+            return self.func()
+        return self.value
+
+
+class Histogram:
+    """
+    counts the observed values in fixed buckets, so it needs the same memory however many values are observed
+    """
+    def __init__(self, bounds=TIMING_BOUNDS):
+        self.bounds = bounds
+        self.buckets = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def observe(self, value):
+        index = 0
+        for bound in self.bounds:
+            if value <= bound:
+                break
+            index += 1
+        self.buckets[index] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def since(self, started):
+        """
+        observes the us since started, which is a utime.ticks_us() value
+        """
+        self.observe(utime.ticks_diff(utime.ticks_us(), started))
+
+    def reset(self):
+        for index in range(len(self.buckets)):
+            self.buckets[index] = 0
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def report(self):
+        return {
+            'bounds': self.bounds,
+            'buckets': list(self.buckets),
+            'count': self.count,
+            'mean': self.total // self.count if self.count else 0,
+            'max': self.max
+        }
+
+
+class Metrics:
+    """
+    registry of the metrics by name. The metrics are created once at startup and looked up by the hot paths ahead of
+    time, so recording a value doesn't allocate.
+    """
+    def __init__(self):
+        self.metrics = {}
+
+    def get(self, name, metric_class, *args):
+        metric = self.metrics.get(name)
+        if metric is None:
+            metric = self.metrics[name] = metric_class(*args)
+        return metric
+
+    def counter(self, name):
+        return self.get(name, Counter)
+
+    def labeled_counter(self, name, labels):
+        return self.get(name, LabeledCounter, labels)
+
+    def gauge(self, name, func=None):
+        return self.get(name, Gauge, func)
+
+    def histogram(self, name, bounds=TIMING_BOUNDS):
+        return self.get(name, Histogram, bounds)
+
+    def report(self):
+        return {name: metric.report() for name, metric in self.metrics.items()}
+
+    def reset_histograms(self):
+        for metric in self.metrics.values():
+            if isinstance(metric, Histogram):
+                metric.reset()
+
+
+class Telemetry:
+    """
+    sends the metrics every interval ms as Telemetry message, the histograms cover the time since the last report.
+    An interval of 0 disables the reports, the server can change the interval with a Telemetry request.
+    """
+    def __init__(self, metrics, interval):
+        self.metrics = metrics
+        self.interval = interval
+        self.last_report = utime.ticks_ms()
+
+    def set_interval(self, interval):
+        self.interval = interval
+        self.last_report = utime.ticks_ms()
+
+    def due(self):
+        return self.interval and utime.ticks_diff(utime.ticks_ms(), self.last_report) >= self.interval
+
+    def report(self):
+        self.last_report = utime.ticks_ms()
+        report = self.metrics.report()
+        self.metrics.reset_histograms()
+        return report
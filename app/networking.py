@@ -1,19 +1,179 @@
-import network
+import utime
+from ubinascii import hexlify, unhexlify
+
+from app.hal import network
 from app.extensions import config
 
+RETRY_MIN_DELAY = const(1000)
+RETRY_MAX_DELAY = const(30000)
+
+# association failures which won't resolve by waiting, not every port knows all of them
+FAILED = tuple(
+    getattr(network, name) for name in ('STAT_WRONG_PASSWORD', 'STAT_NO_AP_FOUND', 'STAT_CONNECT_FAIL')
+    if hasattr(network, name)
+)
+
+
+class WifiManager:
+    """
+    associates with WIFI_NETWORK and watches the link
+
+    The bssid and channel of the access point the last association succeeded with are kept in the connection cache,
+    so the next association skips the scan of all channels. If that doesn't succeed within
+    WIFI_CACHED_CONNECT_TIMEOUT, the cached access point is dropped and the strongest one of a full scan is used.
+    """
+    # the link was up at the last check, see link_lost
+    connected = False
+    # failed associations since the last successful one
+    attempts = 0
+    drops = 0
+    scans = 0
+    # (bssid as hex, channel) of the running association, None if the driver picks the access point
+    access_point = None
+    from_cache = False
+    deadline = 0
+
+    def __init__(self, cache):
+        self.cache = cache
+        self.wlan = network.WLAN(network.STA_IF)
+
+    def start(self):
+        """
+        starts the association without waiting for it, only a full scan blocks
+        """
+        self.wlan.active(True)
+        if self.wlan.isconnected():
+            if config.DEBUG:
+                print('wifi already connected, proceed ...')
+            self.connected = True
+            return self
+        self.connected = False
+        if config.WIFI_STATIC_IP:
+            # skips dhcp, which is the slowest part of the association
+            self.wlan.ifconfig(tuple(config.WIFI_STATIC_IP))
+        self.access_point = self.cache.get_access_point(config.WIFI_NETWORK)
+        self.from_cache = self.access_point is not None
+        if self.access_point is None:
+            self.access_point = self.scan()
+        timeout = config.WIFI_CACHED_CONNECT_TIMEOUT if self.from_cache else config.WIFI_CONNECT_TIMEOUT
+        self.deadline = utime.ticks_add(utime.ticks_ms(), timeout * 1000)
+        if config.DEBUG:
+            print('connecting to wifi %s ...' % (self.access_point,))
+        try:
+            # the driver may still retry the association which was lost
+            self.wlan.disconnect()
+        except OSError:
+            pass
+        if self.access_point is None:
+            # hidden network or the scan came up empty, the driver scans by itself
+            self.wlan.connect(config.WIFI_NETWORK, config.WIFI_PASSWORD)
+            return self
+        try:
+            self.wlan.config(channel=self.access_point[1])
+        except (OSError, ValueError, TypeError):
+            # not every port can preset the channel of the station interface
+            pass
+        self.wlan.connect(config.WIFI_NETWORK, config.WIFI_PASSWORD, bssid=unhexlify(self.access_point[0]))
+        return self
+
+    def scan(self):
+        """
+        returns (bssid as hex, channel) of the strongest access point of WIFI_NETWORK or None
+        """
+        self.scans += 1
+        ssid = config.WIFI_NETWORK.encode()
+        best = None
+        for entry in self.wlan.scan():
+            # ssid, bssid, channel, rssi, security, hidden
+            if entry[0] == ssid and (best is None or entry[3] > best[3]):
+                best = entry
+        if best is None:
+            return None
+        return hexlify(best[1]).decode(), best[2]
 
-def wifi_connect():
-    wlan = network.WLAN(network.STA_IF)
-    wlan.active(True)
-    if wlan.isconnected():
+    def poll(self):
+        """
+        returns True once associated, False if the association failed or timed out and None while it is pending
+        """
+        if self.wlan.isconnected():
+            if not self.connected:
+                self.connected = True
+                self.attempts = 0
+                if self.access_point is not None and not self.from_cache:
+                    self.cache.set_access_point(config.WIFI_NETWORK, self.access_point[0], self.access_point[1])
+            return True
+        if self.wlan.status() in FAILED or utime.ticks_diff(self.deadline, utime.ticks_ms()) <= 0:
+            return False
+        return None
+
+    def retry(self):
+        """
+        gives up the running association and returns the delay in ms before start() should be called again
+        """
+        if config.DEBUG:
+            print('wifi association failed, status %s' % self.wlan.status())
+        if self.from_cache:
+            # the access point may have moved to another channel or be gone, retry right away with a full scan, which
+            # doesn't count as a failed attempt of the backoff
+            self.cache.invalidate_access_point()
+            return 0
+        self.attempts += 1
+        return min(RETRY_MAX_DELAY, RETRY_MIN_DELAY << min(self.attempts - 1, 16))
+
+    def wait(self, waiting=None):
+        """
+        blocks until associated, waiting() is called between the attempts
+        """
+        while True:
+            connected = self.poll()
+            if connected:
+                break
+            if connected is None:
+                utime.sleep_ms(50)
+                continue
+            delay = self.retry()
+            if waiting is not None:
+                waiting()
+            utime.sleep_ms(delay)
+            self.start()
         if config.DEBUG:
-            print('wifi already connected, proceed ...')
-        return wlan
-    if config.DEBUG:
-        print('connecting to wifi ...')
-    wlan.connect(config.WIFI_NETWORK, config.WIFI_PASSWORD)
-    while not wlan.isconnected():
-        pass
-    if config.DEBUG:
-        print('wifi connected.')
-    return wlan
+            print('wifi connected.')
+        return self
+
+    def reconnect(self, waiting=None):
+        """
+        associates again if the link is down
+        """
+        if self.wlan.isconnected():
+            return self
+        return self.start().wait(waiting)
+
+    def link_lost(self):
+        """
+        returns True once after the link went down, so the websocket reconnects without waiting for socket errors
+        """
+        if not self.connected or self.wlan.isconnected():
+            return False
+        self.connected = False
+        self.drops += 1
+        return True
+
+    def isconnected(self):
+        return self.wlan.isconnected()
+
+    def ifconfig(self):
+        return self.wlan.ifconfig()
+
+    def stats(self):
+        try:
+            rssi = self.wlan.status('rssi') if self.wlan.isconnected() else None
+        except (OSError, ValueError):
+            rssi = None
+        return {
+            'rssi': rssi,
+            'channel': self.access_point[1] if self.access_point else None,
+            'cached': self.from_cache,
+            'drops': self.drops,
+            'scans': self.scans
+        }
+
@@ -0,0 +1,147 @@
+import utime
+
+
+class PendingRequests:
+    """
+    keeps the sent requests until the server replies with the same uid. Requests without a reply are retransmitted
+    with an exponential backoff until max_retries is reached.
+
+    The records of the requests are preallocated and reused, so tracking a sent request doesn't allocate.
+    """
+    # timeouts in ms per message type, other tracked types use the default timeout
+    timeouts = {
+        'BootNotification': 10000,
+    }
+    tracked_types = ('BootNotification', 'DoorStatus', 'ResourceStatusChange')
+    # a newer request of these types replaces the pending one
+    superseding_types = ('DoorStatus',)
+
+    def __init__(self, timeout, max_retries, capacity=16):
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.capacity = capacity
+        # uid -> [message, first sent, deadline, retries]
+        self.requests = {}
+        self.free = [[None, 0, 0, 0] for _ in range(capacity)]
+        self.next_deadline = None
+        self.acknowledged = 0
+        self.retransmitted = 0
+        self.expired = 0
+        self.dropped = 0
+        self.ack_latency_average = None
+        self.ack_latency_max = 0
+
+    def __len__(self):
+        return len(self.requests)
+
+    def sent(self, message):
+        message_type, state, uid, data = message
+        if state != 'request' or message_type not in self.tracked_types:
+            return
+        now = utime.ticks_ms()
+        request = self.requests.get(uid)
+        if request is None:
+            if message_type in self.superseding_types:
+                self.remove_superseded(message)
+            if len(self.requests) >= self.capacity:
+                self.drop_oldest()
+            request = self.free.pop()
+            request[0] = message
+            request[1] = now
+            request[3] = 0
+            self.requests[uid] = request
+        request[2] = utime.ticks_add(now, self.request_timeout(request))
+        self.update_next_deadline(request[2])
+
+    def acknowledge(self, uid):
+        """
+        matches a reply, returns True if it belongs to a pending request
+        """
+        request = self.requests.pop(uid, None)
+        if request is None:
+            return False
+        latency = utime.ticks_diff(utime.ticks_ms(), request[1])
+        self.release(request)
+        self.acknowledged += 1
+        if self.ack_latency_average is None:
+            self.ack_latency_average = latency
+        else:
+            self.ack_latency_average += (latency - self.ack_latency_average) / 8
+        self.ack_latency_max = max(self.ack_latency_max, latency)
+        return True
+
+    def check(self, requeue):
+        """
+        requeues the requests whose reply is overdue with requeue(message)
+        """
+        if self.next_deadline is None:
+            return
+        now = utime.ticks_ms()
+        if utime.ticks_diff(self.next_deadline, now) > 0:
+            return
+        self.next_deadline = None
+        for uid in list(self.requests):
+            request = self.requests[uid]
+            if utime.ticks_diff(request[2], now) > 0:
+                self.update_next_deadline(request[2])
+                continue
+            if request[3] >= self.max_retries:
+                self.release(self.requests.pop(uid))
+                self.expired += 1
+                continue
+            request[3] += 1
+            self.retransmitted += 1
+            # the deadline is set again when the request is sent
+            request[2] = utime.ticks_add(now, self.request_timeout(request))
+            self.update_next_deadline(request[2])
+            requeue(request[0])
+
+    def request_timeout(self, request):
+        return self.timeouts.get(request[0][0], self.timeout) << request[3]
+
+    def update_next_deadline(self, deadline):
+        if self.next_deadline is None or utime.ticks_diff(deadline, self.next_deadline) < 0:
+            self.next_deadline = deadline
+
+    def release(self, request):
+        request[0] = None
+        self.free.append(request)
+
+    def remove_superseded(self, message):
+        """
+        removes the pending requests of the same type and resource
+        """
+        resource_uid = message[3].get('resource_uid') if isinstance(message[3], dict) else None
+        while True:
+            # one at a time: copying the keys to delete while iterating, or an items() view, would allocate
+            superseded = None
+            for uid in self.requests:
+                pending = self.requests[uid][0]
+                if pending[0] != message[0]:
+                    continue
+                if isinstance(pending[3], dict) and pending[3].get('resource_uid') != resource_uid:
+                    continue
+                superseded = uid
+                break
+            if superseded is None:
+                return
+            self.release(self.requests.pop(superseded))
+
+    def drop_oldest(self):
+        oldest = None
+        for uid, request in self.requests.items():
+            if oldest is None or utime.ticks_diff(request[1], self.requests[oldest][1]) < 0:
+                oldest = uid
+        self.release(self.requests.pop(oldest))
+        self.dropped += 1
+
+    def stats(self):
+        return {
+            'in_flight': len(self.requests),
+            'acknowledged': self.acknowledged,
+            'retransmitted': self.retransmitted,
+            'expired': self.expired,
+            'dropped': self.dropped,
+            'ack_latency_average': self.ack_latency_average,
+            'ack_latency_max': self.ack_latency_max
+        }
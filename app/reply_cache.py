@@ -0,0 +1,93 @@
+class ReplyCache:
+    """
+    fixed size lru cache of the replies to the last handled requests by uid, so a request which the server sent again
+    after a lost or delayed reply is answered from the cache instead of running the command twice
+
+    The entries are kept in a doubly linked list over preallocated slots, the dict only maps the uid to its slot, so
+    lookups and updates take constant time and the memory use is bounded by the capacity.
+    """
+    # requests with side effects, replies of other types are not cached
+    cached_types = ('RemoteChangeResourceStatus',)
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.uids = [None] * capacity
+        self.replies = [None] * capacity
+        # neighbours of the slots towards the most and the least recently used one, -1 at the ends
+        self.newer = [-1] * capacity
+        self.older = [-1] * capacity
+        # uid -> slot
+        self.slots = {}
+        self.newest = -1
+        self.oldest = -1
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.slots)
+
+    def get(self, message_type, uid):
+        """
+        returns the cached reply data of a request or None if it wasn't handled yet
+        """
+        if message_type not in self.cached_types:
+            return None
+        slot = self.slots.get(uid)
+        if slot is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.unlink(slot)
+        self.link(slot)
+        return self.replies[slot]
+
+    def put(self, message_type, uid, data):
+        if message_type not in self.cached_types:
+            return
+        slot = self.slots.get(uid)
+        if slot is not None:
+            self.unlink(slot)
+        elif len(self.slots) < self.capacity:
+            slot = len(self.slots)
+        else:
+            slot = self.oldest
+            self.unlink(slot)
+            del self.slots[self.uids[slot]]
+            self.evictions += 1
+        self.uids[slot] = uid
+        self.replies[slot] = data
+        self.slots[uid] = slot
+        self.link(slot)
+
+    def link(self, slot):
+        """
+        makes the slot the most recently used one
+        """
+        self.older[slot] = self.newest
+        self.newer[slot] = -1
+        if self.newest != -1:
+            self.newer[self.newest] = slot
+        self.newest = slot
+        if self.oldest == -1:
+            self.oldest = slot
+
+    def unlink(self, slot):
+        newer = self.newer[slot]
+        older = self.older[slot]
+        if newer != -1:
+            self.older[newer] = older
+        else:
+            self.newest = older
+        if older != -1:
+            self.newer[older] = newer
+        else:
+            self.oldest = newer
+
+    def stats(self):
+        return {
+            'size': len(self.slots),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions
+        }
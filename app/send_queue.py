@@ -0,0 +1,117 @@
+class SendLane:
+    """
+    fixed size fifo ring, the oldest message is dropped if it is full
+    """
+    def __init__(self, capacity):
+        self.messages = [None] * capacity
+        self.keys = [None] * capacity
+        self.head = 0
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def append(self, message, key):
+        """
+        appends a message and returns True if the oldest message had to be dropped for it
+        """
+        capacity = len(self.messages)
+        dropped = self.count == capacity
+        if dropped:
+            self.head = (self.head + 1) % capacity
+            self.count -= 1
+        position = (self.head + self.count) % capacity
+        self.messages[position] = message
+        self.keys[position] = key
+        self.count += 1
+        return dropped
+
+    def push_front(self, message, key):
+        """
+        puts a message back in front of the others, returns True if it had to be dropped because the lane is full
+        """
+        capacity = len(self.messages)
+        if self.count == capacity:
+            return True
+        self.head = (self.head - 1) % capacity
+        self.messages[self.head] = message
+        self.keys[self.head] = key
+        self.count += 1
+        return False
+
+    def replace(self, message, key):
+        """
+        replaces the pending message with the same key and returns True if there was one
+        """
+        capacity = len(self.messages)
+        for i in range(self.count):
+            position = (self.head + i) % capacity
+            if self.keys[position] == key:
+                self.messages[position] = message
+                return True
+        return False
+
+    def pop(self):
+        message = self.messages[self.head]
+        self.messages[self.head] = None
+        self.keys[self.head] = None
+        self.head = (self.head + 1) % len(self.messages)
+        self.count -= 1
+        return message
+
+
+class SendQueue:
+    """
+    bounded fifo send queue with a high priority lane for replies. Pending messages of a type in coalesce_types are
+    replaced by newer ones with the same key (e.g. the type and the resource), so only the latest state is sent.
+    """
+    coalesce_types = ('DoorStatus', 'PowerStatus', 'FirmwareProgress')
+
+    def __init__(self, capacity, priority_capacity=8):
+        self.normal = SendLane(capacity)
+        self.priority = SendLane(priority_capacity)
+        self.dropped = 0
+        self.coalesced = 0
+        self.high_water = 0
+
+    def __len__(self):
+        return len(self.priority) + len(self.normal)
+
+    @property
+    def depth(self):
+        return len(self)
+
+    def append(self, message, message_type=None, priority=False, key=None):
+        lane = self.priority if priority else self.normal
+        if key is None:
+            key = message_type
+        if message_type in self.coalesce_types and lane.replace(message, key):
+            self.coalesced += 1
+            return
+        if lane.append(message, key):
+            self.dropped += 1
+        if len(self) > self.high_water:
+            self.high_water = len(self)
+
+    def push_front(self, message, priority=False, key=None):
+        """
+        queues a popped message again, e.g. if it couldn't be sent
+        """
+        lane = self.priority if priority else self.normal
+        if lane.push_front(message, key):
+            self.dropped += 1
+
+    def pop(self):
+        if len(self.priority):
+            return self.priority.pop()
+        if len(self.normal):
+            return self.normal.pop()
+        raise IndexError('pop from empty queue')
+
+    def stats(self):
+        return {
+            'depth': len(self),
+            'high_water': self.high_water,
+            'dropped': self.dropped,
+            'coalesced': self.coalesced
+        }
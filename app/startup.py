@@ -0,0 +1,29 @@
+import utime
+
+
+class Startup:
+    """
+    runs the named stages of the boot sequence and records their duration in us
+    """
+    def __init__(self):
+        self.started = utime.ticks_us()
+        self.stages = []
+        self.timings = {}
+
+    def stage(self, name, func, *args):
+        start = utime.ticks_us()
+        result = func(*args)
+        self.add(name, utime.ticks_diff(utime.ticks_us(), start))
+        return result
+
+    def add(self, name, duration):
+        self.stages.append(name)
+        self.timings[name] = duration
+
+    def report(self):
+        return {
+            'stages': [[name, self.timings[name]] for name in self.stages],
+            'total': utime.ticks_diff(utime.ticks_us(), self.started),
+            # ticks start at reset, so this includes the firmware boot and boot.py
+            'since_reset': utime.ticks_us()
+        }
@@ -5,7 +5,7 @@ import usocket
 host = 'raw.githubusercontent.com'
 CHUNK_SIZE = 512
 
-from app.networking import wifi_connect
+from app.extensions import wifi
 
 
 def get(path, save_to_file=None):
@@ -35,7 +35,7 @@ def get(path, save_to_file=None):
         s.close()
         return result
 
-    with open(save_to_file, 'w') as outfile:
+    with open(save_to_file, 'wb') as outfile:
         data = s.read(CHUNK_SIZE)
         while data:
             outfile.write(data)
@@ -52,11 +52,17 @@ def ensure_dir(dir):
 
 
 def update(version):
-    wifi_connect()
+    wifi.reconnect()
     ensure_dir('/next')
     base_path = '/binary-butterfly/open-booking-client-esp32/%s' % version
     file_paths = get('%s/update-file-list' % base_path).split(b'\n')
+    # precompiled modules from build.sh are preferred, micropython would import a .py before the .mpy
+    compiled = [file_path[9:-4] for file_path in file_paths if file_path[0:9] == b'dist/app/']
     for file_path in file_paths:
-        if not file_path or file_path[0:4] != 'app/':
+        if file_path[0:9] == b'dist/app/':
+            target = file_path[9:]
+        elif file_path[0:4] == b'app/' and file_path[4:-3] not in compiled:
+            target = file_path[4:]
+        else:
             continue
-        get(b'%s/%s' % (base_path, file_path), b'/next/%s' % file_path[4:])
+        get(b'%s/%s' % (base_path, file_path), b'/next/%s' % target)
@@ -1,16 +1,55 @@
-import uos
-import ujson as json
-from ubinascii import hexlify
-from app.extensions import config, websocket_send_queue
+from app.extensions import config, websocket_send_queue, websocket_send_event, reply_cache
+from app.message_codec import new_uid
+from app.websocket_protocol import ConnectionClosed
+
+# messages which were popped from the send queue, but may not have reached the socket yet
+unflushed = []
 
 
 def websocket_send(message_type, state, data, uid=None):
-    to_send = json.dumps({
-        'state': state,
-        'type': message_type,
-        'uid': hexlify(uos.urandom(16)).decode() if uid is None else uid,
-        'data': data
-    })
+    """
+    queues a message, it's encoded when it's sent with the encoding negotiated for the connection
+    """
+    message = (message_type, state, new_uid() if uid is None else uid, data)
+    if state == 'reply':
+        reply_cache.put(message_type, uid, data)
     if config.DEBUG:
-        print('>> %s' % to_send)
-    websocket_send_queue.append(to_send)
+        print('>> %s %s %s %s' % message)
+    websocket_queue(message)
+
+
+def websocket_queue(message):
+    websocket_send_queue.append(message, message[0], message[1] == 'reply', message_key(message))
+    if websocket_send_event is not None:
+        websocket_send_event.set()
+
+
+def message_key(message):
+    resource_uid = message[3].get('resource_uid') if isinstance(message[3], dict) else None
+    return message[0] if resource_uid is None else (message[0], resource_uid)
+
+
+def websocket_drain(websocket):
+    """
+    sends the queued messages while the socket is writable
+    """
+    try:
+        while len(websocket_send_queue) and websocket.writable():
+            message = websocket_send_queue.pop()
+            unflushed.append(message)
+            websocket.send_message(message, flush=False)
+        websocket.flush()
+    except ConnectionClosed:
+        websocket_requeue()
+        raise
+    del unflushed[:]
+
+
+def websocket_requeue():
+    """
+    queues the unflushed messages again in front of the newer ones after the connection failed, so they are journaled
+    while it's down. Some of them may have been sent already, the server drops duplicates by their uid.
+    """
+    while unflushed:
+        message = unflushed.pop()
+        websocket_send_queue.push_front(message, message[1] == 'reply', message_key(message))
@@ -1,77 +1,274 @@
 import ussl
+import utime
+import uhashlib
 import usocket as socket
 import urandom as random
-from ubinascii import hexlify, b2a_base64
+from ubinascii import hexlify
 
 
-from app.extensions import config
-from app.websocket_protocol import Websocket
+from app.extensions import config, pending_requests, metrics, connection_cache, wifi
+from app.heartbeat import Heartbeat
+from app.message_codec import BINARY_PROTOCOL, encode_binary, encode_json, write_json
+from app.websocket_deflate import PerMessageDeflate, offer as deflate_offer
+from app.websocket_protocol import Websocket, OP_BYTES, OP_TEXT, MAX_HEADER_SIZE, client_handshake
 from app.websocket import websocket_send
 
+# Connection states
+STATE_DISCONNECTED = const(0)
+STATE_RESOLVING = const(1)
+STATE_CONNECTING = const(2)
+STATE_HANDSHAKING = const(3)
+STATE_OPEN = const(4)
+
 
 class WebsocketClient:
     ws = None
+    # optional consumer for fragmented messages, see Websocket.handle_frame
+    stream_consumer = None
+    connection_state = STATE_DISCONNECTED
+    # failed connection attempts since the last open connection
+    attempts = 0
+    reconnects = 0
+    tls_session = None
+    # compact binary messages were negotiated for the connection, see app.message_codec
+    binary = False
+    # app.websocket_deflate.PerMessageDeflate if compression was negotiated for the connection
+    deflate = None
 
     def __init__(self):
-        while True:
-            try:
-                print('connect')
-                self.connect()
-                break
-            except OSError:
-                continue
-
-    def reconnect(self):
-        while True:
-            try:
-                self.connect()
-                break
-            except OSError:
-                continue
-        websocket_send('ConnectionChange', 'request', {'status': 'reconnected'})
+        self.cache = connection_cache
+        self.heartbeat = Heartbeat(config.WEBSOCKET_PING_INTERVAL * 1000, config.WEBSOCKET_PING_MAX_MISSED)
+        # duration of the connection phases in ms of the last connection attempt
+        self.timings = {}
+
+    def start(self):
+        print('connect')
+        while not self.try_connect():
+            utime.sleep_ms(self.next_delay())
+
+    def reconnect(self, waiting=None):
+        """
+        connects again, waiting() is called between the attempts
+        """
+        # the first retry after losing an open connection happens immediately
+        while not self.try_connect():
+            if waiting is not None:
+                waiting()
+            utime.sleep_ms(self.next_delay())
+        self.reconnected()
+
+    def reconnected(self):
+        self.reconnects += 1
+        websocket_send('ConnectionChange', 'request', {
+            'status': 'reconnected',
+            'timings': self.timings,
+            'link': self.heartbeat.stats(),
+            'wifi': wifi.stats()
+        })
+
+    def try_connect(self):
+        """
+        tries to connect once and returns True on success
+        """
+        try:
+            self.connect()
+        except OSError as e:
+            if config.DEBUG:
+                print('connection failed in state %s: %s' % (self.connection_state, e))
+            if self.timings.get('dns_cached'):
+                # the server may have moved, resolve again on the next attempt
+                self.cache.invalidate_address()
+            self.connection_state = STATE_DISCONNECTED
+            self.attempts += 1
+            return False
+        self.attempts = 0
+        return True
+
+    def drop(self):
+        """
+        closes the connection without the close handshake, used when the wifi link went down
+        """
+        if self.open:
+            self.ws._close()
+        # the first attempt after the wifi is back happens immediately
+        self.attempts = 0
+
+    def next_delay(self):
+        """
+        capped exponential backoff with full jitter in ms, so a fleet doesn't reconnect in lockstep
+        """
+        ceiling = min(
+            config.WEBSOCKET_RECONNECT_MAX_DELAY,
+            config.WEBSOCKET_RECONNECT_MIN_DELAY << min(max(self.attempts - 1, 0), 16)
+        )
+        return random.getrandbits(16) * ceiling >> 16
 
     def connect(self):
+        self.timings = {}
+        started = utime.ticks_ms()
+        self.connection_state = STATE_RESOLVING
+        addr = self.resolve()
+        started = self.phase_done('resolve', started)
+        self.connection_state = STATE_CONNECTING
         sock = socket.socket()
-        addr = socket.getaddrinfo(config.WEBSOCKET_HOSTNAME, config.WEBSOCKET_PORT)
-        sock.connect(addr[0][4])
-        if config.WEBSOCKET_TLS:
-            sock = ussl.wrap_socket(sock)
-
-        def send_header(header, *args):
-            sock.write(header % args + '\r\n')
-
-        # Sec-WebSocket-Key is 16 bytes of random base64 encoded
-        key = b2a_base64(bytes(random.getrandbits(8) for _ in range(16)))[:-1]
-
-        send_header(b'GET %s HTTP/1.1', config.WEBSOCKET_PATH or '/')
-        send_header(b'Host: %s:%s', config.WEBSOCKET_HOSTNAME, config.WEBSOCKET_PORT)
-        send_header(b'Connection: Upgrade')
-        send_header(b'Upgrade: websocket')
-        send_header(b'Sec-WebSocket-Key: %s', key)
-        send_header(b'Sec-WebSocket-Version: 13')
-        send_header(b'Origin: http://%s:%s' % (config.WEBSOCKET_HOSTNAME, config.WEBSOCKET_PORT))
-        send_header(b'Authorization: Basic %s' % b2a_base64(b'%s:%s' % (
-            config.WEBSOCKET_USER,
-            config.WEBSOCKET_PASSWORD
-        ))[:-1])
-        send_header(b'')
+        try:
+            sock.settimeout(config.WEBSOCKET_CONNECT_TIMEOUT)
+            sock.connect(addr)
+            started = self.phase_done('connect', started)
+            self.connection_state = STATE_HANDSHAKING
+            # also bounds the tls handshake and the readline() calls for the upgrade response
+            sock.settimeout(config.WEBSOCKET_HANDSHAKE_TIMEOUT)
+            if config.WEBSOCKET_TLS:
+                sock = self.wrap_tls(sock)
+                started = self.phase_done('tls', started)
+            self.handshake(sock)
+            self.phase_done('handshake', started)
+        except Exception:
+            sock.close()
+            raise
+        if config.DEBUG:
+            print('connection timings: %s' % self.timings)
+        print('connected!')
+        self.ws = Websocket(
+            sock,
+            0.1,
+            buffer_size=config.WEBSOCKET_MAX_MESSAGE_SIZE + MAX_HEADER_SIZE,
+            max_message_size=config.WEBSOCKET_MAX_MESSAGE_SIZE,
+            stream_consumer=self.stream_consumer
+        )
+        self.ws.heartbeat = self.heartbeat
+        self.ws.set_metrics(metrics)
+        self.ws.deflate = self.deflate
+        self.heartbeat.reset()
+        self.connection_state = STATE_OPEN
 
-        header = sock.readline()[:-2]
-        assert header.startswith(b'HTTP/1.1 101 '), header
+    def phase_done(self, phase, started):
+        now = utime.ticks_ms()
+        self.timings[phase] = utime.ticks_diff(now, started)
+        return now
 
-        while header:
-            header = sock.readline()[:-2]
-        print('connected!')
-        self.ws = Websocket(sock, 0.1)
+    def resolve(self):
+        """
+        returns the websocket address, dns results are cached in flash for WEBSOCKET_DNS_TTL seconds
+        """
+        cached = self.cache.get_address(config.WEBSOCKET_HOSTNAME, config.WEBSOCKET_PORT, config.WEBSOCKET_DNS_TTL)
+        self.timings['dns_cached'] = cached is not None
+        if cached is not None:
+            # numeric addresses don't need a dns lookup
+            return socket.getaddrinfo(cached[0], cached[1])[0][4]
+        addr = socket.getaddrinfo(config.WEBSOCKET_HOSTNAME, config.WEBSOCKET_PORT)[0][4]
+        # some ports return the raw sockaddr, which can't be cached
+        if isinstance(addr, tuple):
+            self.cache.set_address(config.WEBSOCKET_HOSTNAME, config.WEBSOCKET_PORT, addr[0], addr[1])
+        return addr
+
+    def wrap_tls(self, sock):
+        """
+        wraps the socket with tls, resuming the last session where the port supports it
+        """
+        sock_tls = None
+        if self.tls_session:
+            try:
+                sock_tls = ussl.wrap_socket(sock, server_hostname=config.WEBSOCKET_HOSTNAME, session=self.tls_session)
+            except TypeError:
+                # no session support, fall back to a full handshake from now on
+                self.tls_session = False
+        if sock_tls is None:
+            sock_tls = ussl.wrap_socket(sock, server_hostname=config.WEBSOCKET_HOSTNAME)
+        if self.tls_session is not False:
+            self.tls_session = getattr(sock_tls, 'session', None)
+        self.timings['tls_resumed'] = bool(getattr(sock_tls, 'session_reused', False))
+        self.check_certificate(sock_tls)
+        return sock_tls
+
+    def check_certificate(self, sock):
+        """
+        pins the server certificate: the first certificate seen (or WEBSOCKET_CERTIFICATE_FINGERPRINT) is stored and
+        every later connection has to present the same one
+        """
+        if not config.WEBSOCKET_PIN_CERTIFICATE:
+            return
+        try:
+            certificate = sock.getpeercert(True)
+        except (AttributeError, OSError):
+            return
+        fingerprint = hexlify(uhashlib.sha256(certificate).digest()).decode()
+        pinned = config.WEBSOCKET_CERTIFICATE_FINGERPRINT or self.cache.get_fingerprint(config.WEBSOCKET_HOSTNAME)
+        if pinned is None:
+            self.cache.set_fingerprint(config.WEBSOCKET_HOSTNAME, fingerprint)
+        elif pinned != fingerprint:
+            raise OSError('certificate fingerprint mismatch: %s' % fingerprint)
 
-    def send(self, buf):
+    def handshake(self, sock):
+        subprotocol, extensions = client_handshake(
+            sock,
+            config.WEBSOCKET_HOSTNAME,
+            config.WEBSOCKET_PORT,
+            config.WEBSOCKET_PATH or '/',
+            config.WEBSOCKET_USER,
+            config.WEBSOCKET_PASSWORD,
+            BINARY_PROTOCOL if config.WEBSOCKET_BINARY else None,
+            deflate_offer(config.WEBSOCKET_DEFLATE_WINDOW_BITS) if config.WEBSOCKET_DEFLATE else None
+        )
+        self.binary = subprotocol == BINARY_PROTOCOL
+        self.deflate = PerMessageDeflate.accept(extensions, config.WEBSOCKET_DEFLATE_WINDOW_BITS)
+
+    def send(self, buf, flush=True):
         print(buf)
-        return self.ws.send(buf)
+        return self.ws.send(buf, flush)
+
+    def send_message(self, message, flush=True):
+        if self.binary:
+            self.ws.write_frame(OP_BYTES, encode_binary(message), flush)
+        elif not self.ws.write_frame_from(OP_TEXT, write_json, message, flush):
+            # larger than the output buffer
+            self.send(encode_json(message), flush)
+        pending_requests.sent(message)
+
+    def flush(self):
+        return self.ws.flush()
+
+    def write_pending(self):
+        return self.ws.write_pending()
+
+    @property
+    def output_pending(self):
+        """
+        bytes in the output buffer which weren't written to the socket yet
+        """
+        return self.ws.output_end - self.ws.output_start
 
     def poll(self):
         return self.ws.poll()
 
+    def read_input(self):
+        return self.ws.read_input()
+
+    def writable(self):
+        return self.ws.writable()
+
+    def heartbeat_tick(self):
+        """
+        sends the pings and closes the connection if too many of them were not answered
+        """
+        if not self.open:
+            return
+        if not self.heartbeat.tick(self.ws):
+            if config.DEBUG:
+                print('%s pings not answered, connection is dead' % self.heartbeat.max_missed)
+            self.ws._close()
+
+    @property
+    def sock(self):
+        return self.ws.sock
+
     @property
     def open(self):
         return self.ws and self.ws.open
 
+    @property
+    def state(self):
+        if self.connection_state == STATE_OPEN and not self.open:
+            return STATE_DISCONNECTED
+        return self.connection_state
+
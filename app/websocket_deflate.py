@@ -0,0 +1,139 @@
+"""
+permessage-deflate extension, see https://tools.ietf.org/html/rfc7692
+
+Both directions are negotiated without context takeover: every message is compressed on its own, so there is no
+compression state between the messages and the memory is bounded by the window size of the single message.
+
+Messages are decompressed with the deflate module (micropython 1.21+), zlib (cpython) or uzlib (older micropython).
+Compressing needs deflate with compression support or zlib, without it the messages are sent uncompressed, which the
+extension allows.
+"""
+import io
+
+try:
+    import deflate
+except ImportError:
+    deflate = None
+try:
+    import zlib
+    if not hasattr(zlib, 'compressobj'):
+        zlib = None
+except ImportError:
+    zlib = None
+try:
+    import uzlib
+except ImportError:
+    uzlib = None
+
+EXTENSION_NAME = 'permessage-deflate'
+# the sync flush block which the sender removed and an empty final block, so every inflater sees a complete stream
+TAIL = b'\x00\x00\xff\xff\x01\x00\x00\xff\xff'
+
+
+def offer(window_bits):
+    """
+    returns the Sec-WebSocket-Extensions value of the client
+    """
+    return '%s; client_no_context_takeover; server_no_context_takeover; client_max_window_bits=%d; ' \
+           'server_max_window_bits=%d' % (EXTENSION_NAME, window_bits, window_bits)
+
+
+class PerMessageDeflate:
+    # smaller messages are sent uncompressed, the deflate header and the block overhead eat up the savings
+    min_size = 64
+    # set to False when the deflate module turns out to lack compression
+    can_compress = deflate is not None or zlib is not None
+
+    def __init__(self, client_window_bits, server_window_bits):
+        self.client_window_bits = client_window_bits
+        self.server_window_bits = server_window_bits
+        self.uncompressed = 0
+        self.compressed = 0
+
+    @classmethod
+    def accept(cls, header, window_bits):
+        """
+        returns the extension for the Sec-WebSocket-Extensions response header or None if the server declined it
+        """
+        if not header:
+            return None
+        parameters = header.split(';')
+        if parameters[0].strip() != EXTENSION_NAME:
+            raise OSError('unexpected websocket extension: %s' % header)
+        client_window_bits = window_bits
+        server_window_bits = window_bits
+        server_no_context_takeover = False
+        for parameter in parameters[1:]:
+            name, _, value = parameter.partition('=')
+            name = name.strip()
+            value = value.strip().strip('"')
+            if name == 'server_no_context_takeover':
+                server_no_context_takeover = True
+            elif name == 'client_no_context_takeover':
+                pass
+            elif name == 'server_max_window_bits':
+                server_window_bits = int(value)
+            elif name == 'client_max_window_bits':
+                client_window_bits = int(value)
+            else:
+                raise OSError('unsupported permessage-deflate parameter: %s' % name)
+        if not server_no_context_takeover or server_window_bits > window_bits:
+            raise OSError('unsupported permessage-deflate response: %s' % header)
+        return cls(client_window_bits, server_window_bits)
+
+    def compress(self, data):
+        """
+        returns the compressed payload or None if it isn't worth it
+        """
+        # raw deflate can't compress with a window of 8 bits
+        if len(data) < self.min_size or not self.can_compress or self.client_window_bits < 9:
+            return None
+        if deflate is not None:
+            try:
+                stream = io.BytesIO()
+                with deflate.DeflateIO(stream, deflate.RAW, self.client_window_bits) as compressor:
+                    compressor.write(data)
+            except OSError:
+                PerMessageDeflate.can_compress = False
+                return None
+            # the final block is followed by an empty block without the removed sync flush bytes, see RFC 7692 7.2.3.2
+            compressed = stream.getvalue() + b'\x00'
+        else:
+            compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -self.client_window_bits)
+            compressed = compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            compressed = compressed[:-4]
+        if len(compressed) >= len(data):
+            return None
+        self.uncompressed += len(data)
+        self.compressed += len(compressed)
+        return compressed
+
+    def decompress(self, data, max_size):
+        """
+        returns the decompressed payload, raises ValueError if it's invalid or larger than max_size
+        """
+        data = bytes(data) + TAIL
+        if zlib is not None:
+            try:
+                result = zlib.decompressobj(-self.server_window_bits).decompress(data, max_size + 1)
+            except zlib.error as e:
+                raise ValueError(e)
+        else:
+            # both streams inflate only as much as is read, so a small message can't expand beyond max_size
+            if deflate is not None:
+                stream = deflate.DeflateIO(io.BytesIO(data), deflate.RAW, self.server_window_bits)
+            else:
+                stream = uzlib.DecompIO(io.BytesIO(data), -self.server_window_bits)
+            try:
+                result = stream.read(max_size + 1)
+            except (OSError, ValueError) as e:
+                raise ValueError(e)
+        if len(result) > max_size:
+            raise ValueError('message too big')
+        return result
+
+    def stats(self):
+        return {
+            'uncompressed': self.uncompressed,
+            'compressed': self.compressed
+        }
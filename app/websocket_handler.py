@@ -1,34 +1,105 @@
-import machine
+from app.hal import reset
 from time import sleep
-import ujson as json
-from app.extensions import config, device
+from app.extensions import config, device, websocket, pending_requests, telemetry, reply_cache, metrics
+from app.dispatch import HandlerRegistry
+from app.firmware import FirmwareReceiver, CHUNK_MARKER
+from app.message_codec import decode_binary, decode_json
+from app.websocket_protocol import ConnectionClosed
 from app.websocket import websocket_send
 from app.update import update
 
+handlers = HandlerRegistry()
+firmware = FirmwareReceiver()
+exceptions = metrics.counter('exceptions')
 
-class HandleWebsocketMessage:
-    def __init__(self, message_raw):
-        if config.DEBUG:
-            print('<< %s' % message_raw)
-        message = json.loads(message_raw)
-        self.state = message['state']
-        self.uid = message['uid']
-        self.type = message['type']
-        self.data = message['data']
-        if hasattr(self, 'handle%sR%s' % (self.type, self.state[1:])):
-            getattr(self, 'handle%sR%s' % (self.type, self.state[1:]))()
-
-    def handleRemoteChangeResourceStatusRequest(self):
-        if self.data['status'] == 'open':
-            device.open_lock()
-        else:
-            device.close_lock()
-        websocket_send(self.type, 'reply', {}, self.uid)
-
-    def handleReboot(self):
-        websocket_send(self.type, 'reply', {}, self.uid)
-        sleep(1)
-        machine.reset()
-
-    def handleFirmwareUpdate(self):
-        update(self.data['version'])
+
+def handle_websocket_messages(messages):
+    """
+    handles the messages of one read, an exception while handling one of them doesn't drop the following ones
+    """
+    for message_raw in messages or ():
+        try:
+            handle_websocket_message(message_raw)
+        except ConnectionClosed:
+            raise
+        except Exception as e:
+            exceptions.inc()
+            websocket_send('Exception', 'request', {'error': str(e)})
+
+
+def handle_websocket_message(message_raw):
+    if config.DEBUG:
+        print('<< %s' % message_raw)
+    if isinstance(message_raw, str):
+        message_type, state, uid, data = decode_json(message_raw)
+    elif message_raw[0] == CHUNK_MARKER:
+        progress = firmware.write_chunk(message_raw)
+        if progress is not None:
+            websocket_send('FirmwareProgress', 'request', progress)
+        return
+    else:
+        message_type, state, uid, data = decode_binary(message_raw)
+    if state == 'reply':
+        pending_requests.acknowledge(uid)
+    elif state == 'request':
+        reply = reply_cache.get(message_type, uid)
+        if reply is not None:
+            # the server sent the request again because our reply got lost or is still queued
+            websocket_send(message_type, 'reply', reply, uid)
+            return
+    if handlers.dispatch(message_type, state, uid, data):
+        return
+    # replies to our own requests don't need a handler
+    if state == 'request':
+        websocket_send(message_type, 'reply', {'error': 'unknown message type'}, uid)
+
+
+@handlers.register('RemoteChangeResourceStatus')
+def handle_remote_change_resource_status(uid, data):
+    resource = device.get_resource(data.get('resource_uid'))
+    if resource is None:
+        websocket_send('RemoteChangeResourceStatus', 'reply', {'error': 'unknown resource'}, uid)
+        return
+    if data['status'] == 'open':
+        device.open_lock(resource)
+    else:
+        device.close_lock(resource)
+    websocket_send('RemoteChangeResourceStatus', 'reply', {}, uid)
+
+
+@handlers.register('LinkQuality')
+def handle_link_quality(uid, data):
+    websocket_send('LinkQuality', 'reply', {
+        'heartbeat': websocket.heartbeat.stats(),
+        'requests': pending_requests.stats()
+    }, uid)
+
+
+@handlers.register('Reboot')
+def handle_reboot(uid, data):
+    # the send queue isn't drained anymore, an unanswered request would be retransmitted after the reset
+    try:
+        websocket.send_message(('Reboot', 'reply', uid, {}))
+        websocket.flush()
+    except (OSError, ConnectionClosed):
+        pass
+    sleep(1)
+    reset()
+
+
+@handlers.register('FirmwareUpdate')
+def handle_firmware_update(uid, data):
+    if data.get('files') is not None:
+        websocket_send('FirmwareUpdate', 'reply', firmware.start(data), uid)
+        return
+    # servers without firmware delivery let the device download the version from github
+    update(data['version'])
+    websocket_send('FirmwareUpdate', 'reply', {}, uid)
+
+
+@handlers.register('Telemetry')
+def handle_telemetry(uid, data):
+    # the server sets the interval of the periodic reports in seconds, 0 disables them
+    if data.get('interval') is not None:
+        telemetry.set_interval(data['interval'] * 1000)
+    websocket_send('Telemetry', 'reply', telemetry.report(), uid)
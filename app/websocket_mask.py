@@ -0,0 +1,48 @@
+"""
+XOR masking of websocket payloads, see https://tools.ietf.org/html/rfc6455#section-5.3
+
+apply_mask() works in place on a bytearray or memoryview. It uses the viper implementation if the port supports it and
+falls back to pure python otherwise (e.g. CPython). move_masked() masks a payload while moving it within a buffer, the
+mask is read from the buffer as well, so neither allocates.
+"""
+
+
+def mask_python(buf, mask_bits):
+    length = len(buf)
+    m0, m1, m2, m3 = mask_bits[0], mask_bits[1], mask_bits[2], mask_bits[3]
+    end = length & ~3
+    for i in range(0, end, 4):
+        buf[i] ^= m0
+        buf[i + 1] ^= m1
+        buf[i + 2] ^= m2
+        buf[i + 3] ^= m3
+    for i in range(end, length):
+        buf[i] ^= mask_bits[i & 3]
+
+
+def move_masked_python(buf, destination, source, length, mask_position):
+    """
+    masks length bytes at source into destination, which must not be behind source if the ranges overlap
+    """
+    m0, m1, m2, m3 = buf[mask_position], buf[mask_position + 1], buf[mask_position + 2], buf[mask_position + 3]
+    end = length & ~3
+    for i in range(0, end, 4):
+        buf[destination + i] = buf[source + i] ^ m0
+        buf[destination + i + 1] = buf[source + i + 1] ^ m1
+        buf[destination + i + 2] = buf[source + i + 2] ^ m2
+        buf[destination + i + 3] = buf[source + i + 3] ^ m3
+    for i in range(end, length):
+        buf[destination + i] = buf[source + i] ^ buf[mask_position + (i & 3)]
+
+
+try:
+    from app.websocket_mask_viper import mask_viper, move_masked_viper
+
+    def apply_mask(buf, mask_bits):
+        mask_viper(buf, len(buf), mask_bits)
+
+    move_masked = move_masked_viper
+except (ImportError, SyntaxError):
+    mask_viper = None
+    apply_mask = mask_python
+    move_masked = move_masked_python
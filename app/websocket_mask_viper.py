@@ -0,0 +1,38 @@
+"""
+Viper implementation of the websocket masking. This is a separate module because ports without native code emitters
+fail to compile it, app.websocket_mask falls back to pure python then.
+"""
+import micropython
+
+
+@micropython.viper
+def mask_viper(buf, length: int, mask_bits):
+    data = ptr8(buf)
+    key = ptr8(mask_bits)
+    i = 0
+    # bytewise until the data is word aligned
+    while i < length and (int(data) + i) & 3:
+        data[i] = data[i] ^ key[i & 3]
+        i += 1
+    words = (length - i) >> 2
+    if words:
+        # little endian mask word which starts at the current mask offset
+        word = key[i & 3] | (key[(i + 1) & 3] << 8) | (key[(i + 2) & 3] << 16) | (key[(i + 3) & 3] << 24)
+        data32 = ptr32(int(data) + i)
+        j = 0
+        while j < words:
+            data32[j] = data32[j] ^ word
+            j += 1
+        i += words << 2
+    while i < length:
+        data[i] = data[i] ^ key[i & 3]
+        i += 1
+
+
+@micropython.viper
+def move_masked_viper(buf, destination: int, source: int, length: int, mask_position: int):
+    data = ptr8(buf)
+    i = 0
+    while i < length:
+        data[destination + i] = data[source + i] ^ data[mask_position + (i & 3)]
+        i += 1
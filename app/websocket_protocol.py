@@ -25,9 +25,11 @@ SOFTWARE.
 """
 
 import uselect
+import utime
 import ustruct as struct
 import urandom as random
-from ubinascii import hexlify
+from ubinascii import hexlify, b2a_base64
+from app.websocket_mask import apply_mask, move_masked
 
 # Opcodes
 OP_CONT = const(0x0)
@@ -36,6 +38,9 @@ OP_BYTES = const(0x2)
 OP_CLOSE = const(0x8)
 OP_PING = const(0x9)
 OP_PONG = const(0xa)
+# names of the opcodes in the metrics, indexed by opcode
+OPCODE_NAMES = ('continuation', 'text', 'binary', None, None, None, None, None, 'close', 'ping', 'pong',
+                None, None, None, None, None)
 
 # Close codes
 CLOSE_OK = const(1000)
@@ -48,6 +53,9 @@ CLOSE_TOO_BIG = const(1009)
 CLOSE_MISSING_EXTN = const(1010)
 CLOSE_BAD_CONDITION = const(1011)
 
+# 2 bytes, 8 bytes extended length and the mask
+MAX_HEADER_SIZE = const(14)
+
 
 class NoDataException(Exception):
     pass
@@ -57,6 +65,47 @@ class ConnectionClosed(Exception):
     pass
 
 
+def client_handshake(sock, hostname, port, path, user, password, subprotocol=None, extensions=None):
+    """
+    sends the http upgrade request with basic auth and returns the subprotocol and the extensions accepted by the
+    server
+    """
+    def send_header(header, *args):
+        sock.write((header % args + '\r\n').encode())
+
+    # Sec-WebSocket-Key is 16 bytes of random base64 encoded
+    key = b2a_base64(bytes(random.getrandbits(8) for _ in range(16)))[:-1].decode()
+    credentials = b2a_base64(('%s:%s' % (user, password)).encode())[:-1].decode()
+
+    send_header('GET %s HTTP/1.1', path)
+    send_header('Host: %s:%s', hostname, port)
+    send_header('Connection: Upgrade')
+    send_header('Upgrade: websocket')
+    send_header('Sec-WebSocket-Key: %s', key)
+    send_header('Sec-WebSocket-Version: 13')
+    if subprotocol:
+        send_header('Sec-WebSocket-Protocol: %s', subprotocol)
+    if extensions:
+        send_header('Sec-WebSocket-Extensions: %s', extensions)
+    send_header('Origin: http://%s:%s', hostname, port)
+    send_header('Authorization: Basic %s', credentials)
+    send_header('')
+
+    header = sock.readline()[:-2]
+    if not header.startswith(b'HTTP/1.1 101 '):
+        raise OSError('websocket upgrade failed: %s' % header)
+
+    accepted = None
+    accepted_extensions = None
+    while header:
+        header = sock.readline()[:-2]
+        if header.lower().startswith(b'sec-websocket-protocol:'):
+            accepted = header[23:].strip().decode()
+        elif header.lower().startswith(b'sec-websocket-extensions:'):
+            accepted_extensions = header[25:].strip().decode()
+    return accepted, accepted_extensions
+
+
 class Websocket:
     """
     Basis of the Websocket protocol.
@@ -65,15 +114,44 @@ class Websocket:
     this one currently supports more options.
     """
     is_client = True
-
-    def __init__(self, sock, timeout):
+    # optional app.heartbeat.Heartbeat which gets the pong frames
+    heartbeat = None
+    # optional app.metrics.Metrics, see set_metrics()
+    metrics = None
+    # app.websocket_deflate.PerMessageDeflate if the extension was negotiated
+    deflate = None
+
+    def __init__(self, sock, timeout, buffer_size=None, max_message_size=8192, stream_consumer=None,
+                 output_buffer_size=1024):
         self.sock = sock
         self.sock.setblocking(False)
         self.open = True
         self.timeout = timeout
         self.poller = uselect.poll()
         self.poller.register(sock, uselect.POLLIN)
-        self.input = b''
+        self.write_poller = uselect.poll()
+        self.write_poller.register(sock, uselect.POLLOUT)
+        # preallocated input buffer, frames are parsed in place between input_start and input_end, so it holds
+        # at least an unfragmented frame of max_message_size
+        if buffer_size is None:
+            buffer_size = max_message_size + MAX_HEADER_SIZE
+        self.input = bytearray(buffer_size)
+        self.input_view = memoryview(self.input)
+        self.input_start = 0
+        self.input_end = 0
+        self.frames_received = 0
+        # reusable output buffer, frames are serialized at output_end until they are flushed
+        self.output = bytearray(output_buffer_size)
+        self.output_view = memoryview(self.output)
+        # output_start is behind the data which was written by write_pending() already
+        self.output_start = 0
+        self.output_end = 0
+        # reassembly of fragmented messages
+        self.max_message_size = max_message_size
+        self.stream_consumer = stream_consumer
+        self.message = None
+        self.message_opcode = None
+        self.message_compressed = False
 
     def __enter__(self):
         return self
@@ -81,92 +159,246 @@ class Websocket:
     def __exit__(self, exc_type, exc, tb):
         self.close()
 
+    def set_metrics(self, metrics):
+        """
+        records the duration of poll() and write_frame() and the bytes per frame type in metrics
+        """
+        self.metrics = metrics
+        self.poll_time = metrics.histogram('websocket_poll_us')
+        self.write_time = metrics.histogram('websocket_write_frame_us')
+        self.bytes_in = metrics.labeled_counter('websocket_bytes_in', OPCODE_NAMES)
+        self.bytes_out = metrics.labeled_counter('websocket_bytes_out', OPCODE_NAMES)
+
     def poll(self):
+        """
+        polls the socket and returns a list with all messages completed by the read data
+        """
+        if self.metrics is None:
+            return self.poll_input()
+        started = utime.ticks_us()
+        try:
+            return self.poll_input()
+        finally:
+            self.poll_time.since(started)
+
+    def poll_input(self):
         res = self.poller.poll(1)
         if not res:
             return
-        fragment = None
         for sock, ev in res:
             if ev & (uselect.POLLHUP | uselect.POLLERR):
                 self._close()
                 raise ConnectionClosed()
-            fragment = sock.read()
-        if not fragment:
+        return self.read_input()
+
+    def read_input(self):
+        """
+        reads as much as fits into the input buffer and parses all complete frames
+        """
+        if self.input_end == len(self.input):
+            self.compact_input()
+        try:
+            count = self.sock.readinto(self.input_view[self.input_end:])
+        except OSError:
+            self._close()
+            raise ConnectionClosed()
+        if count is None:
+            # socket was readable, but there is no application data yet (e.g. tls records)
+            return
+        if not count:
             self._close()
             raise ConnectionClosed()
-        self.input += fragment
+        self.input_end += count
         return self.handle_input()
 
-    def handle_input(self):
+    def compact_input(self):
         """
-        parses message and looks if message is complete
+        moves an incomplete frame to the beginning of the input buffer
         """
-        position = 2
-        if len(self.input) < position:  # 2 start
-            return
-        two_bytes = self.input[0:2]
-        byte1, byte2 = struct.unpack('!BB', two_bytes)
+        remaining = self.input_end - self.input_start
+        if remaining:
+            self.input_view[0:remaining] = self.input_view[self.input_start:self.input_end]
+        self.input_start = 0
+        self.input_end = remaining
 
-        # Byte 1: FIN(1) _(1) _(1) _(1) OPCODE(4)
-        fin = bool(byte1 & 0x80)
-        opcode = byte1 & 0x0f
+    def writable(self):
+        """
+        returns True if the socket accepts data without blocking
+        """
+        return bool(self.write_poller.poll(0))
 
-        # Byte 2: MASK(1) LENGTH(7)
-        mask = bool(byte2 & (1 << 7))
-        length = byte2 & 0x7f
+    def handle_input(self):
+        """
+        parses all complete frames in the input buffer and returns their messages
+        """
+        messages = []
+        buf = self.input_view
+        while self.open:
+            start = self.input_start
+            available = self.input_end - start
+            if available < 2:
+                break
+
+            # Byte 1: FIN(1) RSV1(1) _(1) _(1) OPCODE(4)
+            fin = bool(buf[start] & 0x80)
+            compressed = bool(buf[start] & 0x40)
+            opcode = buf[start] & 0x0f
+
+            # Byte 2: MASK(1) LENGTH(7)
+            mask = bool(buf[start + 1] & 0x80)
+            length = buf[start + 1] & 0x7f
+
+            position = 2
+            if length == 126:  # Magic number, length header is 2 bytes
+                position = 4
+                if available < position:
+                    break
+                length, = struct.unpack_from('!H', buf, start + 2)
+            elif length == 127:  # Magic number, length header is 8 bytes
+                position = 10
+                if available < position:
+                    break
+                length, = struct.unpack_from('!Q', buf, start + 2)
+
+            if mask:  # Mask is 4 bytes
+                position += 4
+
+            if position + length > len(self.input):
+                # We can't receive this many bytes, close the socket
+                self.close(code=CLOSE_TOO_BIG)
+                break
+            if available < position + length:
+                if start + position + length > len(self.input):
+                    self.compact_input()
+                break
+
+            self.input_start = start + position + length
+            self.frames_received += 1
+            if self.metrics is not None:
+                self.bytes_in.inc(opcode, position + length)
+            data = buf[start + position:start + position + length]
+            if mask:
+                apply_mask(data, buf[start + position - 4:start + position])
+
+            message = self.handle_frame(fin, opcode, data, compressed)
+            if message is not None:
+                messages.append(message)
+
+        if self.input_start == self.input_end:
+            self.input_start = 0
+            self.input_end = 0
+        return messages
+
+    def handle_frame(self, fin, opcode, data, compressed=False):
+        """
+        handles a single frame, data is a memoryview into the input buffer
 
-        if length == 126:  # Magic number, length header is 2 bytes
-            position += 2
-            if len(self.input) < position: # 2 start bytes + 2 header bytes
+        Fragmented messages are reassembled up to max_message_size. If there is a stream_consumer, fragmented
+        messages are handed over frame by frame as stream_consumer(opcode, data, fin) instead, data is only valid
+        during the call then. Compressed messages (RSV1 of the first frame) are always reassembled.
+        """
+        if compressed and (self.deflate is None or opcode == OP_CONT or opcode >= OP_CLOSE):
+            # only the first frame of a data message may be compressed and only with permessage-deflate
+            self.close(code=CLOSE_PROTOCOL_ERROR)
+            return
+        if opcode >= OP_CLOSE:
+            # control frames may be interleaved with fragments, but must not be fragmented themselves
+            if not fin or len(data) > 125:
+                self.close(code=CLOSE_PROTOCOL_ERROR)
                 return
-            length, = struct.unpack('!H', self.input[2:4])
-        elif length == 127:  # Magic number, length header is 8 bytes
-            position += 8
-            if len(self.input) < position: # 2 start bytes + 8 header bytes
+            if opcode == OP_CLOSE:
+                self._close()
+                return
+            if opcode == OP_PONG:
+                if self.heartbeat is not None:
+                    self.heartbeat.pong_received(data)
                 return
-            length, = struct.unpack('!Q', self.input[2:10])
+            if opcode == OP_PING:
+                # We need to send a pong frame
+                self.write_frame(OP_PONG, data)
+                # And then wait to receive
+                return
+            # reserved control opcode
+            self.close(code=CLOSE_PROTOCOL_ERROR)
+            return
 
-        if mask:  # Mask is 4 bytes
-            position += 4
-            if len(self.input) < position:
+        if opcode == OP_CONT:
+            # This is a continuation of a previous frame
+            if self.message_opcode is None:
+                self.close(code=CLOSE_PROTOCOL_ERROR)
                 return
-            mask_bits = self.input[position - 4:position]
-        if len(self.input) < position + length:
+            opcode = self.message_opcode
+        elif opcode != OP_TEXT and opcode != OP_BYTES:
+            # reserved data opcode
+            self.close(code=CLOSE_PROTOCOL_ERROR)
+            return
+        elif self.message_opcode is not None:
+            # a new message must not start before the last fragment of the current one
+            self.close(code=CLOSE_PROTOCOL_ERROR)
+            return
+        elif fin:
+            if compressed:
+                data = self.inflate(data)
+                if data is None:
+                    return
+            return self.decode_message(opcode, data)
+        else:
+            self.message_compressed = compressed
+
+        self.message_opcode = None if fin else opcode
+        if self.stream_consumer is not None and not self.message_compressed:
+            self.stream_consumer(opcode, data, fin)
+            return
+
+        if self.message is None:
+            self.message = bytearray()
+        if len(self.message) + len(data) > self.max_message_size:
+            self.discard_message()
+            self.close(code=CLOSE_TOO_BIG)
             return
         try:
-            data = self.input[position:position + length]
-            self.input = self.input[position + length:]
+            self.message.extend(data)
         except MemoryError:
             # We can't receive this many bytes, close the socket
+            self.discard_message()
             self.close(code=CLOSE_TOO_BIG)
             return
-
-        if mask:
-            data = bytes(b ^ mask_bits[i % 4] for i, b in enumerate(data))
-
         if not fin:
-            raise NotImplementedError()
+            return
+        message = self.message
+        self.message = None
+        if self.message_compressed:
+            self.message_compressed = False
+            message = self.inflate(message)
+            if message is None:
+                return
+        return self.decode_message(opcode, message)
 
+    def inflate(self, data):
+        """
+        decompresses a message, the connection is closed if that fails
+        """
+        try:
+            return self.deflate.decompress(data, self.max_message_size)
+        except (ValueError, OSError):
+            self.close(code=CLOSE_BAD_DATA)
+
+    def decode_message(self, opcode, data):
+        """
+        returns a text message as str and a binary one as bytes, the connection is closed if the text isn't utf-8
+        """
         if opcode == OP_TEXT:
-            return data.decode('utf-8')
-        if opcode == OP_BYTES:
-            return data
-        if opcode == OP_CLOSE:
-            self._close()
-            return
-        if opcode == OP_PONG:
-            # Ignore this frame, keep waiting for a data frame
-            return
-        if opcode == OP_PING:
-            # We need to send a pong frame
-            self.write_frame(OP_PONG, data)
-            # And then wait to receive
-            return
-        if opcode == OP_CONT:
-            # This is a continuation of a previous frame
-            raise NotImplementedError(opcode)
-        raise ValueError(opcode)
+            try:
+                return str(data, 'utf-8')
+            except UnicodeError:
+                self.close(code=CLOSE_BAD_DATA)
+                return
+        return bytes(data)
 
+    def discard_message(self):
+        self.message = None
+        self.message_opcode = None
+        self.message_compressed = False
 
     def read_frame(self):
         two_bytes = None
@@ -210,51 +442,186 @@ class Websocket:
             return True, OP_CLOSE, None
 
         if mask:
-            data = bytes(b ^ mask_bits[i % 4] for i, b in enumerate(data))
+            data = bytearray(data)
+            apply_mask(data, mask_bits)
 
         return fin, opcode, data
 
-    def write_frame(self, opcode, data=b''):
+    def write_frame(self, opcode, data=b'', flush=True):
         """
         Write a frame to the socket.
         See https://tools.ietf.org/html/rfc6455#section-5.2 for the details.
+
+        The frame is serialized into the output buffer and written with a single call. With flush=False it stays in
+        the output buffer until flush(), so several frames share one write (and one tls record).
         """
+        if self.metrics is not None:
+            started = utime.ticks_us()
         fin = True
         mask = self.is_client  # messages sent by client are masked
 
+        compressed = None
+        if self.deflate is not None and (opcode == OP_TEXT or opcode == OP_BYTES):
+            compressed = self.deflate.compress(data)
+            if compressed is not None:
+                data = compressed
+
         length = len(data)
 
         # Frame header
-        # Byte 1: FIN(1) _(1) _(1) _(1) OPCODE(4)
+        # Byte 1: FIN(1) RSV1(1) _(1) _(1) OPCODE(4)
         byte1 = 0x80 if fin else 0
         byte1 |= opcode
+        if compressed is not None:
+            byte1 |= 0x40
 
         # Byte 2: MASK(1) LENGTH(7)
         byte2 = 0x80 if mask else 0
 
         if length < 126:  # 126 is magic value to use 2-byte length header
             byte2 |= length
-            self.sock.write(struct.pack('!BB', byte1, byte2))
-
+            header_length = 2
         elif length < (1 << 16):  # Length fits in 2-bytes
             byte2 |= 126  # Magic code
-            self.sock.write(struct.pack('!BBH', byte1, byte2, length))
-
+            header_length = 4
         elif length < (1 << 64):
             byte2 |= 127  # Magic code
-            self.sock.write(struct.pack('!BBQ', byte1, byte2, length))
-
+            header_length = 10
         else:
             raise ValueError()
 
         if mask:  # Mask is 4 bytes
-            mask_bits = struct.pack('!I', random.getrandbits(32))
-            self.sock.write(mask_bits)
+            header_length += 4
+        frame_length = header_length + length
+
+        if self.output_end + frame_length > len(self.output):
+            self.flush()
+        if frame_length > len(self.output):
+            # frame is larger than the output buffer
+            buf = memoryview(bytearray(frame_length))
+            start = 0
+        else:
+            buf = self.output_view
+            start = self.output_end
+
+        buf[start] = byte1
+        buf[start + 1] = byte2
+        if (byte2 & 0x7f) == 126:
+            struct.pack_into('!H', buf, start + 2, length)
+        elif (byte2 & 0x7f) == 127:
+            struct.pack_into('!Q', buf, start + 2, length)
+        payload_start = start + header_length
+        payload = buf[payload_start:payload_start + length]
+        payload[:] = data
 
-            data = bytes(b ^ mask_bits[i % 4]
-                         for i, b in enumerate(data))
+        if mask:
+            # two 16 bit values stay small ints on 32 bit ports
+            struct.pack_into('!HH', buf, payload_start - 4, random.getrandbits(16), random.getrandbits(16))
+            apply_mask(payload, buf[payload_start - 4:payload_start])
+
+        if buf is not self.output_view:
+            self.write_all(buf)
+        else:
+            self.output_end += frame_length
+            if flush:
+                self.flush()
+        if self.metrics is not None:
+            self.bytes_out.inc(opcode, frame_length)
+            self.write_time.since(started)
+
+    def write_frame_from(self, opcode, writer, argument, flush=True):
+        """
+        Write a masked frame whose payload is written by writer(buf, position, argument) straight into the output
+        buffer. writer returns the end position and raises IndexError if the payload doesn't fit.
 
-        self.sock.write(data)
+        The payload is written behind room for the longest header below 64 KiB and moved to the actual header length
+        while it's masked, so nothing is allocated unless permessage-deflate is active. Returns False if the payload
+        doesn't fit into the empty output buffer, the caller has to build it with write_frame() then.
+        """
+        if self.metrics is not None:
+            started = utime.ticks_us()
+        buf = self.output
+        start = self.output_end
+        while True:
+            # 4 bytes header with 16 bit length and 4 bytes mask
+            source = start + 8
+            try:
+                end = writer(buf, source, argument)
+                break
+            except IndexError:
+                if not start:
+                    return False
+                self.flush()
+                start = 0
+        if self.deflate is not None:
+            # compressing needs a new buffer anyway
+            self.write_frame(opcode, bytes(buf[source:end]), flush)
+            return True
+        length = end - source
+        if length < 126:
+            buf[start + 1] = 0x80 | length
+            mask_position = start + 2
+        else:
+            buf[start + 1] = 0x80 | 126
+            struct.pack_into('!H', buf, start + 2, length)
+            mask_position = start + 4
+        buf[start] = 0x80 | opcode
+        struct.pack_into('!HH', buf, mask_position, random.getrandbits(16), random.getrandbits(16))
+        move_masked(buf, mask_position + 4, source, length, mask_position)
+        frame_length = mask_position + 4 + length - start
+        self.output_end = start + frame_length
+        if flush:
+            self.flush()
+        if self.metrics is not None:
+            self.bytes_out.inc(opcode, frame_length)
+            self.write_time.since(started)
+        return True
+
+    def flush(self):
+        """
+        writes all buffered frames to the socket
+        """
+        if self.output_end:
+            self.write_all(self.output, self.output_end, self.output_start)
+            self.output_start = 0
+            self.output_end = 0
+
+    def write_pending(self):
+        """
+        writes as much of the buffered frames as the socket takes without blocking and returns True once all of them
+        are written, so an event loop can wait for the socket to become writable in between
+        """
+        if self.output_start < self.output_end:
+            try:
+                count = self.sock.write(self.output, self.output_start, self.output_end - self.output_start)
+            except OSError:
+                if self.open:
+                    self._close()
+                raise ConnectionClosed()
+            if count:
+                self.output_start += count
+            if self.output_start < self.output_end:
+                return False
+        self.output_start = 0
+        self.output_end = 0
+        return True
+
+    def write_all(self, buf, length=None, position=0):
+        """
+        writes buf from position up to length, write(buf, offset, size) of the micropython streams doesn't need a
+        memoryview slice for the remaining data
+        """
+        if length is None:
+            length = len(buf)
+        while position < length:
+            try:
+                count = self.sock.write(buf, position, length - position)
+            except OSError:
+                if self.open:
+                    self._close()
+                raise ConnectionClosed()
+            if count:
+                position += count
 
     def recv(self):
         """
@@ -276,31 +643,11 @@ class Websocket:
                 self._close()
                 raise ConnectionClosed()
 
-            if not fin:
-                raise NotImplementedError()
+            message = self.handle_frame(fin, opcode, data)
+            if message is not None:
+                return message
 
-            if opcode == OP_TEXT:
-                return data.decode('utf-8')
-            elif opcode == OP_BYTES:
-                return data
-            elif opcode == OP_CLOSE:
-                self._close()
-                return
-            elif opcode == OP_PONG:
-                # Ignore this frame, keep waiting for a data frame
-                continue
-            elif opcode == OP_PING:
-                # We need to send a pong frame
-                self.write_frame(OP_PONG, data)
-                # And then wait to receive
-                continue
-            elif opcode == OP_CONT:
-                # This is a continuation of a previous frame
-                raise NotImplementedError(opcode)
-            else:
-                raise ValueError(opcode)
-
-    def send(self, buf):
+    def send(self, buf, flush=True):
         """Send data to the websocket."""
 
         assert self.open
@@ -313,7 +660,11 @@ class Websocket:
         else:
             raise TypeError()
 
-        self.write_frame(opcode, buf)
+        self.write_frame(opcode, buf, flush)
+
+    def ping(self, data=b''):
+        """Send a ping frame, the server answers with a pong."""
+        self.write_frame(OP_PING, data)
 
     def close(self, code=CLOSE_OK, reason=''):
         """Close the websocket."""
@@ -329,4 +680,5 @@ class Websocket:
         print('closed!')
         self.open = False
         self.poller.unregister(self.sock)
+        self.write_poller.unregister(self.sock)
         self.sock.close()
@@ -0,0 +1,99 @@
+"""
+Helpers for the benchmarks, which are run from the repository root with the unix port of micropython or with
+cpython, e.g.
+micropython benchmarks/frame_parser.py
+python3 benchmarks/frame_parser.py
+
+On cpython the micropython modules are taken from sim/shims and the allocations are measured with tracemalloc, so
+only numbers of the same implementation can be compared.
+"""
+import gc
+import io
+import sys
+
+if sys.implementation.name != 'micropython':
+    import builtins
+    import tracemalloc
+    builtins.const = lambda value: value
+    sys.path.insert(0, 'sim/shims')
+else:
+    tracemalloc = None
+
+from utime import ticks_us, ticks_diff  # noqa: E402
+
+
+class FakeSocket(io.IOBase):
+    """
+    in-memory socket which replays incoming data in chunks and collects written data
+    """
+    def __init__(self, incoming=b'', chunk_size=512):
+        self.incoming = memoryview(incoming)
+        self.chunk_size = chunk_size
+        self.position = 0
+        self.written = 0
+
+    def setblocking(self, flag):
+        pass
+
+    def fileno(self):
+        # select.poll on cpython needs a file descriptor, the benchmarks don't poll
+        return sys.stdout.fileno()
+
+    def ioctl(self, request, arg):
+        # MP_STREAM_POLL: always readable and writable
+        if request == 3:
+            return arg & 5
+        return 0
+
+    def readinto(self, buf):
+        if not self.incoming:
+            return 0
+        count = min(len(buf), self.chunk_size, len(self.incoming) - self.position)
+        buf[0:count] = self.incoming[self.position:self.position + count]
+        self.position = (self.position + count) % len(self.incoming)
+        return count
+
+    def write(self, buf, offset=0, size=None):
+        count = len(buf) - offset if size is None else size
+        self.written += count
+        return count
+
+    def close(self):
+        pass
+
+
+def measure(name, func, iterations, unit='op', verbose=True):
+    """
+    runs func iterations times and prints throughput and allocated bytes per operation
+    """
+    gc.collect()
+    gc.disable()
+    alloc_before = gc.mem_alloc() if hasattr(gc, 'mem_alloc') else 0
+    start = ticks_us()
+    for _ in range(iterations):
+        func()
+    duration = ticks_diff(ticks_us(), start)
+    alloc = gc.mem_alloc() - alloc_before if hasattr(gc, 'mem_alloc') else 0
+    gc.enable()
+    if tracemalloc is not None:
+        alloc = allocated_cpython(func, iterations)
+    ops = iterations * 1000000 / duration if duration else 0
+    if verbose:
+        print('%-40s %10d %s/s %8d B/%s' % (name, ops, unit, alloc // iterations, unit))
+    return ops, alloc / iterations
+
+
+def allocated_cpython(func, iterations):
+    """
+    sum of the peak heap growth of the calls, a separate run because tracing slows down the calls
+    """
+    traced = min(iterations, 100)
+    tracemalloc.start()
+    alloc = 0
+    for _ in range(traced):
+        tracemalloc.reset_peak()
+        current = tracemalloc.get_traced_memory()[0]
+        func()
+        alloc += tracemalloc.get_traced_memory()[1] - current
+    tracemalloc.stop()
+    return alloc * iterations // traced
@@ -0,0 +1,32 @@
+"""
+Benchmark of permessage-deflate: bytes saved and the compression/decompression time per message for the typical json
+messages at different window sizes, to decide per site whether WEBSOCKET_DEFLATE pays off.
+"""
+import sys
+sys.path.append('.')
+
+from benchmarks.common import measure
+from benchmarks.message_encoding import messages
+from app.message_codec import encode_json
+from app.websocket_deflate import PerMessageDeflate
+
+
+def run():
+    for window_bits in (9, 10, 12, 15):
+        extension = PerMessageDeflate(window_bits, window_bits)
+        print('window bits %d' % window_bits)
+        for message in messages:
+            payload = encode_json(message).encode()
+            compressed = extension.compress(payload)
+            if compressed is None:
+                print('  %-26s %4d B, sent uncompressed' % (message[0], len(payload)))
+                continue
+            print('  %-26s %4d B -> %4d B (%d%% saved)' % (
+                message[0], len(payload), len(compressed), 100 - len(compressed) * 100 // len(payload)
+            ))
+            measure('    compress', lambda: extension.compress(payload), 100, 'msg')
+            measure('    decompress', lambda: extension.decompress(compressed, 8192), 100, 'msg')
+
+
+if __name__ == '__main__':
+    run()
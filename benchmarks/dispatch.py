@@ -0,0 +1,39 @@
+"""
+Benchmark of the message dispatch: the former getattr lookup of 'handle%sR%s' methods on a new object per message
+against the handler registry.
+"""
+import sys
+sys.path.append('.')
+
+from benchmarks.common import measure
+from app.dispatch import HandlerRegistry
+
+
+class GetattrDispatch:
+    def __init__(self, message_type, state):
+        self.type = message_type
+        self.state = state
+        if hasattr(self, 'handle%sR%s' % (self.type, self.state[1:])):
+            getattr(self, 'handle%sR%s' % (self.type, self.state[1:]))()
+
+    def handleRemoteChangeResourceStatusRequest(self):
+        pass
+
+
+handlers = HandlerRegistry()
+
+
+@handlers.register('RemoteChangeResourceStatus')
+def handle_remote_change_resource_status(uid, data):
+    pass
+
+
+def run():
+    data = {'status': 'open'}
+    measure('getattr dispatch', lambda: GetattrDispatch('RemoteChangeResourceStatus', 'request'), 2000, 'msg')
+    measure('registry dispatch', lambda: handlers.dispatch('RemoteChangeResourceStatus', 'request', '', data), 2000, 'msg')
+    measure('registry miss', lambda: handlers.dispatch('Unknown', 'request', '', data), 2000, 'msg')
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,83 @@
+"""
+Benchmark of the firmware delivery: a 64 KiB file is pushed through FirmwareReceiver.write_chunk() in chunk frames
+like the server sends them, once straight through and once with a lost connection in the middle, after which the
+server resumes at the offset of the FirmwareUpdate reply. The files are installed to ./firmware-benchmark, the
+script fails if the result doesn't match the sent file.
+"""
+import sys
+sys.path.append('.')
+
+from benchmarks.common import measure
+import uos
+import uhashlib
+import ustruct as struct
+from ubinascii import hexlify
+from app.firmware import FirmwareReceiver, CHUNK_MARKER
+
+DIRECTORY = 'firmware-benchmark'
+SIZE = 65536
+firmware = bytes((i * 7 + (i >> 8)) & 0xff for i in range(SIZE))
+request = {
+    'version': 'benchmark',
+    'files': [{'path': 'main.py', 'size': SIZE, 'sha256': hexlify(uhashlib.sha256(firmware).digest()).decode()}]
+}
+
+
+def chunk_frame(offset, size):
+    frame = bytearray(struct.pack('!BBI', CHUNK_MARKER, 0, offset))
+    frame.extend(firmware[offset:offset + size])
+    return frame
+
+
+def transfer(receiver, drop_at=None):
+    """
+    sends the file like the server, with the window of unacknowledged chunks of the reply
+    """
+    reply = receiver.start(request)
+    frames = [chunk_frame(offset, reply['chunk_size']) for offset in range(0, SIZE, reply['chunk_size'])]
+    acknowledged = reply['offset']
+    while True:
+        # chunks in flight, the acks are handled one by one like the server receives them
+        window = [
+            frames[offset // reply['chunk_size']]
+            for offset in range(acknowledged, min(SIZE, acknowledged + reply['window'] * reply['chunk_size']),
+                                reply['chunk_size'])
+        ]
+        for frame in window:
+            progress = receiver.write_chunk(frame)
+            if progress['done']:
+                return progress
+            if drop_at is not None and progress['offset'] >= drop_at:
+                # the connection is lost with unacknowledged chunks, the server asks where to resume
+                drop_at = None
+                reply = receiver.start(request)
+                acknowledged = reply['offset']
+                break
+            acknowledged = progress['offset']
+
+
+def check():
+    with open('%s/main.py' % DIRECTORY, 'rb') as received:
+        if received.read() != firmware:
+            print('received file differs')
+            sys.exit(1)
+
+
+def run():
+    try:
+        for name, drop_at in (('transfer 64 KiB', None), ('transfer 64 KiB with reconnect', SIZE // 2)):
+            def push():
+                receiver = FirmwareReceiver(DIRECTORY)
+                if not transfer(receiver, drop_at)['done']:
+                    print('transfer not done')
+                    sys.exit(1)
+            ops, alloc = measure(name, push, 5, 'transfer')
+            print('%-40s %10d KiB/s' % ('', ops * SIZE // 1024))
+            check()
+    finally:
+        uos.remove('%s/main.py' % DIRECTORY)
+        uos.rmdir(DIRECTORY)
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,27 @@
+"""
+Benchmark of the incoming frame parser: throughput and allocated bytes per frame for bursts of small text frames.
+"""
+import sys
+sys.path.append('.')
+
+from benchmarks.common import FakeSocket, measure
+import ustruct as struct
+from app.websocket_protocol import Websocket
+
+
+def text_frame(payload):
+    return struct.pack('!BB', 0x81, len(payload)) + payload
+
+
+def run():
+    payload = b'{"state": "request", "type": "RemoteChangeResourceStatus", "uid": "0123456789abcdef", "data": {}}'
+    frame = text_frame(payload)
+    for burst in (1, 8, 16):
+        sock = FakeSocket(frame * burst, chunk_size=len(frame) * burst)
+        websocket = Websocket(sock, 0.1)
+        ops, alloc = measure('read_input, burst of %d frames' % burst, websocket.read_input, 500, 'read')
+        print('%-40s %10d frames/s %8d B/frame' % ('', ops * burst, alloc / burst))
+
+
+if __name__ == '__main__':
+    run()
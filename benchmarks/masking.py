@@ -0,0 +1,28 @@
+"""
+Benchmark of the payload masking: the former generator expression against the pure python and the viper
+implementation at different payload sizes.
+"""
+import sys
+sys.path.append('.')
+
+from benchmarks.common import measure
+from app.websocket_mask import mask_python, mask_viper
+
+
+def mask_generator(data, mask_bits):
+    return bytes(b ^ mask_bits[i % 4] for i, b in enumerate(data))
+
+
+def run():
+    mask_bits = b'\x12\x34\x56\x78'
+    for size in (64, 1024, 16384):
+        buf = bytearray(size)
+        iterations = max(2, 65536 // size)
+        measure('generator %d B' % size, lambda: mask_generator(buf, mask_bits), iterations, 'mask')
+        measure('python %d B' % size, lambda: mask_python(buf, mask_bits), iterations, 'mask')
+        if mask_viper is not None:
+            measure('viper %d B' % size, lambda: mask_viper(buf, size, mask_bits), iterations, 'mask')
+
+
+if __name__ == '__main__':
+    run()
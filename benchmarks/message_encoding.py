@@ -0,0 +1,42 @@
+"""
+Benchmark of the json and the compact binary message encoding: encode/decode throughput and encoded size of typical
+messages.
+"""
+import sys
+sys.path.append('.')
+
+from benchmarks.common import measure
+from app.message_codec import encode_json, decode_json, encode_binary, decode_binary
+
+uid = '0123456789abcdef0123456789abcdef'
+messages = [
+    ('DoorStatus', 'request', uid, {'status': True}),
+    ('ResourceStatusChange', 'request', uid, {'status': 'opening', 'resource_uid': 'door-1'}),
+    ('RemoteChangeResourceStatus', 'reply', uid, {}),
+    ('BootNotification', 'request', uid, {
+        'sysname': 'esp32',
+        'nodename': 'esp32',
+        'release': '1.15.0',
+        'version': 'v1.15 on 2021-04-18',
+        'machine': 'ESP32 module with ESP32',
+        'ip': '192.168.1.23',
+        'subnet': '255.255.255.0',
+        'gateway': '192.168.1.1',
+        'dns': '192.168.1.1'
+    }),
+]
+
+
+def run():
+    for message in messages:
+        encoded_json = encode_json(message)
+        encoded_binary = bytes(encode_binary(message))
+        print('%s: json %d B, binary %d B' % (message[0], len(encoded_json), len(encoded_binary)))
+        measure('  encode json', lambda: encode_json(message), 200)
+        measure('  encode binary', lambda: encode_binary(message), 200)
+        measure('  decode json', lambda: decode_json(encoded_json), 200)
+        measure('  decode binary', lambda: decode_binary(encoded_binary), 200)
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,35 @@
+"""
+Benchmark of the steady state send path: 10000 DoorStatus messages through the former path (encode_json() and
+Websocket.send()) and through Websocket.write_frame_from() with write_json(). On the unix port of micropython the
+allocations are counted with gc.mem_alloc() and a disabled gc, the script fails if the new path allocates.
+"""
+import sys
+sys.path.append('.')
+
+from benchmarks.common import FakeSocket, measure
+from app.message_codec import encode_json, write_json, new_uid
+from app.websocket_protocol import Websocket, OP_TEXT
+
+SENDS = 10000
+
+
+def run():
+    websocket = Websocket(FakeSocket(), 0.1)
+    message = ('DoorStatus', 'request', new_uid(), {'status': True, 'resource_uid': 'door-1'})
+    measure('encode_json + send', lambda: websocket.send(encode_json(message)), SENDS, 'msg')
+    # the first frame may still grow the heap, e.g. by interning strings
+    websocket.write_frame_from(OP_TEXT, write_json, message)
+    ops, alloc = measure(
+        'write_frame_from + write_json',
+        lambda: websocket.write_frame_from(OP_TEXT, write_json, message),
+        SENDS,
+        'msg'
+    )
+    measure('new_uid', new_uid, SENDS, 'uid')
+    if sys.implementation.name == 'micropython' and alloc:
+        print('write_frame_from allocated %d B in %d sends' % (alloc * SENDS, SENDS))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,44 @@
+"""
+Benchmark of the import time and heap usage of the modules which can be imported without hardware. Run it once
+against the sources and once against the output of build.sh (built with the architecture of the unix port):
+micropython benchmarks/startup.py
+MPY_CROSS=mpy-cross ./build.sh x64 && micropython benchmarks/startup.py dist
+"""
+import sys
+sys.path.append('.')
+
+import gc
+from utime import ticks_us, ticks_diff
+
+modules = [
+    'app.websocket_mask',
+    'app.websocket_protocol',
+    'app.send_queue',
+    'app.heartbeat',
+    'app.connection_cache',
+]
+
+
+def run(source):
+    sys.path.insert(0, source)
+    total_duration = 0
+    total_alloc = 0
+    for module in modules:
+        gc.collect()
+        gc.disable()
+        alloc_before = gc.mem_alloc()
+        start = ticks_us()
+        __import__(module)
+        duration = ticks_diff(ticks_us(), start)
+        # with a disabled gc this includes the transient allocations of the compiler, so it's the peak heap usage
+        alloc = gc.mem_alloc() - alloc_before
+        gc.enable()
+        gc.collect()
+        total_duration += duration
+        total_alloc += alloc
+        print('%-30s %8d us %8d B peak %8d B retained' % (module, duration, alloc, gc.mem_alloc() - alloc_before))
+    print('%-30s %8d us %8d B peak' % ('total (%s)' % source, total_duration, total_alloc))
+
+
+if __name__ == '__main__':
+    run(sys.argv[1] if len(sys.argv) > 1 else '.')
@@ -0,0 +1,170 @@
+"""
+Benchmarks of the hot paths with a stored baseline per implementation (benchmarks/baseline.json), run from the
+repository root:
+micropython benchmarks/suite.py
+python3 benchmarks/suite.py [--threshold 0.3] [--update]
+
+Exits with status 1 if the throughput of a path drops or its allocations grow by more than the threshold (a fraction,
+default DEFAULT_THRESHOLD) against the baseline. --update stores the results as the new baseline together with
+the interpreter version. The baseline depends on the machine, so update it on the machine which runs the comparison.
+"""
+import sys
+sys.path.append('.')
+
+from benchmarks.common import FakeSocket, measure
+import ujson
+import ustruct as struct
+from app.config_defaults import Config
+from app.dispatch import HandlerRegistry
+from app.reply_cache import ReplyCache
+from app.send_queue import SendQueue
+from app.websocket_protocol import Websocket, OP_TEXT
+
+BASELINE_PATH = 'benchmarks/baseline.json'
+DEFAULT_THRESHOLD = 0.3
+# allocations are compared with this absolute slack in bytes per operation, small numbers vary between runs
+ALLOCATION_SLACK = 16
+# the best of the repetitions is compared, which filters out most of the noise of the machine
+REPETITIONS = 3
+
+PAYLOAD = b'{"state": "request", "type": "RemoteChangeResourceStatus", "uid": "0123456789abcdef", "data": {}}'
+
+
+class BenchmarkConfig(Config):
+    def __init__(self, data):
+        self.data = data
+
+
+class BenchmarkExtensions:
+    """
+    stands in for app.extensions, which connects on import
+    """
+    def __init__(self):
+        with open('config_dist.json') as config_file:
+            self.config = BenchmarkConfig(ujson.load(config_file))
+        self.websocket_send_queue = SendQueue(32)
+        self.websocket_send_event = None
+        self.reply_cache = ReplyCache(self.config.REPLY_CACHE_SIZE)
+
+
+def frame_parse():
+    frame = struct.pack('!BB', 0x81, len(PAYLOAD)) + PAYLOAD
+    websocket = Websocket(FakeSocket(frame * 8, chunk_size=len(frame) * 8), 0.1)
+    return websocket.read_input, 500, 'read'
+
+
+def write_frame():
+    websocket = Websocket(FakeSocket(), 0.1)
+    return lambda: websocket.write_frame(OP_TEXT, PAYLOAD), 1000, 'frame'
+
+
+def websocket_send():
+    from app.message_codec import write_json
+    from app.websocket import websocket_send
+    send_queue = sys.modules['app.extensions'].websocket_send_queue
+    websocket = Websocket(FakeSocket(), 0.1)
+
+    def send():
+        websocket_send('DoorStatus', 'request', {'status': True, 'resource_uid': 'door-1'})
+        websocket.write_frame_from(OP_TEXT, write_json, send_queue.pop())
+    return send, 1000, 'msg'
+
+
+def dispatch():
+    handlers = HandlerRegistry()
+    handlers.register('RemoteChangeResourceStatus')(lambda uid, data: None)
+    data = {'status': 'open'}
+    return lambda: handlers.dispatch('RemoteChangeResourceStatus', 'request', '', data), 2000, 'msg'
+
+
+def config_access():
+    config = sys.modules['app.extensions'].config
+    return lambda: (config.WEBSOCKET_PORT, config.WEBSOCKET_PATH), 2000, 'access'
+
+
+cases = [
+    ('frame parse, burst of 8 frames', frame_parse),
+    ('write_frame with masking', write_frame),
+    ('websocket_send with json frame', websocket_send),
+    ('handler dispatch', dispatch),
+    ('config property access', config_access),
+]
+
+
+def run_case(name, setup):
+    func, iterations, unit = setup()
+    best_ops = 0
+    best_alloc = None
+    for _ in range(REPETITIONS):
+        ops, alloc = measure(name, func, iterations, unit, verbose=False)
+        best_ops = max(best_ops, ops)
+        best_alloc = alloc if best_alloc is None else min(best_alloc, alloc)
+    return {'ops': int(best_ops), 'alloc': int(best_alloc), 'unit': unit}
+
+
+def compare(result, baseline, threshold):
+    """
+    returns the status of a result against its baseline
+    """
+    if baseline is None:
+        return 'no baseline'
+    if result['ops'] < baseline['ops'] * (1 - threshold):
+        return 'REGRESSION (%d%% slower)' % (100 - result['ops'] * 100 // baseline['ops'])
+    if result['alloc'] > baseline['alloc'] * (1 + threshold) + ALLOCATION_SLACK:
+        return 'REGRESSION (%d B more)' % (result['alloc'] - baseline['alloc'])
+    return 'ok'
+
+
+def load_baselines():
+    try:
+        with open(BASELINE_PATH) as baseline_file:
+            return ujson.load(baseline_file)
+    except OSError:
+        return {}
+
+
+def run(threshold=DEFAULT_THRESHOLD, update=False):
+    sys.modules['app.extensions'] = BenchmarkExtensions()
+    implementation = sys.implementation.name
+    baselines = load_baselines()
+    baseline = baselines.get(implementation, {})
+    interpreter = sys.version
+    if baseline.get('interpreter', interpreter) != interpreter:
+        print('baseline was measured with %s' % baseline['interpreter'])
+    results = {'interpreter': interpreter}
+    regressions = 0
+    for name, setup in cases:
+        result = run_case(name, setup)
+        results[name] = result
+        status = compare(result, baseline.get(name), threshold)
+        if status.startswith('REGRESSION'):
+            regressions += 1
+        print('%-40s %10d %s/s %8d B/%s   %s' % (
+            name, result['ops'], result['unit'], result['alloc'], result['unit'], status))
+    if update:
+        baselines[implementation] = results
+        with open(BASELINE_PATH, 'w') as baseline_file:
+            baseline_file.write(ujson.dumps(baselines))
+        print('baseline for %s updated' % implementation)
+        return 0
+    return 1 if regressions else 0
+
+
+def parse_args(args):
+    threshold = DEFAULT_THRESHOLD
+    update = False
+    position = 0
+    while position < len(args):
+        if args[position] == '--update':
+            update = True
+        elif args[position] == '--threshold':
+            position += 1
+            threshold = float(args[position])
+        else:
+            raise SystemExit('usage: suite.py [--threshold 0.3] [--update]')
+        position += 1
+    return threshold, update
+
+
+if __name__ == '__main__':
+    sys.exit(run(*parse_args(sys.argv[1:])))
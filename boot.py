@@ -3,7 +3,11 @@ import os
 # check if there is an update
 try:
     os.stat('/next')
-    os.rename('/app/config.py', '/next/config.py')
+    try:
+        # the local overrides of the config, see app/config.py
+        os.rename('/app/config.py', '/next/config.py')
+    except OSError:
+        pass
     os.rename('/app', '/old')
     os.rename('/next', '/app')
     for old_file in os.listdir('/old'):
@@ -0,0 +1,29 @@
+#!/bin/bash
+
+# compiles app/*.py to dist/app/*.mpy with mpy-cross, ./update.sh prefers them.
+# The mpy-cross version has to match the firmware, the architecture defaults to the ESP32 (needed for viper code).
+# update-file-list keeps listing the sources, dist/ isn't committed. A release which ships the compiled modules over
+# the air has to commit dist/ and list dist/app/<name>.mpy in update-file-list, see app/update.py.
+ARCH=${1:-"xtensawin"}
+MPY_CROSS=${MPY_CROSS:-"mpy-cross"}
+
+if ! command -v $MPY_CROSS > /dev/null; then
+  echo "$MPY_CROSS not found"
+  exit 1
+fi
+
+rm -rf dist
+mkdir -p dist/app
+
+# boot.py is executed directly and config.py is carried over by boot.py on updates, so they stay plain python
+for file in app/*.py; do
+  name=$(basename $file .py)
+  if [ "$name" == "__init__" ] || [ "$name" == "config" ]; then
+    continue
+  fi
+  echo "compile $file"
+  $MPY_CROSS -march=$ARCH -o dist/app/$name.mpy $file || exit 1
+done
+
+echo "$(git describe --tags --always --dirty) $($MPY_CROSS --version)" > dist/version
+cat dist/version
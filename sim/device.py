@@ -0,0 +1,149 @@
+"""
+virtual device which runs the unmodified app modules, app.main.main_loop() included
+
+The app modules keep their state in module globals (app.extensions and the modules which import from it), so every
+device imports its own copy of the app package, with its own copy of sim.hardware behind app.hal. While a device is
+imported, the app and sim modules are swapped out of sys.modules and the device's modules are taken out again
+afterwards, so they only reference each other. The flash file system of a device is a directory: its modules get an
+open() and a uos module which resolve the absolute paths in there.
+"""
+import builtins
+import importlib.abc
+import importlib.machinery
+import os
+import sys
+import threading
+import types
+
+# the packages which are imported once per device, the shims of sim/shims stay shared
+ISOLATED = ('app', 'sim', 'uos')
+# imported ahead because main_loop() imports it on demand, which would pick up the copy of another device
+IMPORTS = ('app.extensions', 'app.main', 'app.main_async')
+
+
+def isolated(name):
+    return any(name == package or name.startswith(package + '.') for package in ISOLATED)
+
+
+class FileSystem:
+    """
+    the flash file system of a device in the directory root
+    """
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, path):
+        return os.path.join(self.root, path.lstrip('/'))
+
+    def open(self, path, *args, **kwargs):
+        return builtins.open(self.path(path), *args, **kwargs)
+
+    def module(self, uname):
+        """
+        a uos module for the device
+        """
+        uos = types.ModuleType('uos')
+        uos.stat = lambda path: os.stat(self.path(path))
+        uos.remove = lambda path: os.remove(self.path(path))
+        uos.rename = lambda old, new: os.rename(self.path(old), self.path(new))
+        uos.listdir = lambda path='/': os.listdir(self.path(path))
+        uos.mkdir = lambda path: os.mkdir(self.path(path))
+        uos.rmdir = lambda path: os.rmdir(self.path(path))
+        uos.urandom = os.urandom
+        uos.uname = lambda: uname
+        return uos
+
+
+class DeviceLoader(importlib.abc.Loader):
+    """
+    executes a module of the device with its open(), the code objects are shared by all devices like frozen bytecode
+    """
+    code = {}
+
+    def __init__(self, loader, file_system):
+        self.loader = loader
+        self.file_system = file_system
+
+    def create_module(self, spec):
+        return None
+
+    def exec_module(self, module):
+        name = module.__spec__.name
+        if name not in self.code:
+            self.code[name] = self.loader.get_code(name)
+        module.open = self.file_system.open
+        exec(self.code[name], module.__dict__)
+
+
+class DeviceFinder(importlib.abc.MetaPathFinder):
+    def __init__(self, file_system):
+        self.file_system = file_system
+
+    def find_spec(self, name, path, target=None):
+        if not isolated(name):
+            return None
+        spec = importlib.machinery.PathFinder.find_spec(name, path)
+        if spec is not None:
+            spec.loader = DeviceLoader(spec.loader, self.file_system)
+        return spec
+
+
+class VirtualDevice:
+    """
+    imports the app modules for one device, which boots it up to the open websocket connection like on the board
+    """
+    def __init__(self, root, config, uname):
+        self.config = config
+        self.file_system = FileSystem(root)
+        self.uname = uname
+        self.modules = {}
+        self.thread = None
+
+    def boot(self):
+        """
+        imports app.extensions, which associates with the simulated wifi and connects the websocket
+        """
+        finder = DeviceFinder(self.file_system)
+        saved = {name: sys.modules.pop(name) for name in list(sys.modules) if isolated(name)}
+        sys.modules['uos'] = self.file_system.module(self.uname)
+        sys.meta_path.insert(0, finder)
+        try:
+            # the settings of the device are made by a local config module, see app/config.py
+            from app.config_defaults import Config
+
+            data = self.config
+
+            class DeviceConfig(Config):
+                def __init__(self):
+                    self.data = data
+
+            local_config = types.ModuleType('app.config')
+            local_config.Config = DeviceConfig
+            sys.modules['app.config'] = local_config
+            for name in IMPORTS:
+                importlib.import_module(name)
+        finally:
+            sys.meta_path.remove(finder)
+            for name in list(sys.modules):
+                if isolated(name):
+                    self.modules[name] = sys.modules.pop(name)
+            sys.modules.update(saved)
+        return self
+
+    @property
+    def extensions(self):
+        return self.modules['app.extensions']
+
+    def run(self):
+        """
+        runs the main loop of the device in a daemon thread, like boot.py
+        """
+        if self.config.get('ASYNCIO'):
+            # main_loop() would import app.main_async from sys.modules
+            target = self.modules['app.main_async'].run
+        else:
+            target = self.modules['app.main'].main_loop
+        self.thread = threading.Thread(target=target, name=self.config['CLIENT_UID'], daemon=True)
+        self.thread.start()
+        return self
@@ -0,0 +1,161 @@
+"""
+simulated machine and network modules, see app/hal.py
+"""
+import threading
+
+STA_IF = 0
+AP_IF = 1
+
+
+class Pin:
+    IN = 1
+    OUT = 3
+    PULL_UP = 1
+    PULL_DOWN = 2
+    IRQ_RISING = 1
+    IRQ_FALLING = 2
+
+    def __init__(self, id, mode=-1, pull=None, value=None):
+        self.id = id
+        self.mode = mode
+        self.state = value or 0
+        self.handler = None
+
+    def value(self, value=None):
+        if value is None:
+            return self.state
+        changed = self.state != value
+        self.state = value
+        if changed and self.handler is not None:
+            self.handler(self)
+
+    def on(self):
+        self.value(1)
+
+    def off(self):
+        self.value(0)
+
+    def irq(self, handler=None, trigger=IRQ_RISING | IRQ_FALLING):
+        self.handler = handler
+
+
+class Timer:
+    """
+    runs the callback in a thread like the timer interrupts of the board
+    """
+    ONE_SHOT = 0
+    PERIODIC = 1
+
+    def __init__(self, id=-1):
+        self.id = id
+        self.thread_timer = None
+
+    def init(self, mode=PERIODIC, period=-1, callback=None):
+        self.deinit()
+        self.mode = mode
+        self.period = period
+        self.callback = callback
+        self.schedule()
+
+    def schedule(self):
+        self.thread_timer = threading.Timer(self.period / 1000, self.fire)
+        self.thread_timer.daemon = True
+        self.thread_timer.start()
+
+    def fire(self):
+        if self.mode == self.PERIODIC:
+            self.schedule()
+        self.callback(self)
+
+    def deinit(self):
+        if self.thread_timer is not None:
+            self.thread_timer.cancel()
+            self.thread_timer = None
+
+
+def reset():
+    raise SystemExit('machine.reset()')
+
+
+# fake radio environment of the wlan: (ssid, bssid, channel, rssi, security, hidden) like WLAN.scan()
+access_points = []
+
+STAT_IDLE = 1000
+STAT_CONNECTING = 1001
+STAT_WRONG_PASSWORD = 202
+STAT_NO_AP_FOUND = 201
+STAT_CONNECT_FAIL = 203
+STAT_GOT_IP = 1010
+
+
+class WLAN:
+    """
+    the interfaces are singletons like on the board, so the state is kept per interface
+
+    Without any access_points every connect succeeds. Otherwise the ssid, and the bssid if one was given, must match
+    one of them, link_down() simulates a drop of the link.
+    """
+    interfaces = {}
+
+    def __new__(cls, interface=STA_IF):
+        if interface not in cls.interfaces:
+            wlan = super().__new__(cls)
+            wlan.interface = interface
+            wlan.enabled = False
+            wlan.state = STAT_IDLE
+            wlan.channel = None
+            wlan.static = None
+            wlan.scans = 0
+            cls.interfaces[interface] = wlan
+        return cls.interfaces[interface]
+
+    def active(self, enabled=None):
+        if enabled is None:
+            return self.enabled
+        self.enabled = enabled
+        if not enabled:
+            self.state = STAT_IDLE
+
+    def scan(self):
+        self.scans += 1
+        return list(access_points)
+
+    def connect(self, ssid=None, password=None, bssid=None):
+        if not self.enabled:
+            raise OSError('wifi not active')
+        if not access_points:
+            self.state = STAT_GOT_IP
+            return
+        for entry in access_points:
+            if entry[0] == ssid.encode() and (bssid is None or entry[1] == bssid):
+                self.channel = entry[2]
+                self.state = STAT_GOT_IP
+                return
+        self.state = STAT_NO_AP_FOUND
+
+    def disconnect(self):
+        self.state = STAT_IDLE
+
+    def link_down(self):
+        self.state = STAT_CONNECTING
+
+    def isconnected(self):
+        return self.state == STAT_GOT_IP
+
+    def status(self, param=None):
+        if param == 'rssi':
+            return -50
+        return self.state
+
+    def ifconfig(self, config=None):
+        if config is not None:
+            self.static = config
+            return
+        return self.static or ('127.0.0.1', '255.0.0.0', '127.0.0.1', '127.0.0.1')
+
+    def config(self, *args, **kwargs):
+        if 'channel' in kwargs:
+            self.channel = kwargs['channel']
+        if args == ('channel',):
+            return self.channel
+        return None
@@ -0,0 +1,180 @@
+"""
+websocket stand-in for open booking connect: accepts the upgrade, replies to all requests and sends
+RemoteChangeResourceStatus commands to every client, measuring the time until the client replies
+"""
+import asyncio
+import random
+import struct
+import time
+import zlib
+from base64 import b64encode
+from hashlib import sha1
+from os import urandom
+from binascii import hexlify
+
+from app.message_codec import BINARY_PROTOCOL, encode_binary, decode_binary, encode_json, decode_json
+from app.websocket_protocol import OP_TEXT, OP_BYTES, OP_CLOSE, OP_PING, OP_PONG
+
+GUID = b'258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+
+class StandInServer:
+    def __init__(self, host='127.0.0.1', port=0, command_interval=1.0):
+        self.host = host
+        self.port = port
+        self.command_interval = command_interval
+        self.connections = 0
+        self.messages_received = 0
+        self.commands_sent = 0
+        # payload bytes as received, compressed if permessage-deflate was negotiated
+        self.bytes_received = 0
+        # commands are only sent once the simulator sets this, so they don't queue up behind the blocking handshakes
+        self.sending_commands = False
+        # command round trip times in ms
+        self.rtts = []
+
+    async def serve(self, started):
+        """
+        runs the server, started is a threading.Event which is set as soon as self.port is known
+        """
+        server = await asyncio.start_server(self.handle_connection, self.host, self.port, backlog=4096)
+        self.port = server.sockets[0].getsockname()[1]
+        started.set()
+        async with server:
+            await server.serve_forever()
+
+    async def handle_connection(self, reader, writer):
+        try:
+            binary, deflate = await self.accept(reader, writer)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            writer.close()
+            return
+        self.connections += 1
+        connection = Connection(self, reader, writer, binary, deflate)
+        commands = asyncio.ensure_future(connection.send_commands())
+        try:
+            await connection.receive()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            commands.cancel()
+            writer.close()
+
+    async def accept(self, reader, writer):
+        """
+        reads the upgrade request and returns if the binary subprotocol and permessage-deflate were negotiated
+
+        permessage-deflate is implemented with zlib here and not with app.websocket_deflate, so it checks the client
+        against an independent implementation.
+        """
+        request = await reader.readuntil(b'\r\n\r\n')
+        headers = {}
+        for line in request.split(b'\r\n')[1:]:
+            if b':' in line:
+                name, value = line.split(b':', 1)
+                headers[name.strip().lower()] = value.strip()
+        accept = b64encode(sha1(headers[b'sec-websocket-key'] + GUID).digest())
+        binary = BINARY_PROTOCOL.encode() in headers.get(b'sec-websocket-protocol', b'')
+        response = [
+            b'HTTP/1.1 101 Switching Protocols',
+            b'Upgrade: websocket',
+            b'Connection: Upgrade',
+            b'Sec-WebSocket-Accept: ' + accept,
+        ]
+        if binary:
+            response.append(b'Sec-WebSocket-Protocol: ' + BINARY_PROTOCOL.encode())
+        deflate = headers.get(b'sec-websocket-extensions', b'').startswith(b'permessage-deflate')
+        if deflate:
+            response.append(
+                b'Sec-WebSocket-Extensions: permessage-deflate; server_no_context_takeover; client_no_context_takeover; '
+                b'server_max_window_bits=9'
+            )
+        writer.write(b'\r\n'.join(response) + b'\r\n\r\n')
+        await writer.drain()
+        return binary, deflate
+
+
+class Connection:
+    def __init__(self, server, reader, writer, binary, deflate):
+        self.server = server
+        self.reader = reader
+        self.writer = writer
+        self.binary = binary
+        self.deflate = deflate
+        # uid -> time the command was sent
+        self.commands = {}
+
+    async def receive(self):
+        while True:
+            opcode, data, compressed = await self.read_frame()
+            self.server.bytes_received += len(data)
+            if compressed:
+                data = zlib.decompressobj(-15).decompress(data + b'\x00\x00\xff\xff')
+            if opcode == OP_CLOSE:
+                self.write_frame(OP_CLOSE, data[:2])
+                return
+            if opcode == OP_PING:
+                self.write_frame(OP_PONG, data)
+                continue
+            if opcode not in (OP_TEXT, OP_BYTES):
+                continue
+            self.server.messages_received += 1
+            if opcode == OP_TEXT:
+                message_type, state, uid, payload = decode_json(data.decode())
+            else:
+                message_type, state, uid, payload = decode_binary(data)
+            if state == 'request':
+                self.send_message((message_type, 'reply', uid, {}))
+            elif uid in self.commands:
+                self.server.rtts.append((time.perf_counter() - self.commands.pop(uid)) * 1000)
+
+    async def read_frame(self):
+        byte1, byte2 = await self.reader.readexactly(2)
+        length = byte2 & 0x7f
+        if length == 126:
+            length, = struct.unpack('!H', await self.reader.readexactly(2))
+        elif length == 127:
+            length, = struct.unpack('!Q', await self.reader.readexactly(8))
+        mask = await self.reader.readexactly(4) if byte2 & 0x80 else None
+        data = await self.reader.readexactly(length)
+        if mask is not None:
+            # xor with the repeated mask as one big integer
+            repeated = (mask * (length // 4 + 1))[:length]
+            data = (int.from_bytes(data, 'big') ^ int.from_bytes(repeated, 'big')).to_bytes(length, 'big')
+        return byte1 & 0x0f, data, bool(byte1 & 0x40)
+
+    def write_frame(self, opcode, data):
+        byte1 = 0x80 | opcode
+        if self.deflate and opcode in (OP_TEXT, OP_BYTES):
+            compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -9)
+            data = (compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH))[:-4]
+            byte1 |= 0x40
+        length = len(data)
+        if length < 126:
+            header = struct.pack('!BB', byte1, length)
+        elif length < 65536:
+            header = struct.pack('!BBH', byte1, 126, length)
+        else:
+            header = struct.pack('!BBQ', byte1, 127, length)
+        self.writer.write(header + data)
+
+    def send_message(self, message):
+        if self.binary:
+            self.write_frame(OP_BYTES, bytes(encode_binary(message)))
+        else:
+            self.write_frame(OP_TEXT, encode_json(message).encode())
+
+    async def send_commands(self):
+        while not self.server.sending_commands:
+            await asyncio.sleep(0.1)
+        # spread the commands of all connections over the interval
+        await asyncio.sleep(random.random() * self.server.command_interval)
+        status = 'open'
+        while True:
+            uid = hexlify(urandom(16)).decode()
+            self.commands[uid] = time.perf_counter()
+            self.send_message(('RemoteChangeResourceStatus', 'request', uid, {'status': status}))
+            self.server.commands_sent += 1
+            await self.writer.drain()
+            status = 'close' if status == 'open' else 'open'
+            await asyncio.sleep(self.server.command_interval)
@@ -0,0 +1,2 @@
+from os import *
+from os import urandom, uname, stat, remove, rename, listdir
@@ -0,0 +1 @@
+from select import *
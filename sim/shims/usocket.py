@@ -0,0 +1,45 @@
+import socket as _socket
+from socket import getaddrinfo, AF_INET, SOCK_STREAM, SOL_SOCKET, SO_REUSEADDR
+
+
+class Stream:
+    """
+    micropython stream methods: readinto() and write() return None instead of raising if the socket would block
+    """
+    would_block = (BlockingIOError,)
+
+    def readinto(self, buf):
+        try:
+            return self.recv_into(buf)
+        except self.would_block:
+            return None
+
+    def write(self, buf, offset=0, size=None):
+        if offset or size is not None:
+            buf = memoryview(buf)[offset:None if size is None else offset + size]
+        try:
+            return self.send(buf)
+        except self.would_block:
+            return None
+
+    def read(self, size):
+        data = b''
+        while len(data) < size:
+            chunk = self.recv(size - len(data))
+            if not chunk:
+                break
+            data += chunk
+        return data
+
+    def readline(self):
+        line = bytearray()
+        while not line.endswith(b'\n'):
+            byte = self.recv(1)
+            if not byte:
+                break
+            line += byte
+        return bytes(line)
+
+
+class socket(Stream, _socket.socket):
+    pass
@@ -0,0 +1,14 @@
+import ssl as _ssl
+from usocket import Stream
+
+
+class SSLSocket(Stream, _ssl.SSLSocket):
+    would_block = (BlockingIOError, _ssl.SSLWantReadError, _ssl.SSLWantWriteError)
+
+
+def wrap_socket(sock, server_hostname=None, cert_reqs=_ssl.CERT_NONE, session=None, **kwargs):
+    context = _ssl.SSLContext(_ssl.PROTOCOL_TLS_CLIENT)
+    context.check_hostname = False
+    context.verify_mode = cert_reqs
+    context.sslsocket_class = SSLSocket
+    return context.wrap_socket(sock, server_hostname=server_hostname, session=session)
@@ -0,0 +1 @@
+from struct import *
@@ -0,0 +1,25 @@
+from time import sleep, time, monotonic_ns
+
+
+def ticks_ms():
+    return monotonic_ns() // 1000000
+
+
+def ticks_us():
+    return monotonic_ns() // 1000
+
+
+def ticks_add(ticks, delta):
+    return ticks + delta
+
+
+def ticks_diff(ticks1, ticks2):
+    return ticks1 - ticks2
+
+
+def sleep_ms(ms):
+    sleep(ms / 1000)
+
+
+def sleep_us(us):
+    sleep(us / 1000000)
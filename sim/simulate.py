@@ -0,0 +1,138 @@
+"""
+load test with many virtual devices in one cpython process against a local websocket stand-in server
+
+    python3 -m sim.simulate --clients 1000 --duration 30
+
+Every device runs its own copy of the app modules with app.main.main_loop() in a thread, see sim.device. Reported are
+the boot throughput up to the open connection, the command round trip percentiles and the python heap allocated by
+the app modules per device. All devices share one interpreter, so the numbers are for comparing changes of the client
+logic, not for predicting the latency on the boards.
+"""
+import argparse
+import builtins
+import os
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# micropython builtins and modules which don't exist on cpython
+builtins.const = lambda value: value
+sys.path.insert(0, os.path.join(ROOT, 'sim', 'shims'))
+
+import asyncio  # noqa: E402
+
+from sim.device import VirtualDevice  # noqa: E402
+from sim.server import StandInServer  # noqa: E402
+
+
+def percentile(values, percent):
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(len(values) - 1, len(values) * percent // 100)]
+
+
+def raise_file_limit(count):
+    # two sockets per client, one of them on the server side
+    try:
+        import resource
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        wanted = count * 2 + 64
+        if soft < wanted:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (min(wanted, hard), hard))
+    except (ImportError, ValueError, OSError):
+        pass
+
+
+def start_server(command_interval):
+    server = StandInServer(command_interval=command_interval)
+    started = threading.Event()
+    thread = threading.Thread(target=asyncio.run, args=(server.serve(started),), daemon=True)
+    thread.start()
+    started.wait()
+    return server
+
+
+def device_config(index, port, binary, deflate_window_bits, use_asyncio):
+    return {
+        'CLIENT_UID': 'sim-%05d' % index,
+        'WEBSOCKET_HOSTNAME': '127.0.0.1',
+        'WEBSOCKET_PORT': port,
+        'WEBSOCKET_PATH': '/',
+        'WEBSOCKET_TLS': False,
+        'WEBSOCKET_PASSWORD': 'simulator',
+        'WEBSOCKET_BINARY': binary,
+        'WEBSOCKET_DEFLATE': deflate_window_bits is not None,
+        'WEBSOCKET_DEFLATE_WINDOW_BITS': deflate_window_bits,
+        'WIFI_NETWORK': 'simulator',
+        'WIFI_PASSWORD': '',
+        'ASYNCIO': use_asyncio,
+    }
+
+
+def boot_devices(count, root, port, binary, deflate_window_bits, use_asyncio):
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    started = time.perf_counter()
+    devices = []
+    for index in range(count):
+        config = device_config(index, port, binary, deflate_window_bits, use_asyncio)
+        uname = ('esp32', config['CLIENT_UID'], 'sim', 'sim', 'simulated ESP32 with sim.hardware')
+        devices.append(VirtualDevice(os.path.join(root, config['CLIENT_UID']), config, uname).boot())
+    duration = time.perf_counter() - started
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    # only the allocations of the app modules, the server thread runs in the same process
+    filters = [tracemalloc.Filter(True, os.path.join(ROOT, 'app', '*'))]
+    memory = sum(
+        stat.size_diff for stat in after.filter_traces(filters).compare_to(before.filter_traces(filters), 'filename')
+    )
+    return devices, duration, memory
+
+
+def main():
+    parser = argparse.ArgumentParser(description='open booking client load test')
+    parser.add_argument('--clients', type=int, default=100)
+    parser.add_argument('--duration', type=float, default=10, help='seconds after all clients are connected')
+    parser.add_argument('--command-interval', type=float, default=1.0, help='seconds between the commands per client')
+    parser.add_argument('--binary', action='store_true', help='negotiate the binary subprotocol')
+    parser.add_argument('--deflate', type=int, metavar='WINDOW_BITS', help='negotiate permessage-deflate')
+    parser.add_argument('--asyncio', action='store_true', help='run the uasyncio main loop of app.main_async')
+    args = parser.parse_args()
+
+    raise_file_limit(args.clients)
+    server = start_server(args.command_interval)
+    with tempfile.TemporaryDirectory(prefix='sim-') as root:
+        devices, boot_duration, memory = boot_devices(
+            args.clients,
+            root,
+            server.port,
+            args.binary,
+            args.deflate,
+            args.asyncio
+        )
+        for device in devices:
+            device.run()
+        server.sending_commands = True
+        time.sleep(args.duration)
+    rtts = server.rtts
+    reconnects = sum(device.extensions.websocket.reconnects for device in devices)
+
+    print('clients                %10d' % len(devices))
+    print('boots/s                %10.1f' % (len(devices) / boot_duration))
+    print('reconnects             %10d' % reconnects)
+    print('commands sent          %10d' % server.commands_sent)
+    print('commands answered      %10d' % len(rtts))
+    print('messages received      %10d' % server.messages_received)
+    print('bytes received         %10d' % server.bytes_received)
+    for percent in (50, 90, 99):
+        print('command rtt p%-2d        %10.2f ms' % (percent, percentile(rtts, percent)))
+    print('memory per client      %10d B' % (memory // max(1, len(devices))))
+
+
+if __name__ == '__main__':
+    main()
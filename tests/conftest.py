@@ -0,0 +1,79 @@
+"""
+The tests run with cpython from the repository root: python3 -m pytest tests
+
+Like in the simulator and the benchmarks, the micropython modules are taken from sim/shims and app/hal.py falls back
+to the simulated hardware of sim/hardware.py.
+"""
+import builtins
+import json
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+builtins.const = lambda value: value
+sys.path[:0] = [os.path.join(ROOT, 'sim', 'shims'), ROOT]
+
+from app.config_defaults import Config  # noqa: E402
+from app.connection_cache import ConnectionCache  # noqa: E402
+from app.metrics import Metrics, Telemetry  # noqa: E402
+from app.pending_requests import PendingRequests  # noqa: E402
+from app.reply_cache import ReplyCache  # noqa: E402
+from app.send_queue import SendQueue  # noqa: E402
+from app.startup import Startup  # noqa: E402
+
+
+class TestConfig(Config):
+    def __init__(self, data):
+        self.data = data
+
+
+class TestExtensions:
+    """
+    stands in for app.extensions, which connects on import
+    """
+    def __init__(self):
+        self.startup = Startup()
+        with open(os.path.join(ROOT, 'config_dist.json')) as config_file:
+            data = json.load(config_file)
+        data.update({'CLIENT_UID': 'test', 'WEBSOCKET_HOSTNAME': '127.0.0.1', 'WIFI_NETWORK': 'test-network'})
+        self.config = TestConfig(data)
+        self.websocket_send_queue = SendQueue(self.config.WEBSOCKET_SEND_QUEUE_SIZE)
+        self.websocket_send_event = None
+        self.pending_requests = PendingRequests(5000, 3)
+        self.reply_cache = ReplyCache(self.config.REPLY_CACHE_SIZE)
+        self.metrics = Metrics()
+        self.telemetry = Telemetry(self.metrics, self.config.TELEMETRY_INTERVAL * 1000)
+        # the tests which use the cache point it to a temporary file, see the connection_cache fixture
+        ConnectionCache.path = os.devnull
+        self.connection_cache = ConnectionCache()
+
+
+extensions = TestExtensions()
+sys.modules['app.extensions'] = extensions
+
+from app.networking import WifiManager  # noqa: E402
+extensions.wifi = WifiManager(extensions.connection_cache)
+
+# the modules which import the device or the websocket client from app.extensions, the client doesn't connect
+from app.device import Device  # noqa: E402
+from app.websocket_client import WebsocketClient  # noqa: E402
+extensions.device = Device()
+extensions.websocket = WebsocketClient()
+
+
+@pytest.fixture
+def config():
+    """
+    the config of the stand-in extensions, changes are undone after the test
+    """
+    data = dict(extensions.config.data)
+    yield extensions.config
+    extensions.config.data = data
+
+
+@pytest.fixture
+def connection_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(ConnectionCache, 'path', str(tmp_path / 'connection_cache.json'))
+    return ConnectionCache()
@@ -0,0 +1,155 @@
+"""
+byte level framing of Websocket.write_frame() and the batching of frames into one socket write
+"""
+import struct
+
+import pytest
+
+from app.websocket_protocol import Websocket, OP_TEXT, OP_BYTES, OP_PING, OP_CLOSE, CLOSE_BAD_DATA
+
+
+class RecordingSocket:
+    """
+    collects every write call, the micropython stream form write(buf, offset, size) included
+    """
+    def __init__(self, incoming=b''):
+        self.writes = []
+        self.incoming = incoming
+
+    def setblocking(self, flag):
+        pass
+
+    def fileno(self):
+        # select.poll on cpython needs a file descriptor, the tests don't poll
+        return 0
+
+    def readinto(self, buf):
+        count = min(len(buf), len(self.incoming))
+        buf[:count] = self.incoming[:count]
+        self.incoming = self.incoming[count:]
+        return count
+
+    def write(self, buf, offset=0, size=None):
+        end = len(buf) if size is None else offset + size
+        self.writes.append(bytes(buf[offset:end]))
+        return end - offset
+
+    def close(self):
+        pass
+
+
+def parse(frame):
+    """
+    returns (byte1, mask bit, length, header length, payload) of a frame
+    """
+    byte1, byte2 = frame[0], frame[1]
+    length = byte2 & 0x7f
+    position = 2
+    if length == 126:
+        length, = struct.unpack_from('!H', frame, 2)
+        position = 4
+    elif length == 127:
+        length, = struct.unpack_from('!Q', frame, 2)
+        position = 10
+    masked = bool(byte2 & 0x80)
+    payload = frame[position + 4 if masked else position:]
+    if masked:
+        mask = frame[position:position + 4]
+        payload = bytes(byte ^ mask[index % 4] for index, byte in enumerate(payload))
+        position += 4
+    return byte1, masked, length, position, payload
+
+
+@pytest.mark.parametrize('masked', [True, False])
+@pytest.mark.parametrize('length, header_length', [
+    (0, 2),
+    (125, 2),
+    (126, 4),
+    (65535, 4),
+    (65536, 10),
+])
+def test_header(length, header_length, masked):
+    sock = RecordingSocket()
+    websocket = Websocket(sock, 0.1)
+    websocket.is_client = masked
+    data = bytes(index & 0xff for index in range(length))
+
+    websocket.write_frame(OP_BYTES, data)
+
+    frame = b''.join(sock.writes)
+    byte1, frame_masked, frame_length, frame_header_length, payload = parse(frame)
+    assert byte1 == 0x80 | OP_BYTES
+    assert frame_masked == masked
+    assert frame_length == length
+    assert frame_header_length == header_length + (4 if masked else 0)
+    assert len(frame) == frame_header_length + length
+    assert payload == data
+
+
+def test_length_encodings():
+    sock = RecordingSocket()
+    websocket = Websocket(sock, 0.1)
+    websocket.is_client = False
+    for length in (0, 125, 126, 65535, 65536):
+        websocket.write_frame(OP_BYTES, bytes(length))
+    headers = [frame[:10] for frame in sock.writes]
+    assert headers[0][:2] == b'\x82\x00'
+    assert headers[1][:2] == b'\x82\x7d'
+    assert headers[2][:4] == b'\x82\x7e\x00\x7e'
+    assert headers[3][:4] == b'\x82\x7e\xff\xff'
+    assert headers[4][:10] == b'\x82\x7f\x00\x00\x00\x00\x00\x01\x00\x00'
+
+
+def test_batch_is_one_write():
+    sock = RecordingSocket()
+    websocket = Websocket(sock, 0.1)
+    messages = [b'first', b'x' * 200, b'third']
+
+    for message in messages:
+        websocket.write_frame(OP_TEXT, message, flush=False)
+    websocket.write_frame(OP_PING, b'ping', flush=False)
+    assert sock.writes == []
+    websocket.flush()
+
+    assert len(sock.writes) == 1
+    batch = sock.writes[0]
+    payloads = []
+    while batch:
+        byte1, masked, length, header_length, _ = parse(batch)
+        payloads.append((byte1 & 0x0f, parse(batch[:header_length + length])[4]))
+        batch = batch[header_length + length:]
+    assert payloads == [(OP_TEXT, message) for message in messages] + [(OP_PING, b'ping')]
+
+
+def test_full_output_buffer_is_flushed_first():
+    sock = RecordingSocket()
+    websocket = Websocket(sock, 0.1, output_buffer_size=256)
+
+    websocket.write_frame(OP_TEXT, b'a' * 200, flush=False)
+    websocket.write_frame(OP_TEXT, b'b' * 200, flush=False)
+
+    # the second frame doesn't fit behind the first one
+    assert len(sock.writes) == 1
+    assert parse(sock.writes[0])[4] == b'a' * 200
+    websocket.flush()
+    assert parse(sock.writes[1])[4] == b'b' * 200
+
+
+def server_frame(opcode, payload):
+    return struct.pack('!BB', 0x80 | opcode, len(payload)) + payload
+
+
+def test_invalid_utf8_closes_with_bad_data():
+    incoming = (
+        server_frame(OP_TEXT, b'first') + server_frame(OP_TEXT, b'\xff\xfe') + server_frame(OP_TEXT, b'third')
+    )
+    sock = RecordingSocket(incoming)
+    websocket = Websocket(sock, 0.1)
+
+    # the message before the bad one is kept
+    assert websocket.read_input() == ['first']
+
+    assert not websocket.open
+    byte1, _, _, _, payload = parse(sock.writes[-1])
+    assert byte1 & 0x0f == OP_CLOSE
+    assert struct.unpack('!H', payload[:2])[0] == CLOSE_BAD_DATA
@@ -0,0 +1,139 @@
+"""
+replays bouncing signal traces through the debouncing of InputEngine with a fake pin, timer and clock
+"""
+import pytest
+
+from app.inputs import InputEngine
+
+PERIOD = 10
+WINDOW = 50
+
+
+class FakePin:
+    def __init__(self, value=0):
+        self.state = value
+        self.handler = None
+
+    def value(self):
+        return self.state
+
+    def irq(self, handler=None, trigger=None):
+        self.handler = handler
+
+    def set(self, value):
+        if value != self.state:
+            self.state = value
+            if self.handler is not None:
+                self.handler(self)
+
+
+class FakeTimer:
+    PERIODIC = 1
+
+    def __init__(self):
+        self.callback = None
+
+    def init(self, mode=PERIODIC, period=-1, callback=None):
+        self.callback = callback
+
+    def deinit(self):
+        self.callback = None
+
+
+class Replay:
+    """
+    plays a trace of (ms, raw value) against the engine, the timer fires every PERIOD ms while it runs
+    """
+    def __init__(self, initial=0, window=WINDOW):
+        self.now = 0
+        self.timer = FakeTimer()
+        self.engine = InputEngine(self.timer, PERIOD, lambda: self.now)
+        self.pin = FakePin(initial)
+        self.edges = []
+        self.engine.add('door', self.pin, window, self.changed)
+
+    def changed(self, name, value, changed_at):
+        self.edges.append((value, changed_at))
+
+    def play(self, trace, until):
+        changes = list(trace)
+        while self.now <= until:
+            while changes and changes[0][0] <= self.now:
+                self.pin.set(changes.pop(0)[1])
+            if self.timer.callback is not None and self.now % PERIOD == 0:
+                self.timer.callback(self.timer)
+            self.now += 1
+
+
+def bounce(start, value, bounces=4, spacing=3):
+    """
+    a transition to value at start which bounces back a few times
+    """
+    trace = []
+    for index in range(bounces):
+        trace.append((start + index * 2 * spacing, value))
+        trace.append((start + index * 2 * spacing + spacing, 1 - value))
+    trace.append((start + bounces * 2 * spacing, value))
+    return trace
+
+
+def test_bouncing_transitions_give_one_edge_each():
+    replay = Replay()
+    trace = bounce(100, 1) + bounce(500, 0) + bounce(900, 1)
+
+    replay.play(trace, 1500)
+
+    # each edge is stamped with the sample which first saw the value it settled on, bounces between two samples
+    # aren't seen at all
+    assert [value for value, _ in replay.edges] == [1, 0, 1]
+    for (value, changed_at), start in zip(replay.edges, (100, 500, 900)):
+        settled = start + 8 * 3
+        assert start <= changed_at < settled + PERIOD
+
+
+def test_edges_are_reported_after_the_window():
+    replay = Replay()
+    replay.play(bounce(100, 1), 100 + 24 + WINDOW - PERIOD)
+    assert replay.edges == []
+    replay.play([], 100 + 24 + WINDOW + PERIOD)
+    assert len(replay.edges) == 1
+
+
+def test_glitch_shorter_than_the_window_is_ignored():
+    replay = Replay()
+    replay.play([(100, 1), (130, 0)], 400)
+    assert replay.edges == []
+    assert replay.engine.value('door') == 0
+
+
+def test_pulse_which_returns_to_the_old_state_is_ignored():
+    replay = Replay()
+    replay.play(bounce(100, 1) + [(140, 0)], 600)
+    assert replay.edges == []
+
+
+def test_timer_stops_when_settled():
+    replay = Replay()
+    replay.play(bounce(100, 1), 400)
+    assert len(replay.edges) == 1
+    assert replay.timer.callback is None
+    assert not replay.engine.running
+
+
+@pytest.mark.parametrize('spacing', [1, 5, 9])
+def test_bounce_spacing(spacing):
+    replay = Replay()
+    replay.play(bounce(100, 1, bounces=6, spacing=spacing) + bounce(800, 0, bounces=6, spacing=spacing), 1400)
+    assert [value for value, _ in replay.edges] == [1, 0]
+
+
+def test_door_status_carries_the_edge_time():
+    from app.device import Device
+    from app.extensions import websocket_send_queue
+
+    device = Device.__new__(Device)
+    device.door_changed('door-1', 1, 12345)
+
+    message = websocket_send_queue.pop()
+    assert message[0] == 'DoorStatus'
+    assert message[3] == {'status': True, 'resource_uid': 'door-1', 'changed_at': 12345}
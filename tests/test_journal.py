@@ -0,0 +1,168 @@
+"""
+power loss scenarios of the journal: the file is reopened like after a reset, with the last record torn or the header
+corrupted, and the replayed messages are compared with the journaled ones
+"""
+import pytest
+
+from app.journal import Journal, FILE_HEADER_SIZE, RECORD_HEADER_SIZE
+from app.message_codec import new_uid
+
+SLOTS = 8
+RECORD_SIZE = 64
+
+
+class RecordingWebsocket:
+    def __init__(self):
+        self.sent = []
+
+    def send_message(self, message, flush=True):
+        self.sent.append(message)
+
+    def flush(self):
+        pass
+
+
+def door_status(number):
+    return ('DoorStatus', 'request', new_uid(), {'status': number})
+
+
+def boot_notification(size):
+    return ('BootNotification', 'request', new_uid(), {'startup': 'x' * size})
+
+
+def replay_all(journal):
+    websocket = RecordingWebsocket()
+    while len(journal):
+        journal.replay(websocket)
+    return websocket.sent
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'journal.bin')
+
+
+def test_reopen_replays_in_order(path):
+    messages = [door_status(number) for number in range(5)]
+    journal = Journal(path, SLOTS, RECORD_SIZE)
+    for message in messages:
+        journal.append(message)
+
+    reopened = Journal(path, SLOTS, RECORD_SIZE)
+
+    assert len(reopened) == 5
+    assert replay_all(reopened) == messages
+
+
+def test_torn_last_record_is_skipped(path):
+    messages = [door_status(number) for number in range(4)]
+    journal = Journal(path, SLOTS, RECORD_SIZE)
+    for message in messages:
+        journal.append(message)
+    # the power was lost while the payload of the last record was written
+    with open(path, 'r+b') as journal_file:
+        journal_file.seek(FILE_HEADER_SIZE + 3 * RECORD_SIZE + RECORD_HEADER_SIZE + 4)
+        journal_file.write(b'\x00' * 8)
+
+    assert replay_all(Journal(path, SLOTS, RECORD_SIZE)) == messages[:3]
+
+
+def test_torn_record_header_is_skipped(path):
+    messages = [door_status(number) for number in range(4)]
+    journal = Journal(path, SLOTS, RECORD_SIZE)
+    for message in messages:
+        journal.append(message)
+    with open(path, 'r+b') as journal_file:
+        journal_file.seek(FILE_HEADER_SIZE + 3 * RECORD_SIZE + 1)
+        journal_file.write(b'\xff\xff')
+
+    assert replay_all(Journal(path, SLOTS, RECORD_SIZE)) == messages[:3]
+
+
+def test_committed_records_are_not_replayed_again(path):
+    messages = [door_status(number) for number in range(6)]
+    journal = Journal(path, SLOTS, RECORD_SIZE)
+    for message in messages:
+        journal.append(message)
+    websocket = RecordingWebsocket()
+    journal.replay(websocket, count=4)
+
+    reopened = Journal(path, SLOTS, RECORD_SIZE)
+
+    assert websocket.sent == messages[:4]
+    assert len(reopened) == 2
+    assert replay_all(reopened) == messages[4:]
+
+
+def test_corrupt_header_replays_the_records_in_the_slots(path):
+    messages = [door_status(number) for number in range(6)]
+    journal = Journal(path, SLOTS, RECORD_SIZE)
+    for message in messages:
+        journal.append(message)
+    journal.replay(RecordingWebsocket(), count=4)
+    # the power was lost while the header was written, the checksum doesn't match the sequence number
+    with open(path, 'r+b') as journal_file:
+        journal_file.seek(5)
+        journal_file.write(b'\xff\xff')
+
+    # the sent records are replayed again rather than losing the pending ones, the server drops them by their uid
+    assert replay_all(Journal(path, SLOTS, RECORD_SIZE)) == messages
+
+
+def test_wrapped_ring_keeps_the_newest_records_in_order(path):
+    messages = [door_status(number) for number in range(SLOTS + 3)]
+    journal = Journal(path, SLOTS, RECORD_SIZE)
+    for message in messages:
+        journal.append(message)
+
+    reopened = Journal(path, SLOTS, RECORD_SIZE)
+
+    assert journal.dropped == 3
+    assert len(reopened) == SLOTS
+    assert replay_all(reopened) == messages[3:]
+
+
+def test_large_message_spans_several_slots(path):
+    messages = [door_status(0), boot_notification(150), door_status(1)]
+    journal = Journal(path, SLOTS, RECORD_SIZE)
+    for message in messages:
+        journal.append(message)
+
+    reopened = Journal(path, SLOTS, RECORD_SIZE)
+
+    assert journal.dropped == 0
+    assert len(reopened) > len(messages)
+    assert replay_all(reopened) == messages
+    assert len(reopened) == 0
+
+
+def test_torn_continuation_slot_drops_only_its_message(path):
+    messages = [door_status(0), boot_notification(150)]
+    journal = Journal(path, SLOTS, RECORD_SIZE)
+    for message in messages:
+        journal.append(message)
+    # the power was lost while the last slot of the large message was written
+    last_slot = journal.head - 1
+    with open(path, 'r+b') as journal_file:
+        journal_file.seek(FILE_HEADER_SIZE + last_slot * RECORD_SIZE + RECORD_HEADER_SIZE + 2)
+        journal_file.write(b'\x00' * 4)
+
+    assert replay_all(Journal(path, SLOTS, RECORD_SIZE)) == messages[:1]
+
+
+def test_overwritten_start_of_a_large_message_is_skipped(path):
+    journal = Journal(path, SLOTS, RECORD_SIZE)
+    journal.append(boot_notification(150))
+    messages = [door_status(number) for number in range(SLOTS - 1)]
+    for message in messages:
+        journal.append(message)
+
+    assert replay_all(Journal(path, SLOTS, RECORD_SIZE)) == messages
+
+
+def test_message_larger_than_the_journal_is_dropped(path):
+    journal = Journal(path, SLOTS, RECORD_SIZE)
+    journal.append(boot_notification(SLOTS * RECORD_SIZE))
+
+    assert len(journal) == 0
+    assert journal.stats() == {'pending': 0, 'dropped': 1}
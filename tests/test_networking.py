@@ -0,0 +1,174 @@
+"""
+association of the WifiManager against the simulated radio of sim.hardware: the cached access point, the fallback to
+a full scan, the backoff between failed associations and the detection of a lost link
+"""
+import pytest
+import utime
+
+from app.networking import WifiManager, RETRY_MIN_DELAY, RETRY_MAX_DELAY
+from sim import hardware
+
+SSID = 'test-network'
+NEAR = (SSID.encode(), b'\x02\x00\x00\x00\x00\x01', 6, -40, 3, False)
+FAR = (SSID.encode(), b'\x02\x00\x00\x00\x00\x02', 11, -80, 3, False)
+OTHER = (b'other-network', b'\x02\x00\x00\x00\x00\x03', 1, -30, 3, False)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0
+
+    def ticks_ms(self):
+        return self.now
+
+
+def pending(wlan):
+    """
+    a connect() whose association doesn't complete
+    """
+    def connect(ssid=None, password=None, bssid=None):
+        wlan.state = hardware.STAT_CONNECTING
+    return connect
+
+
+@pytest.fixture
+def radio(monkeypatch):
+    """
+    the access points in range, the interfaces start switched off like after a reset
+    """
+    access_points = []
+    monkeypatch.setattr(hardware, 'access_points', access_points)
+    monkeypatch.setattr(hardware.WLAN, 'interfaces', {})
+    return access_points
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(utime, 'ticks_ms', clock.ticks_ms)
+    return clock
+
+
+@pytest.fixture
+def wifi(radio, clock, connection_cache, config):
+    config.data.update({'WIFI_STATIC_IP': None, 'WIFI_CONNECT_TIMEOUT': 15, 'WIFI_CACHED_CONNECT_TIMEOUT': 5})
+    return WifiManager(connection_cache)
+
+
+def test_first_association_scans_and_caches_the_strongest_access_point(wifi, radio, connection_cache):
+    radio.extend([FAR, OTHER, NEAR])
+
+    assert wifi.start().poll()
+
+    assert wifi.scans == 1
+    assert not wifi.from_cache
+    assert wifi.wlan.channel == 6
+    assert connection_cache.get_access_point(SSID) == ('020000000001', 6)
+
+
+def test_cached_access_point_skips_the_scan(wifi, radio, connection_cache):
+    radio.extend([FAR, NEAR])
+    connection_cache.set_access_point(SSID, '020000000002', 11)
+
+    assert wifi.start().poll()
+
+    assert wifi.scans == 0
+    assert wifi.wlan.scans == 0
+    assert wifi.from_cache
+    assert wifi.wlan.channel == 11
+    assert wifi.stats()['cached']
+
+
+def test_cached_timeout_falls_back_to_a_full_scan(wifi, radio, clock, connection_cache, monkeypatch):
+    radio.append(NEAR)
+    connection_cache.set_access_point(SSID, '020000000002', 11)
+    # the cached access point doesn't answer, the association stays pending
+    with monkeypatch.context() as patch:
+        patch.setattr(wifi.wlan, 'connect', pending(wifi.wlan))
+        wifi.start()
+        clock.now += 5000 - 1
+        assert wifi.poll() is None
+        clock.now += 1
+        assert wifi.poll() is False
+
+    assert wifi.retry() == 0
+    assert wifi.attempts == 0
+    assert connection_cache.get_access_point(SSID) is None
+    assert wifi.start().poll()
+    assert wifi.scans == 1
+    assert not wifi.from_cache
+    assert connection_cache.get_access_point(SSID) == ('020000000001', 6)
+
+
+def test_cached_access_point_which_is_gone_falls_back_to_a_full_scan(wifi, radio, connection_cache):
+    radio.append(NEAR)
+    connection_cache.set_access_point(SSID, '020000000002', 11)
+
+    assert wifi.start().poll() is False
+    assert wifi.retry() == 0
+    assert wifi.start().poll()
+
+    assert wifi.scans == 1
+    assert connection_cache.get_access_point(SSID) == ('020000000001', 6)
+
+
+def test_scanned_association_times_out_after_the_full_timeout(wifi, radio, clock, monkeypatch):
+    radio.append(NEAR)
+    monkeypatch.setattr(wifi.wlan, 'connect', pending(wifi.wlan))
+
+    wifi.start()
+    clock.now += 15000 - 1
+    assert wifi.poll() is None
+    clock.now += 1
+    assert wifi.poll() is False
+
+
+def test_backoff_grows_per_failed_association(wifi, radio):
+    radio.append(OTHER)
+    delays = []
+    for _ in range(8):
+        assert wifi.start().poll() is False
+        delays.append(wifi.retry())
+
+    assert delays == [1000, 2000, 4000, 8000, 16000, 30000, 30000, 30000]
+    assert delays[0] == RETRY_MIN_DELAY
+    assert delays[-1] == RETRY_MAX_DELAY
+    assert wifi.attempts == 8
+
+
+def test_success_resets_the_backoff(wifi, radio):
+    radio.append(OTHER)
+    for _ in range(3):
+        wifi.start().poll()
+        wifi.retry()
+
+    radio.append(NEAR)
+    assert wifi.start().poll()
+    assert wifi.attempts == 0
+
+    wifi.wlan.link_down()
+    radio.remove(NEAR)
+    assert wifi.link_lost()
+    # the cached access point is tried first, its failure doesn't count
+    assert wifi.start().poll() is False
+    assert wifi.retry() == 0
+    assert wifi.start().poll() is False
+    assert wifi.retry() == RETRY_MIN_DELAY
+
+
+def test_link_lost_is_reported_once_per_drop(wifi, radio):
+    radio.append(NEAR)
+    assert not wifi.link_lost()
+    assert wifi.start().poll()
+    assert not wifi.link_lost()
+
+    for drop in (1, 2):
+        wifi.wlan.link_down()
+        assert wifi.link_lost()
+        assert not wifi.link_lost()
+        assert not wifi.link_lost()
+        assert wifi.drops == drop
+        assert wifi.reconnect().isconnected()
+        assert not wifi.link_lost()
+
+    assert wifi.stats()['drops'] == 2
@@ -0,0 +1,124 @@
+"""
+steady state sends must not grow the heap: on micropython gc.mem_alloc() stays the same over 10,000 sends with the
+gc disabled, on cpython, where every int is an object, tracemalloc shows that nothing is kept between the sends
+
+The requests are tracked by pending_requests until the reply: every DoorStatus supersedes the pending one, so the send
+path takes a record of the pool and hands the previous one back. The messages and their uids are built ahead, they're
+allocated by the caller.
+"""
+import gc
+
+import pytest
+
+from app.extensions import pending_requests
+from app.message_codec import write_json
+from app.metrics import Metrics
+from app.websocket_client import WebsocketClient
+from app.websocket_protocol import Websocket, OP_TEXT
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+SENDS = 10000
+WARMUP = 100
+# bytes which cpython keeps in boxed ints while the sends run (histogram buckets, deadlines), micropython has none
+SLACK = 512
+
+DATA = {
+    'status': True,
+    'resource_uid': 'door-1',
+    'changed_at': 123456,
+    'inputs': [0, 1, 1],
+}
+MESSAGE = ('DoorStatus', 'request', '0123456789abcdef', DATA)
+# distinct uids, so each send is a new request for pending_requests
+MESSAGES = [('DoorStatus', 'request', '%016x' % index, DATA) for index in range(64)]
+
+
+class NullSocket:
+    def setblocking(self, flag):
+        pass
+
+    def fileno(self):
+        # select.poll on cpython needs a file descriptor, the sends don't poll
+        return 0
+
+    def write(self, buf, offset=0, size=None):
+        return len(buf) - offset if size is None else size
+
+    def close(self):
+        pass
+
+
+def websocket():
+    websocket = Websocket(NullSocket(), 0.1)
+    websocket.set_metrics(Metrics())
+    return websocket
+
+
+def allocated(send):
+    """
+    heap growth in bytes over SENDS calls of send() after a warm-up
+    """
+    for _ in range(WARMUP):
+        send()
+    gc.collect()
+    if hasattr(gc, 'mem_alloc'):
+        gc.disable()
+        try:
+            before = gc.mem_alloc()
+            for _ in range(SENDS):
+                send()
+            return gc.mem_alloc() - before
+        finally:
+            gc.enable()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        for _ in range(SENDS):
+            send()
+        gc.collect()
+        return tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+
+
+def slack():
+    return 0 if hasattr(gc, 'mem_alloc') else SLACK
+
+
+@pytest.mark.parametrize('flush', [True, False])
+def test_write_frame_from_is_flat(flush):
+    ws = websocket()
+
+    def send():
+        ws.write_frame_from(OP_TEXT, write_json, MESSAGE, flush)
+
+    assert allocated(send) <= slack()
+
+
+@pytest.fixture
+def tracked():
+    pending_requests.requests.clear()
+    pending_requests.free = [[None, 0, 0, 0] for _ in range(pending_requests.capacity)]
+    yield pending_requests
+    pending_requests.requests.clear()
+    pending_requests.free = [[None, 0, 0, 0] for _ in range(pending_requests.capacity)]
+
+
+def test_client_send_message_is_flat(tracked):
+    client = WebsocketClient()
+    client.ws = websocket()
+    messages = iter(MESSAGES * ((SENDS + WARMUP) // len(MESSAGES) + 1))
+    records = set(map(id, tracked.free))
+
+    def send():
+        client.send_message(next(messages))
+
+    assert allocated(send) <= slack()
+    # the last request is pending, the ones it superseded went back to the pool, no record was allocated for a send
+    assert len(tracked.requests) == 1
+    assert len(tracked.free) == tracked.capacity - 1
+    assert set(map(id, tracked.free)) | set(map(id, tracked.requests.values())) == records
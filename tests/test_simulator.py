@@ -0,0 +1,66 @@
+"""
+virtual devices of the simulator run their own copy of the app modules against the stand-in server
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+from sim.device import VirtualDevice
+from sim.server import StandInServer
+from sim.simulate import device_config
+
+
+@pytest.fixture(scope='module')
+def server():
+    server = StandInServer(command_interval=0.2)
+    started = threading.Event()
+    threading.Thread(target=asyncio.run, args=(server.serve(started),), daemon=True).start()
+    started.wait()
+    return server
+
+
+def boot(tmp_path, server, index, **options):
+    config = device_config(index, server.port, options.get('binary', False), None, options.get('asyncio', False))
+    uname = ('esp32', config['CLIENT_UID'], 'sim', 'sim', 'test')
+    return VirtualDevice(str(tmp_path / config['CLIENT_UID']), config, uname).boot()
+
+
+def test_devices_have_their_own_modules(tmp_path, server):
+    stand_in = sys.modules['app.extensions']
+    first = boot(tmp_path, server, 0)
+    second = boot(tmp_path, server, 1)
+
+    assert sys.modules['app.extensions'] is stand_in
+    assert first.extensions is not second.extensions
+    assert first.extensions.config.CLIENT_UID == 'sim-00000'
+    assert second.extensions.config.CLIENT_UID == 'sim-00001'
+    # every device has its own simulated hardware behind app.hal
+    assert first.modules['app.hal'].network is first.modules['sim.hardware']
+    assert first.modules['sim.hardware'] is not second.modules['sim.hardware']
+    assert first.modules['app.websocket'].websocket_send_queue is first.extensions.websocket_send_queue
+    assert first.extensions.websocket.open and second.extensions.websocket.open
+    # the flash files are kept in the directory of the device
+    assert os.path.exists(str(tmp_path / 'sim-00000' / 'journal.bin'))
+    assert os.path.exists(str(tmp_path / 'sim-00001' / 'journal.bin'))
+
+
+@pytest.mark.parametrize('options', [{}, {'asyncio': True}, {'binary': True}])
+def test_main_loop_answers_the_commands(tmp_path, server, options):
+    answered = len(server.rtts)
+    devices = [boot(tmp_path, server, index, **options) for index in range(2)]
+    for device in devices:
+        device.run()
+    server.sending_commands = True
+
+    deadline = time.time() + 10
+    while len(server.rtts) < answered + 4 and time.time() < deadline:
+        time.sleep(0.05)
+
+    assert len(server.rtts) >= answered + 4
+    for device in devices:
+        assert device.thread.is_alive()
+        assert device.extensions.websocket.reconnects == 0
@@ -0,0 +1,119 @@
+"""
+reconnect timing of the websocket client: the backoff with a seeded random and connection attempts against the
+stand-in server of the simulator
+"""
+import asyncio
+import socket
+import threading
+
+import pytest
+import urandom
+
+from app.websocket_client import WebsocketClient, STATE_DISCONNECTED, STATE_OPEN
+from sim.server import StandInServer
+
+MIN_DELAY = 1000
+MAX_DELAY = 60000
+
+
+@pytest.fixture(scope='module')
+def server():
+    server = StandInServer(command_interval=3600)
+    started = threading.Event()
+    threading.Thread(target=asyncio.run, args=(server.serve(started),), daemon=True).start()
+    started.wait()
+    return server
+
+
+@pytest.fixture
+def client(config):
+    config.data.update({
+        'WEBSOCKET_TLS': False,
+        'WEBSOCKET_RECONNECT_MIN_DELAY': MIN_DELAY,
+        'WEBSOCKET_RECONNECT_MAX_DELAY': MAX_DELAY,
+        'WEBSOCKET_CONNECT_TIMEOUT': 2,
+    })
+    client = WebsocketClient()
+    yield client
+    if client.open:
+        client.ws._close()
+
+
+def unused_port():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+def test_first_retry_is_immediate_up_to_the_min_delay(client):
+    urandom.seed(7)
+    client.attempts = 1
+    delays = [client.next_delay() for _ in range(1000)]
+    assert all(0 <= delay < MIN_DELAY for delay in delays)
+
+
+def test_ceiling_doubles_per_attempt(client):
+    urandom.seed(7)
+    for attempts in range(1, 7):
+        client.attempts = attempts
+        ceiling = MIN_DELAY << (attempts - 1)
+        delays = [client.next_delay() for _ in range(1000)]
+        assert all(0 <= delay < ceiling for delay in delays)
+        # full jitter spreads the delays over the whole range
+        assert min(delays) < ceiling // 10
+        assert max(delays) > ceiling * 9 // 10
+
+
+def test_ceiling_is_capped(client):
+    urandom.seed(7)
+    client.attempts = 1000
+    delays = [client.next_delay() for _ in range(1000)]
+    assert all(0 <= delay < MAX_DELAY for delay in delays)
+    assert max(delays) > MAX_DELAY * 9 // 10
+
+
+def test_seeded_delays_repeat(client):
+    client.attempts = 5
+    urandom.seed(42)
+    first = [client.next_delay() for _ in range(10)]
+    urandom.seed(42)
+    assert [client.next_delay() for _ in range(10)] == first
+
+
+def test_failed_attempts_grow_the_backoff(client, config):
+    config.data['WEBSOCKET_PORT'] = unused_port()
+
+    assert not client.try_connect()
+    assert not client.try_connect()
+
+    assert client.attempts == 2
+    assert client.state == STATE_DISCONNECTED
+    assert 'connect' not in client.timings
+
+
+def test_success_resets_the_backoff(client, config, server):
+    config.data['WEBSOCKET_PORT'] = unused_port()
+    for _ in range(3):
+        client.try_connect()
+    assert client.attempts == 3
+
+    config.data['WEBSOCKET_PORT'] = server.port
+    assert client.try_connect()
+
+    assert client.attempts == 0
+    assert client.state == STATE_OPEN
+    assert set(client.timings) >= {'resolve', 'connect', 'handshake'}
+    urandom.seed(7)
+    assert all(client.next_delay() < MIN_DELAY for _ in range(100))
+
+
+def test_dropped_connection_reconnects_immediately(client, config, server):
+    config.data['WEBSOCKET_PORT'] = server.port
+    assert client.try_connect()
+
+    client.drop()
+
+    assert not client.open
+    assert client.attempts == 0
+    assert client.try_connect()
+    assert client.open
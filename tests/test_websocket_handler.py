@@ -0,0 +1,193 @@
+"""
+inbound messages through app.websocket_handler, the replies are taken from the send queue of the stand-in extensions
+"""
+import hashlib
+import struct
+
+import pytest
+
+from app import websocket_handler
+from app.extensions import websocket_send_queue, metrics, device, pending_requests, telemetry
+from app.firmware import FirmwareReceiver, CHUNK_MARKER
+from app.message_codec import encode_json, encode_binary, new_uid
+from app.websocket_handler import handle_websocket_message, handle_websocket_messages
+
+
+def queued():
+    messages = []
+    while len(websocket_send_queue):
+        messages.append(websocket_send_queue.pop())
+    return messages
+
+
+def request(message_type, data, uid='0123456789abcdef'):
+    return encode_json((message_type, 'request', uid, data))
+
+
+def replies(message_type):
+    return [message for message in queued() if message[0] == message_type and message[1] == 'reply']
+
+
+class RecordingWebsocket:
+    def __init__(self):
+        self.sent = []
+        self.flushed = False
+
+    def send_message(self, message, flush=True):
+        self.sent.append(message)
+
+    def flush(self):
+        self.flushed = True
+
+
+@pytest.fixture(autouse=True)
+def empty_queue():
+    queued()
+    yield
+    queued()
+
+
+@pytest.fixture
+def lock(monkeypatch):
+    """
+    the default resource of the device, without the timer which ends the lock pulse
+    """
+    monkeypatch.setattr(device, 'start_pulse', lambda resource: None)
+    resource = device.default_resource
+    yield resource
+    resource.lock_status = 'closed'
+    resource.lock_open_pin.value(0)
+    resource.lock_close_pin.value(0)
+
+
+def test_every_handler_is_covered():
+    # a new handler needs a test below
+    assert set(websocket_handler.handlers.handlers['request']) == {
+        'RemoteChangeResourceStatus', 'LinkQuality', 'Reboot', 'FirmwareUpdate', 'Telemetry'
+    }
+
+
+def test_remote_change_resource_status_opens_the_lock(lock):
+    handle_websocket_message(request('RemoteChangeResourceStatus', {'status': 'open'}, 'command-1'))
+
+    messages = queued()
+    assert ('RemoteChangeResourceStatus', 'reply', 'command-1', {}) in messages
+    assert [message[3] for message in messages if message[0] == 'ResourceStatusChange'] == [
+        {'status': 'opening', 'resource_uid': lock.uid}
+    ]
+    assert lock.lock_status == 'opening'
+    assert lock.lock_open_pin.value() == 1
+
+
+def test_remote_change_resource_status_of_an_unknown_resource(lock):
+    handle_websocket_message(request('RemoteChangeResourceStatus', {'status': 'open', 'resource_uid': 'nope'}))
+
+    assert [reply[3] for reply in replies('RemoteChangeResourceStatus')] == [{'error': 'unknown resource'}]
+    assert lock.lock_status == 'closed'
+
+
+def test_repeated_request_gets_the_cached_reply(lock):
+    handle_websocket_message(request('RemoteChangeResourceStatus', {'status': 'open'}, 'command-2'))
+    queued()
+    lock.lock_status = 'open'
+
+    handle_websocket_message(request('RemoteChangeResourceStatus', {'status': 'close'}, 'command-2'))
+
+    assert queued() == [('RemoteChangeResourceStatus', 'reply', 'command-2', {})]
+    assert lock.lock_status == 'open'
+
+
+def test_link_quality():
+    handle_websocket_message(request('LinkQuality', {}))
+
+    reply, = replies('LinkQuality')
+    assert set(reply[3]) == {'heartbeat', 'requests'}
+    assert 'rtt_average' in reply[3]['heartbeat']
+
+
+def test_reboot_replies_before_the_reset(monkeypatch):
+    websocket = RecordingWebsocket()
+    calls = []
+    monkeypatch.setattr(websocket_handler, 'websocket', websocket)
+    monkeypatch.setattr(websocket_handler, 'sleep', lambda seconds: calls.append('sleep'))
+    monkeypatch.setattr(websocket_handler, 'reset', lambda: calls.append('reset'))
+
+    handle_websocket_message(request('Reboot', {}, 'reboot-1'))
+
+    assert websocket.sent == [('Reboot', 'reply', 'reboot-1', {})]
+    assert websocket.flushed
+    assert calls == ['sleep', 'reset']
+
+
+def test_firmware_update_over_the_websocket(monkeypatch, tmp_path):
+    firmware = FirmwareReceiver(directory=str(tmp_path / 'next'))
+    monkeypatch.setattr(websocket_handler, 'firmware', firmware)
+    content = b'print(1)\n'
+    files = [{'path': 'main.py', 'size': len(content), 'sha256': hashlib.sha256(content).hexdigest()}]
+
+    handle_websocket_message(request('FirmwareUpdate', {'version': 'v2', 'files': files}))
+    reply, = replies('FirmwareUpdate')
+    assert reply[3]['file'] == 0 and reply[3]['offset'] == 0
+
+    handle_websocket_message(struct.pack('!BBI', CHUNK_MARKER, 0, 0) + content)
+    progress, = [message[3] for message in queued() if message[0] == 'FirmwareProgress']
+    assert progress['done']
+    assert (tmp_path / 'next' / 'main.py').read_bytes() == content
+
+
+def test_firmware_update_from_github(monkeypatch):
+    versions = []
+    monkeypatch.setattr(websocket_handler, 'update', versions.append)
+
+    handle_websocket_message(request('FirmwareUpdate', {'version': 'v3'}))
+
+    assert versions == ['v3']
+    assert [reply[3] for reply in replies('FirmwareUpdate')] == [{}]
+
+
+def test_telemetry_sets_the_interval(monkeypatch):
+    monkeypatch.setattr(telemetry, 'interval', telemetry.interval)
+
+    handle_websocket_message(request('Telemetry', {'interval': 60}))
+
+    assert telemetry.interval == 60000
+    reply, = replies('Telemetry')
+    assert set(reply[3]) == set(metrics.metrics)
+
+
+def test_unknown_type_gets_an_error_reply():
+    handle_websocket_message(request('NoSuchType', {}, 'unknown-1'))
+
+    assert queued() == [('NoSuchType', 'reply', 'unknown-1', {'error': 'unknown message type'})]
+
+
+@pytest.mark.parametrize('encode', [encode_json, encode_binary])
+def test_reply_acknowledges_the_pending_request(encode):
+    uid = new_uid()
+    pending_requests.sent(('DoorStatus', 'request', uid, {'status': True}))
+    assert uid in pending_requests.requests
+
+    handle_websocket_message(encode(('DoorStatus', 'reply', uid, {})))
+
+    assert uid not in pending_requests.requests
+    assert queued() == []
+
+
+def test_bad_message_does_not_drop_the_rest_of_the_batch():
+    exceptions = metrics.counter('exceptions')
+    before = exceptions.value
+    batch = [
+        encode_json(('Telemetry', 'request', 'first', {})),
+        '{"type": "Telemetry", "state": "request"',
+        encode_json(('Telemetry', 'request', 'third', {})),
+    ]
+
+    handle_websocket_messages(batch)
+
+    messages = queued()
+    assert [(message[0], message[1], message[2]) for message in messages if message[0] == 'Telemetry'] == [
+        ('Telemetry', 'reply', 'first'),
+        ('Telemetry', 'reply', 'third'),
+    ]
+    assert [message[0] for message in messages].count('Exception') == 1
+    assert exceptions.value == before + 1
@@ -7,13 +7,21 @@ if ! ampy -p $PORT ls | grep -q '/app'; then
   ampy -p $PORT mkdir /app
 fi
 
-# copy all files
+# copy all files, precompiled files from ./build.sh are preferred
 echo "put file boot.py"
 ampy -p $PORT put boot.py boot.py
 for file in app/*.py; do
   if [ "$file" == "app/config_dist.py" ]; then
     continue
   fi
+  name=$(basename $file .py)
+  if [ -f "dist/app/$name.mpy" ]; then
+    # micropython would import the .py before the .mpy
+    ampy -p $PORT rm $file 2> /dev/null
+    echo "put file dist/app/$name.mpy"
+    ampy -p $PORT put dist/app/$name.mpy app/$name.mpy
+    continue
+  fi
   echo "put file $file"
   ampy -p $PORT put $file $file
 done